@@ -0,0 +1,286 @@
+import asyncio
+import datetime
+import functools
+import threading
+import contextlib
+import weakref
+from typing import Callable
+
+import pandas as pd
+
+from . import usequity
+from .local import TAQFiles
+from .session import Session, cancel_query
+from .usequity import Connectable
+from .transfer import as_output
+from .utils import compact_bars
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+asyncio versions of the taqy.usequity query functions.
+
+The blocking database calls run on the event loop's default executor, but no more of them
+at once than the connection can serve: one for a plain wrds Connection, or `pool_size`
+for a Session.  Further requests wait their turn without occupying a thread, so hundreds
+may be outstanding.  Cancelling a request, or its timing out, cancels its query on the
+server as well.
+"""
+
+# Keyed by connection, and for semaphores by event loop then connection
+_MAX_CONCURRENCY = weakref.WeakKeyDictionary()
+_SEMAPHORES = weakref.WeakKeyDictionary()
+
+
+def set_max_concurrency(wrds_db: Connectable | None, max_concurrency: int):
+    """
+    Allow up to `max_concurrency` queries at once on `wrds_db`.  Only raise this above the
+    default for a Session whose pool may grow, or lower it to leave connections free for
+    synchronous callers.
+    """
+    assert max_concurrency >= 1
+    _MAX_CONCURRENCY[usequity.get_wrds_connection(wrds_db)] = max_concurrency
+
+
+def _semaphore(db: Connectable) -> asyncio.Semaphore:
+    # Semaphores belong to a single event loop, so keep one per loop
+    loop = asyncio.get_running_loop()
+    per_loop = _SEMAPHORES.setdefault(loop, weakref.WeakKeyDictionary())
+    if db not in per_loop:
+        default = db.pool_size if isinstance(db, Session) else 1
+        per_loop[db] = asyncio.Semaphore(_MAX_CONCURRENCY.get(db, default))
+    return per_loop[db]
+
+
+def _cancel(db: Connectable, thread_id: int):
+    if isinstance(db, Session):
+        db.cancel(thread_id)
+    elif not isinstance(db, TAQFiles):
+        cancel_query(db)
+    # Bars from TAQFiles have no server query to cancel, and run on to the end
+
+
+async def _in_thread(db: Connectable, fn: Callable, timeout: float | None):
+    """Run fn() on the default executor, once db has capacity for it"""
+    loop = asyncio.get_running_loop()
+    lock = threading.Lock()
+    thread_id = None
+    cancelled = False
+
+    def run():
+        nonlocal thread_id
+        with lock:
+            # Given up on while still waiting for a thread, so never to be run
+            if cancelled:
+                return None
+            thread_id = threading.get_ident()
+        return fn()
+
+    async with _semaphore(db):
+        future = loop.run_in_executor(None, run)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            with lock:
+                cancelled = True
+                started = thread_id
+            if started is not None:
+                _cancel(db, started)
+                # Keep our place until the thread has let go of its connection
+                with contextlib.suppress(Exception):
+                    await future
+            raise
+
+
+async def _gather_in_order(coros) -> list:
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def cached_sql(
+    sql: str,
+    wrds_db: Connectable | None = None,
+    timeout: float | None = None,
+    output: str = "pandas",
+) -> pd.DataFrame:
+    db = usequity.get_wrds_connection(wrds_db)
+    return await _in_thread(
+        db, functools.partial(usequity.cached_sql, db, sql, output=output), timeout
+    )
+
+
+async def taq_trade_bars_on_date(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    group_by_exchange: bool = False,
+    restrict_to_exchanges: tuple[str] | None = None,
+    include_first_and_last: bool = False,
+    wrds_db: Connectable | None = None,
+    timeout: float | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    first_last_method: str = "windows",
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    As taqy.usequity.taq_trade_bars_on_date(), raising asyncio.TimeoutError if the bars take
+    longer than `timeout` seconds
+    """
+    db = usequity.get_wrds_connection(wrds_db)
+    fn = functools.partial(
+        usequity.taq_trade_bars_on_date,
+        tickers,
+        date,
+        bar_minutes,
+        group_by_exchange,
+        restrict_to_exchanges,
+        include_first_and_last=include_first_and_last,
+        wrds_db=db,
+        bar_seconds=bar_seconds,
+        session=session,
+        columns=columns,
+        compact=compact,
+        output=output,
+        statistics=statistics,
+        quantiles=quantiles,
+        first_last_method=first_last_method,
+    )
+    return await _in_thread(db, fn, timeout)
+
+
+async def taq_nbbo_bars_on_date(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    wrds_db: Connectable | None = None,
+    timeout: float | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    quote_statistics: bool = False,
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    As taqy.usequity.taq_nbbo_bars_on_date(), raising asyncio.TimeoutError if the bars take
+    longer than `timeout` seconds
+    """
+    db = usequity.get_wrds_connection(wrds_db)
+    fn = functools.partial(
+        usequity.taq_nbbo_bars_on_date,
+        tickers,
+        date,
+        bar_minutes,
+        wrds_db=db,
+        bar_seconds=bar_seconds,
+        session=session,
+        columns=columns,
+        compact=compact,
+        output=output,
+        quote_statistics=quote_statistics,
+    )
+    return await _in_thread(db, fn, timeout)
+
+
+async def taq_trade_bars_between(
+    tickers: list[str] | str,
+    start: datetime.date,
+    end: datetime.date,
+    bar_minutes: int = 30,
+    group_by_exchange: bool = False,
+    restrict_to_exchanges: tuple[str] | None = None,
+    include_first_and_last: bool = False,
+    wrds_db: Connectable | None = None,
+    timeout: float | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    first_last_method: str = "windows",
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    As taqy.usequity.taq_trade_bars_between(), with `timeout` applying to each day
+    """
+    db = usequity.get_wrds_connection(wrds_db)
+    dates = await _in_thread(
+        db,
+        functools.partial(usequity.taq_trading_dates, start, end, "ctm", db),
+        timeout,
+    )
+    days = await _gather_in_order(
+        taq_trade_bars_on_date(
+            tickers,
+            date,
+            bar_minutes,
+            group_by_exchange,
+            restrict_to_exchanges,
+            include_first_and_last=include_first_and_last,
+            wrds_db=db,
+            timeout=timeout,
+            bar_seconds=bar_seconds,
+            session=session,
+            columns=columns,
+            statistics=statistics,
+            quantiles=quantiles,
+            first_last_method=first_last_method,
+        )
+        for date in dates
+    )
+    bars = pd.concat(days, ignore_index=True) if days else pd.DataFrame()
+    return as_output(compact_bars(bars) if compact else bars, output)
+
+
+async def taq_nbbo_bars_between(
+    tickers: list[str] | str,
+    start: datetime.date,
+    end: datetime.date,
+    bar_minutes: int = 30,
+    wrds_db: Connectable | None = None,
+    timeout: float | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    quote_statistics: bool = False,
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    As taqy.usequity.taq_nbbo_bars_between(), with `timeout` applying to each day
+    """
+    db = usequity.get_wrds_connection(wrds_db)
+    dates = await _in_thread(
+        db,
+        functools.partial(usequity.taq_trading_dates, start, end, "complete_nbbo", db),
+        timeout,
+    )
+    days = await _gather_in_order(
+        taq_nbbo_bars_on_date(
+            tickers,
+            date,
+            bar_minutes,
+            wrds_db=db,
+            timeout=timeout,
+            bar_seconds=bar_seconds,
+            session=session,
+            columns=columns,
+            quote_statistics=quote_statistics,
+        )
+        for date in dates
+    )
+    bars = pd.concat(days, ignore_index=True) if days else pd.DataFrame()
+    return as_output(compact_bars(bars) if compact else bars, output)
@@ -0,0 +1,309 @@
+import os
+import sys
+import json
+import argparse
+import datetime
+import platform
+import subprocess
+from typing import Callable
+
+import pandas as pd
+
+from . import metrics, usequity
+from .cache import MemoryCache
+from .synthetic import LocalConnection, load_synthetic_day, synthetic_day
+from .usequity import Connectable
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Benchmarks of our queries and of what we do with their results, on synthetic TAQ tables in
+a PostgreSQL database of our own rather than on WRDS.
+
+Each variant of the bar queries is timed on days of synthetic data of several sizes, both
+as a whole and phase by phase as taqy.metrics reports them: the query itself, decoding
+results copied in bulk, parsing time columns and making timestamps.  Results are appended to a history file, and any
+timing well above its recent history on the same machine is flagged as a regression.
+
+Run as `python -m taqy.benchmark --help`.  Without a database URL, a throwaway server is
+started with pgserver, if installed.
+"""
+
+
+def _copied(variant):
+    """`variant`, with its results copied out in bulk rather than fetched row by row"""
+
+    def copied(tickers: list[str], date: datetime.date, db: Connectable):
+        previous = usequity.TRANSFER
+        usequity.set_transfer_method("copy")
+        try:
+            return variant(tickers, date, db)
+        finally:
+            usequity.set_transfer_method(previous)
+
+    return copied
+
+
+# Each variant, as a function of (tickers, date, wrds_db)
+VARIANTS: dict[str, Callable[[list[str], datetime.date, Connectable], pd.DataFrame]] = {
+    "trade": lambda tickers, date, db: usequity.taq_trade_bars_on_date(
+        tickers, date, 5, wrds_db=db
+    ),
+    "trade_cheap": lambda tickers, date, db: usequity.taq_trade_bars_on_date(
+        tickers, date, 5, statistics="cheap", wrds_db=db
+    ),
+    "trade_by_exchange": lambda tickers, date, db: usequity.taq_trade_bars_on_date(
+        tickers, date, 5, group_by_exchange=True, wrds_db=db
+    ),
+    "trade_first_last": lambda tickers, date, db: usequity.taq_trade_bars_on_date(
+        tickers, date, 5, include_first_and_last=True, wrds_db=db
+    ),
+    "trade_first_last_aggregates": lambda tickers, date, db: usequity.taq_trade_bars_on_date(
+        tickers,
+        date,
+        5,
+        include_first_and_last=True,
+        first_last_method="aggregates",
+        wrds_db=db,
+    ),
+    "trade_seconds": lambda tickers, date, db: usequity.taq_trade_bars_on_date(
+        tickers, date, bar_seconds=10, wrds_db=db
+    ),
+    "nbbo": lambda tickers, date, db: usequity.taq_nbbo_bars_on_date(
+        tickers, date, 5, wrds_db=db
+    ),
+    "trade_and_nbbo": lambda tickers, date, db: usequity.taq_bars_on_date(
+        tickers, date, 5, include_first_and_last=True, wrds_db=db
+    ),
+}
+# The same queries, to compare the ways of fetching their results
+for _variant in ("trade_first_last", "trade_seconds", "trade_and_nbbo"):
+    VARIANTS[f"{_variant}_copy"] = _copied(VARIANTS[_variant])
+
+# Average trades per second per ticker over regular hours, for each size of day
+SIZES = (0.1, 1.0, 5.0)
+
+PHASES = ("build_sql", "query", "decode", "parse_times", "timestamps")
+
+# Timings identifying what is being timed, as opposed to the results
+KEY_COLUMNS = ["host", "variant", "tickers", "trades_per_second", "phase"]
+
+
+def time_variant(
+    variant: Callable[[list[str], datetime.date, Connectable], pd.DataFrame],
+    tickers: list[str],
+    date: datetime.date,
+    db: Connectable,
+    repeat: int = 3,
+) -> dict[str, float]:
+    """
+    Seconds taken by the fastest of `repeat` uncached runs of `variant`, in total and by
+    phase, after one more run to warm up the database and learn the table layouts.  Runs
+    use a memory cache of their own, leaving CACHED_QUERIES as they found it.
+    """
+    disk_cache, memory_cache = usequity.DISK_CACHE, usequity.CACHED_QUERIES
+    usequity.DISK_CACHE = None
+    fastest = None
+    try:
+        for attempt in range(repeat + 1):
+            usequity.CACHED_QUERIES = MemoryCache()
+            aggregator = metrics.MetricsAggregator(by=())
+            metrics.add_hook(aggregator)
+            try:
+                variant(tickers, date, db)
+            finally:
+                metrics.remove_hook(aggregator)
+            seconds = aggregator.summary()["seconds"].groupby(level="name").sum()
+            timings = {
+                "total": seconds["call"],
+                **{phase: seconds.get(phase, 0.0) for phase in PHASES},
+            }
+            if attempt and (fastest is None or timings["total"] < fastest["total"]):
+                fastest = timings
+    finally:
+        usequity.DISK_CACHE, usequity.CACHED_QUERIES = disk_cache, memory_cache
+    return fastest
+
+
+def run_benchmarks(
+    db: Connectable,
+    sizes: tuple[float, ...] = SIZES,
+    tickers: int = 10,
+    quotes_per_trade: float = 10.0,
+    variants: list[str] | None = None,
+    repeat: int = 3,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Time each of `variants` (by default all VARIANTS) on a synthetic day of each size in
+    `db`, which must be a database we can write to.  Each size gets its own day in
+    2024, loaded afresh.  One row per variant, size and phase.
+    """
+    rows = []
+    for i, trades_per_second in enumerate(sizes):
+        date = datetime.date(2024, 1, 2) + datetime.timedelta(days=i)
+        ctm, nbbo = synthetic_day(
+            date,
+            tickers,
+            trades_per_second=trades_per_second,
+            quotes_per_second=trades_per_second * quotes_per_trade,
+            seed=seed,
+        )
+        load_synthetic_day(db, ctm, nbbo)
+        names = sorted(set(ctm["sym_root"]))
+        for variant in variants or VARIANTS:
+            timings = time_variant(VARIANTS[variant], names, date, db, repeat)
+            for phase, seconds in timings.items():
+                rows.append(
+                    {
+                        "variant": variant,
+                        "tickers": tickers,
+                        "trades_per_second": trades_per_second,
+                        "trades": len(ctm),
+                        "quotes": len(nbbo),
+                        "phase": phase,
+                        "seconds": seconds,
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_history(results: pd.DataFrame, path: str) -> pd.DataFrame:
+    """
+    Add `results` to the JSON lines history file at `path`, labeled with the time, the
+    machine and the git commit of taqy, if known.  Returns the labeled results.
+    """
+    results = results.assign(
+        run=datetime.datetime.now().isoformat(timespec="seconds"),
+        host=platform.node(),
+        commit=_commit(),
+    )
+    with open(path, "a") as f:
+        for record in results.to_dict(orient="records"):
+            f.write(json.dumps(record) + "\n")
+    return results
+
+
+def read_history(path: str) -> pd.DataFrame:
+    if not os.path.isfile(path):
+        return pd.DataFrame(columns=KEY_COLUMNS + ["run", "seconds"])
+    return pd.read_json(path, lines=True, dtype={"run": str, "commit": str})
+
+
+def find_regressions(
+    results: pd.DataFrame,
+    history: pd.DataFrame,
+    threshold: float = 1.25,
+    window: int = 5,
+    min_seconds: float = 0.01,
+) -> pd.DataFrame:
+    """
+    Timings in `results` more than `threshold` times the median of the last `window` runs
+    in `history` of the same variant, size and phase on the same machine, alongside that
+    `baseline`.  So that noise in the quickest phases is not flagged, regressions must
+    also be slower by at least `min_seconds`.  Timings with no history never are.
+    """
+    previous = history[~history["run"].isin(results["run"].unique())]
+    recent = previous[previous["run"].isin(sorted(previous["run"].unique())[-window:])]
+    baseline = recent.groupby(KEY_COLUMNS)["seconds"].median().rename("baseline")
+    compared = results.join(baseline, on=KEY_COLUMNS, how="inner")
+    compared["ratio"] = compared["seconds"] / compared["baseline"]
+    slower = (compared["ratio"] > threshold) & (
+        compared["seconds"] - compared["baseline"] >= min_seconds
+    )
+    return compared[slower].reset_index(drop=True)
+
+
+def _local_server_url(directory: str):
+    """A URL for, and the handle keeping alive, a PostgreSQL server run by pgserver"""
+    try:
+        import pgserver
+    except ImportError:
+        raise ImportError(
+            "Give a database URL, or install pgserver to have one started for you"
+        )
+    server = pgserver.get_server(directory, cleanup_mode="stop")
+    return server.get_uri(), server
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m taqy.benchmark",
+        description="Time taqy's queries on synthetic TAQ tables in a local database",
+    )
+    parser.add_argument(
+        "--db-url",
+        default=os.environ.get("TAQY_BENCHMARK_DB_URL"),
+        help="SQLAlchemy URL of a PostgreSQL database to fill with synthetic tables"
+        " (default $TAQY_BENCHMARK_DB_URL, else a pgserver one)",
+    )
+    parser.add_argument(
+        "--pgdata",
+        default=os.path.join(os.path.expanduser("~"), ".cache", "taqy", "benchmark"),
+        help="Data directory of the pgserver database",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=lambda s: tuple(float(size) for size in s.split(",")),
+        default=SIZES,
+        help="Comma separated trades per second per ticker of each day",
+    )
+    parser.add_argument("--tickers", type=int, default=10)
+    parser.add_argument("--quotes-per-trade", type=float, default=10.0)
+    parser.add_argument("--variants", nargs="*", choices=list(VARIANTS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--history", default="taqy_benchmarks.jsonl")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--window", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    server = None  # Kept until we are done, as the server stops when it goes
+    url = args.db_url
+    if url is None:
+        url, server = _local_server_url(args.pgdata)
+    db = LocalConnection(url)
+    try:
+        results = run_benchmarks(
+            db,
+            sizes=args.sizes,
+            tickers=args.tickers,
+            quotes_per_trade=args.quotes_per_trade,
+            variants=args.variants,
+            repeat=args.repeat,
+        )
+    finally:
+        db.close()
+
+    results = append_history(results, args.history)
+    timings = results.pivot_table(
+        index=["variant", "trades_per_second"], columns="phase", values="seconds"
+    )
+    print(timings[["total", *PHASES]].round(4).to_string())
+    regressions = find_regressions(
+        results, read_history(args.history), args.threshold, args.window
+    )
+    if len(regressions):
+        print(f"\nSlower than the median of the last {args.window} runs:")
+        columns = ["variant", "trades_per_second", "phase", "seconds", "baseline"]
+        print(regressions[columns].to_string())
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,406 @@
+import os
+import json
+import hashlib
+import threading
+import dataclasses
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Results are then only ever pandas DataFrames
+    pq = None
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Caching of query results.  Results are addressed by a hash of the SQL that produced them,
+so any change to a generated query naturally misses the cache.  Changes to how we parse what
+comes back from WRDS do not alter the SQL, so those are handled with CACHE_VERSION.
+"""
+
+# Bump this whenever SQL generation or the post-query parsing in cached_sql changes in a way
+# that would make previously stored results wrong
+CACHE_VERSION = "1"
+
+DEFAULT_MEMORY_CACHE_BYTES = 1024**3
+DEFAULT_DISK_CACHE_BYTES = 2 * 1024**3
+
+
+def default_cache_dir() -> str:
+    return os.environ.get(
+        "TAQY_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "taqy")
+    )
+
+
+def sql_hash(sql: str) -> str:
+    return hashlib.md5(sql.encode("utf-8")).hexdigest()
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    writes: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def result_bytes(result) -> int:
+    """The memory taken by a pandas DataFrame or an Arrow table"""
+    if isinstance(result, pd.DataFrame):
+        return frame_bytes(result)
+    return result.nbytes
+
+
+def freeze_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mark the buffers behind `df` read-only, so that in-place writes to any frame sharing
+    them raise rather than silently altering cached data.  Replacing or deleting whole
+    columns, as the bar functions do, remains fine.
+    """
+    # No public API reaches the arrays behind a frame's blocks, rather than views of
+    # them, so this uses the private one of the pandas 2 releases pyproject.toml allows,
+    # and tests/unit/test_memory_cache.py checks that it freezes every kind of column
+    for arr in df._mgr.arrays:
+        # pandas revalidates string arrays in place whenever they are sliced, so those
+        # must stay writeable
+        if isinstance(arr, pd.arrays.StringArray):
+            continue
+        # Extension arrays (nullable ints and floats, strings, datetimes) wrap ndarrays
+        for buf in (
+            arr,
+            getattr(arr, "_data", None),
+            getattr(arr, "_mask", None),
+            getattr(arr, "_ndarray", None),
+        ):
+            if isinstance(buf, np.ndarray):
+                buf.flags.writeable = False
+    return df
+
+
+def _shallow_copy(result):
+    return result.copy(deep=False) if isinstance(result, pd.DataFrame) else result
+
+
+class MemoryCache:
+    """
+    In-process cache of query results with a byte budget and least-recently-used eviction.
+
+    Frames are stored without copying and handed out as shallow copies whose buffers are
+    read-only, so callers may add, replace or drop columns freely but must `.copy()` a
+    result before modifying its values in place.  Arrow tables, being immutable, are
+    stored and handed out as they are.
+
+    For backwards compatibility this also behaves enough like a dict for
+    `sql in CACHED_QUERIES`, `del CACHED_QUERIES[sql]` and `CACHED_QUERIES.clear()`.
+    """
+
+    def __init__(self, max_bytes: int | None = DEFAULT_MEMORY_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._frames: OrderedDict[str, tuple[pd.DataFrame, int]] = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.RLock()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._size_bytes
+
+    @property
+    def hit_rate(self) -> float:
+        return self.stats.hit_rate
+
+    def get(self, sql: str) -> pd.DataFrame | None:
+        with self._lock:
+            entry = self._frames.get(sql)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            self._frames.move_to_end(sql)
+            self.stats.hits += 1
+        return _shallow_copy(entry[0])
+
+    def put(self, sql: str, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Cache `df`, which the caller should no longer modify in place, and return a
+        shallow copy of it for the caller to use instead
+        """
+        nbytes = result_bytes(df)
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return df  # Could never fit, so don't flush everything else trying
+        if isinstance(df, pd.DataFrame):
+            freeze_frame(df)
+        with self._lock:
+            if sql in self._frames:
+                self._size_bytes -= self._frames.pop(sql)[1]
+            self._frames[sql] = (df, nbytes)
+            self._size_bytes += nbytes
+            self.stats.writes += 1
+            if self.max_bytes is not None:
+                self.evict(self.max_bytes)
+        return _shallow_copy(df)
+
+    def evict(self, max_bytes: int):
+        with self._lock:
+            while self._frames and self._size_bytes > max_bytes:
+                _, (_, nbytes) = self._frames.popitem(last=False)
+                self._size_bytes -= nbytes
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._size_bytes = 0
+
+    def __contains__(self, sql: str) -> bool:
+        return sql in self._frames
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def __getitem__(self, sql: str) -> pd.DataFrame:
+        df = self.get(sql)
+        if df is None:
+            raise KeyError(sql)
+        return df
+
+    def __setitem__(self, sql: str, df: pd.DataFrame):
+        self.put(sql, df)
+
+    def __delitem__(self, sql: str):
+        with self._lock:
+            self._size_bytes -= self._frames.pop(sql)[1]
+
+
+def _read_result(path: str):
+    if pq is not None and pq.read_schema(path).pandas_metadata is None:
+        return pq.read_table(path)  # As written from an Arrow table
+    return pd.read_parquet(path)
+
+
+class ParquetCache:
+    """
+    Persistent cache of query results, one Parquet file per query, living under
+    `directory/v{version}/`.  Entries written by other cache versions are never read,
+    and are the first to go when the byte budget is exceeded.
+
+    Least-recently-used eviction is by file modification time, which we refresh on
+    every hit, so several processes may safely share one directory.
+
+    The sizes of the files are walked once, then kept as a running total, so that writes
+    need not walk the whole directory until they take it over budget.  What other
+    processes write is only counted from the next such walk.
+
+    Arrow tables are written as they are, and read back as Arrow tables, which files
+    written from pandas, having pandas metadata, are not.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        max_bytes: int | None = DEFAULT_DISK_CACHE_BYTES,
+        version: str = CACHE_VERSION,
+    ):
+        # Fail early, rather than on first write, if no parquet engine is installed
+        pd.io.parquet.get_engine("auto")
+        self.directory = os.path.abspath(directory or default_cache_dir())
+        self.max_bytes = max_bytes
+        self.version = version
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        # Sizes of the files of this version by path, and the total of all versions, once
+        # walked
+        self._sizes: dict[str, int] | None = None
+        self._size_bytes = 0
+        os.makedirs(self._version_dir, exist_ok=True)
+
+    @property
+    def _version_dir(self) -> str:
+        return os.path.join(self.directory, f"v{self.version}")
+
+    def path_for(self, sql: str) -> str:
+        return os.path.join(self._version_dir, f"{sql_hash(sql)}.parquet")
+
+    def __contains__(self, sql: str) -> bool:
+        return os.path.isfile(self.path_for(sql))
+
+    def get(self, sql: str):
+        path = self.path_for(sql)
+        try:
+            df = _read_result(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.stats.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # Evicted by someone else since we read it, which is harmless
+        with self._lock:
+            self.stats.hits += 1
+        return df
+
+    def put(self, sql: str, df):
+        path = self.path_for(sql)
+        # Write then rename so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if isinstance(df, pd.DataFrame):
+            df.to_parquet(tmp_path, index=False)
+        else:
+            pq.write_table(df, tmp_path)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self.stats.writes += 1
+            sizes = self._tally()
+            self._size_bytes += size - sizes.get(path, 0)
+            sizes[path] = size
+            over_budget = (
+                self.max_bytes is not None and self._size_bytes > self.max_bytes
+            )
+        if over_budget:
+            self.evict(self.max_bytes)
+
+    def _entries(self) -> list[tuple[bool, float, int, str]]:
+        """(is current version, mtime, size, path) for every cached file"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            current = root == self._version_dir
+            for fname in files:
+                if not fname.endswith(".parquet"):
+                    continue
+                path = os.path.join(root, fname)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((current, st.st_mtime, st.st_size, path))
+        return entries
+
+    def _tally(self) -> dict[str, int]:
+        """The sizes of this version's files, walking the directory the first time only"""
+        if self._sizes is None:
+            self._recount(self._entries())
+        return self._sizes
+
+    def _recount(self, entries: list[tuple[bool, float, int, str]]):
+        self._sizes = {path: size for current, _, size, path in entries if current}
+        self._size_bytes = sum(e[2] for e in entries)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            self._tally()
+            return self._size_bytes
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._tally())
+
+    def evict(self, max_bytes: int):
+        """Remove stale-version entries, then least recently used ones, until under max_bytes"""
+        entries = sorted(self._entries())
+        total = sum(e[2] for e in entries)
+        removed = set()
+        for current, _, size, path in entries:
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.add(path)
+            with self._lock:
+                if current:
+                    self.stats.evictions += 1
+                else:
+                    self.stats.invalidations += 1
+        with self._lock:
+            self._recount([e for e in entries if e[3] not in removed])
+
+    def clear(self):
+        self.evict(0)
+
+
+class SchemaCache:
+    """
+    Column names of database tables, keyed by (library, table).  Table layouts in WRDS do not
+    change once published, so entries never expire.  When given a directory, each library's
+    entries are kept there in a JSON file, loaded on first use.
+    """
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory
+        self.stats = CacheStats()
+        self._libraries: dict[str, dict[str, frozenset[str]]] = {}
+        self._lock = threading.RLock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, library: str) -> str:
+        return os.path.join(self.directory, f"{library}.json")
+
+    def _library(self, library: str) -> dict[str, frozenset[str]]:
+        with self._lock:
+            if library not in self._libraries:
+                tables = {}
+                if self.directory is not None:
+                    try:
+                        with open(self._path(library)) as f:
+                            tables = {t: frozenset(c) for t, c in json.load(f).items()}
+                    except FileNotFoundError:
+                        pass
+                self._libraries[library] = tables
+            return self._libraries[library]
+
+    def _save(self, library: str):
+        if self.directory is None:
+            return
+        tables = {t: sorted(c) for t, c in self._library(library).items()}
+        tmp_path = f"{self._path(library)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(tables, f)
+        os.replace(tmp_path, self._path(library))
+
+    def get(self, library: str, table: str) -> frozenset[str] | None:
+        with self._lock:
+            columns = self._library(library).get(table)
+            if columns is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+            return columns
+
+    def put(self, library: str, table: str, columns):
+        self.update(library, {table: columns})
+
+    def update(self, library: str, tables: dict):
+        """Record the columns of many tables in `library` at once"""
+        with self._lock:
+            self._library(library).update(
+                {table: frozenset(columns) for table, columns in tables.items()}
+            )
+            self.stats.writes += len(tables)
+            self._save(library)
+
+    def clear(self):
+        with self._lock:
+            self._libraries.clear()
+            if self.directory is not None:
+                for fname in os.listdir(self.directory):
+                    if fname.endswith(".json"):
+                        os.remove(os.path.join(self.directory, fname))
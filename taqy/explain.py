@@ -0,0 +1,193 @@
+import json
+
+import numpy as np
+import pandas as pd
+import wrds
+
+from . import usequity
+from .session import Session
+from .usequity import Connectable
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Query plans for the generated SQL, as PostgreSQL's EXPLAIN reports them, flattened into
+one row per plan node so that a slow query can be picked apart, or plans compared before
+and after a change to the SQL templates.
+
+Each node is attributed to the CTE or subquery it computes.  PostgreSQL inlines CTEs used
+only once, and those whose SQL it can fold into the main query leave no trace in the plan,
+so their nodes count towards whatever consumed them.
+"""
+
+# EXPLAIN's name for each quantity, and ours
+_NODE_FIELDS = {
+    "Startup Cost": "startup_cost",
+    "Total Cost": "total_cost",
+    "Plan Rows": "plan_rows",
+    "Plan Width": "plan_width",
+    "Actual Rows": "actual_rows",
+    "Actual Loops": "actual_loops",
+    "Actual Total Time": "actual_total_time_ms",
+    "Sort Method": "sort_method",
+    "Sort Space Used": "sort_space_kb",
+    "Sort Space Type": "sort_space_type",
+}
+BUFFER_FIELDS = {
+    "Shared Hit Blocks": "shared_hit_blocks",
+    "Shared Read Blocks": "shared_read_blocks",
+    "Temp Read Blocks": "temp_read_blocks",
+    "Temp Written Blocks": "temp_written_blocks",
+}
+
+
+def explain_sql(
+    sql: str, wrds_db: Connectable | None = None, analyze: bool = False
+) -> pd.DataFrame:
+    """
+    The plan of `sql`, as from plan_nodes().  With `analyze`, the query is also run, under
+    EXPLAIN (ANALYZE, BUFFERS), so that actual row counts, times and buffer use are filled
+    in too, and the total planning and execution times land in the result's `attrs`.
+
+    Nothing is cached, and an analyzed query takes as long to explain as to run.
+    """
+    db = usequity.get_wrds_connection(wrds_db)
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    explain = f"EXPLAIN ({options}) {sql}"
+
+    if isinstance(db, Session):
+        with db.connection() as conn:
+            return plan_nodes(_run_explain(conn, explain))
+    return plan_nodes(_run_explain(db, explain))
+
+
+def _run_explain(db: wrds.sql.Connection, explain: str) -> dict:
+    # Not raw_sql(), since pandas would make a string of the JSON.  Nor text(), which
+    # would take the colons in our interval literals for bind parameters.
+    plan = db.connection.exec_driver_sql(explain).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]
+
+
+def plan_nodes(plan: dict) -> pd.DataFrame:
+    """
+    One row per node of an EXPLAIN (FORMAT JSON) plan, in the order EXPLAIN lists them,
+    with its `depth` in the tree and `parent` row, the `cte` it belongs to ("main" for the
+    outermost query), costs and row estimates, and when analyzed its actual rows, time
+    and buffer use.
+
+    PostgreSQL's times, costs and buffer counts include those of a node's children.  The
+    `self_` columns exclude them, so they add up to the query's totals.
+    """
+    rows = []
+
+    def visit(node: dict, depth: int, parent: int | None, cte: str):
+        subplan = node.get("Subplan Name", "")
+        if subplan.startswith("CTE "):
+            cte = subplan[len("CTE ") :]  # noqa: E203
+        elif node["Node Type"] == "Subquery Scan" and "Alias" in node:
+            cte = node["Alias"]
+
+        row = {
+            "depth": depth,
+            "parent": parent,
+            "cte": cte,
+            "node_type": node["Node Type"],
+            "strategy": node.get("Strategy"),
+            "relation": node.get("Relation Name"),
+            "cte_scanned": node.get("CTE Name"),
+            "init_plan": node.get("Parent Relationship") == "InitPlan",
+        }
+        for field, column in {**_NODE_FIELDS, **BUFFER_FIELDS}.items():
+            row[column] = node.get(field)
+        row["sort_key"] = ", ".join(node.get("Sort Key", [])) or None
+        rows.append(row)
+
+        index = len(rows) - 1
+        for child in node.get("Plans", []):
+            visit(child, depth + 1, index, cte)
+
+    visit(plan["Plan"], 0, None, "main")
+    nodes = pd.DataFrame(rows)
+    nodes["parent"] = nodes["parent"].astype("Int64")
+    for column in ["actual_rows", "actual_loops", "actual_total_time_ms"] + list(
+        BUFFER_FIELDS.values()
+    ):
+        nodes[column] = pd.to_numeric(nodes[column]).astype(float)
+
+    _exclude_children(nodes)
+    nodes.attrs["planning_time_ms"] = plan.get("Planning Time", np.nan)
+    nodes.attrs["execution_time_ms"] = plan.get("Execution Time", np.nan)
+    return nodes
+
+
+def _exclude_children(nodes: pd.DataFrame):
+    """Add the self_ columns to plan_nodes()"""
+    parents = nodes["parent"].tolist()
+    init_plans = nodes["init_plan"].tolist()
+    # Times are per loop
+    inclusive = {
+        "self_cost": nodes["total_cost"].to_numpy(dtype=float),
+        "self_time_ms": (
+            nodes["actual_total_time_ms"] * nodes["actual_loops"]
+        ).to_numpy(),
+        **{f"self_{c}": nodes[c].to_numpy() for c in BUFFER_FIELDS.values()},
+    }
+    # CTEs run as their scans pull rows from them, so their time and buffers are
+    # counted by those scans, the first to read each row paying for it, and not by the
+    # node they hang from.  Their costs, though, are counted by that node.
+    cte_roots = {
+        cte: i
+        for i, (cte, init_plan) in enumerate(zip(nodes["cte"], init_plans))
+        if init_plan
+    }
+    for column, values in inclusive.items():
+        own = values.copy()
+        for i, parent in enumerate(parents):
+            if not pd.isna(parent) and (column == "self_cost" or not init_plans[i]):
+                own[parent] -= values[i]
+        if column != "self_cost":
+            unclaimed = {cte: values[i] for cte, i in cte_roots.items()}
+            for i, cte in enumerate(nodes["cte_scanned"]):
+                if cte in unclaimed and not np.isnan(values[i]):
+                    claimed = min(values[i], unclaimed[cte])
+                    own[i] -= claimed
+                    unclaimed[cte] -= claimed
+        nodes[column] = own
+
+
+def cte_summary(nodes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Totals of plan_nodes() per CTE, in order of appearance: the estimated and, if analyzed,
+    actual rows it produces, its cost and time with those of its sorts and window
+    functions broken out, and its buffer use
+    """
+    nodes = nodes.assign(
+        sort_cost=nodes["self_cost"].where(nodes["node_type"].str.contains("Sort"), 0),
+        window_cost=nodes["self_cost"].where(nodes["node_type"] == "WindowAgg", 0),
+        sort_time_ms=nodes["self_time_ms"].where(
+            nodes["node_type"].str.contains("Sort"), 0
+        ),
+        window_time_ms=nodes["self_time_ms"].where(
+            nodes["node_type"] == "WindowAgg", 0
+        ),
+    )
+    # A CTE's output is that of its topmost node
+    tops = nodes.drop_duplicates("cte").set_index("cte")
+    totals = [
+        "self_cost",
+        "sort_cost",
+        "window_cost",
+        "self_time_ms",
+        "sort_time_ms",
+        "window_time_ms",
+    ] + [f"self_{c}" for c in BUFFER_FIELDS.values()]
+    summary = nodes.groupby("cte", sort=False)[totals].sum(min_count=1)
+    summary.columns = [c.removeprefix("self_") for c in summary.columns]
+    summary.insert(0, "nodes", nodes.groupby("cte", sort=False).size())
+    summary.insert(1, "plan_rows", tops["plan_rows"])
+    summary.insert(2, "actual_rows", tops["actual_rows"] * tops["actual_loops"])
+    return summary
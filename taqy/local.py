@@ -0,0 +1,608 @@
+import os
+import re
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+from .utils import quantile_columns
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed to read files
+    pa = None
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Bars computed from daily TAQ files of our own rather than by WRDS.
+
+TAQFiles stands for a directory of daily trade and NBBO files.  Passed as `wrds_db` to the
+bar functions of taqy.usequity, it has them read that day's files and compute the very
+bars the SQL would, with the same columns and types, using NumPy group-bys over the
+trades and quotes sorted by bar.
+
+Files may be raw NYSE Daily TAQ files (EQY_US_ALL_TRADE_YYYYMMDD and
+EQY_US_ALL_NBBO_YYYYMMDD, possibly gzipped), Parquet conversions of them, or Parquet
+tables in the layout of the WRDS ctm_YYYYMMDD and complete_nbbo_YYYYMMDD tables, such
+as those of taqy.synthetic.  Parquet files are memory-mapped and only the columns and
+tickers we need are read.  See https://www.nyse.com/publicdocs/nyse/data/Daily_TAQ_Client_Spec_v3.0.pdf
+for the raw layouts.
+
+Caveat: the raw NBBO file leaves out quotes which set the NBBO by themselves, which the
+quotes file flags instead.  WRDS adds those back in complete_nbbo, so NBBO bars from raw
+files may show an older last quote than WRDS would.
+"""
+
+# File names for each day, in order of preference, by the WRDS table they stand for
+FILE_NAMES = {
+    "ctm": (
+        "ctm_{date}.parquet",
+        "EQY_US_ALL_TRADE_{date}.parquet",
+        "EQY_US_ALL_TRADE_{date}",
+        "EQY_US_ALL_TRADE_{date}.gz",
+    ),
+    "complete_nbbo": (
+        "complete_nbbo_{date}.parquet",
+        "EQY_US_ALL_NBBO_{date}.parquet",
+        "EQY_US_ALL_NBBO_{date}",
+        "EQY_US_ALL_NBBO_{date}.gz",
+    ),
+}
+
+# WRDS column names for those of the raw files, which put the suffix in the symbol
+RAW_COLUMNS = {
+    "ctm": {
+        "Symbol": "sym_root",
+        "Exchange": "ex",
+        "Trade Price": "price",
+        "Trade Volume": "size",
+    },
+    "complete_nbbo": {
+        "Symbol": "sym_root",
+        "Best_Bid_Price": "best_bid",
+        "Best_Bid_Size": "best_bidsizeshares",
+        "Best_Offer_Price": "best_ask",
+        "Best_Offer_Size": "best_asksizeshares",
+    },
+}
+
+# The columns of trade bars with first and last trades, as the SQL has them
+FIRST_LAST_ORDER = (
+    "vwap",
+    "last_trade_price",
+    "last_trade_size",
+    "last_trade_time",
+    "num_trades",
+    "total_qty",
+    "mean_price_ignoring_size",
+    "median_size",
+    "median_price",
+    "median_notional",
+    "min_price",
+    "max_price",
+    "min_size",
+    "max_size",
+    "first_trade_price",
+    "first_trade_size",
+    "first_trade_time",
+    "first_trade_time_ns",
+    "last_trade_time_ns",
+)
+
+# NBBO sizes in raw files are in round lots
+RAW_LOT_SIZE = 100
+
+_NANOS_PER_US = 1000
+_OPEN_US = (9 * 3600 + 30 * 60) * 10**6
+_CLOSE_US = 16 * 3600 * 10**6
+
+
+def _time_us(t: datetime.time) -> int:
+    return ((t.hour * 60 + t.minute) * 60 + t.second) * 10**6 + t.microsecond
+
+
+def _raw_time_ns(times: np.ndarray) -> np.ndarray:
+    """
+    Nanoseconds since midnight from raw Time fields, HHMMSS followed by nine digits of
+    nanoseconds, or by three of milliseconds in files from before 2016
+    """
+    digits = 10**9 if len(times) and times.max() >= 10**10 else 10**3
+    hhmmss, fraction = np.divmod(times, digits)
+    hours, mmss = np.divmod(hhmmss, 10**4)
+    minutes, seconds = np.divmod(mmss, 100)
+    return ((hours * 60 + minutes) * 60 + seconds) * 10**9 + fraction * (
+        10**9 // digits
+    )
+
+
+def _arrow_time_ns(column) -> np.ndarray:
+    """Nanoseconds since midnight of a time or duration column"""
+    unit = column.type.unit
+    as_int = column.cast(pa.int64()).to_numpy(zero_copy_only=False)
+    return as_int * {"s": 10**9, "ms": 10**6, "us": 10**3, "ns": 1}[unit]
+
+
+class TAQFiles:
+    """
+    A directory of daily TAQ files, from which to compute bars in place of WRDS.  Pass it
+    as `wrds_db` to taq_trade_bars_on_date() and the like.
+    """
+
+    closed = False
+
+    def __init__(self, directory: str):
+        if pa is None:
+            raise ImportError(
+                "Reading TAQ files requires pyarrow: pip install taqy[parquet-pyarrow]"
+            )
+        self.directory = os.path.abspath(directory)
+
+    def path(self, table: str, date: datetime.date) -> str:
+        """The file standing for the WRDS `table` ("ctm" or "complete_nbbo") on `date`"""
+        for name in FILE_NAMES[table]:
+            path = os.path.join(
+                self.directory, name.format(date=date.strftime("%Y%m%d"))
+            )
+            if os.path.isfile(path):
+                return path
+        raise FileNotFoundError(
+            f"No {table} file for {date} in {self.directory}, looked for {FILE_NAMES[table]}"
+        )
+
+    def list_tables(self, library: str) -> list[str]:
+        """
+        Names of the WRDS tables our files stand for, in the taqm_YYYY `library`, so that
+        taq_trading_dates() finds the days we have
+        """
+        year = library.removeprefix("taqm_")
+        tables = set()
+        for table, names in FILE_NAMES.items():
+            patterns = [
+                re.compile(re.escape(name).replace(r"\{date\}", rf"({year}\d{{4}})"))
+                for name in names
+            ]
+            for fname in os.listdir(self.directory):
+                for pattern in patterns:
+                    match = pattern.fullmatch(fname)
+                    if match:
+                        tables.add(f"{table}_{match.group(1)}")
+        return sorted(tables)
+
+    def _read(
+        self, table: str, date: datetime.date, tickers: list[str]
+    ) -> dict[str, np.ndarray]:
+        """
+        The `tickers`' rows of the day's `table` without symbol suffixes, as arrays named
+        like WRDS columns, with time_ns in place of time_m and time_m_nano
+        """
+        path = self.path(table, date)
+        names = RAW_COLUMNS[table]
+        raw = True
+        with metrics.measure("read", table=table) as event:
+            if path.endswith(".parquet"):
+                schema = pq.read_schema(path, memory_map=True)
+                raw = "Symbol" in schema.names
+                if raw:
+                    columns = ["Time", *names]
+                else:
+                    columns = ["time_m", "sym_suffix", *names.values()]
+                    if "time_m_nano" in schema.names:
+                        columns.append("time_m_nano")
+                symbol = "Symbol" if raw else "sym_root"
+                data = pq.read_table(
+                    path,
+                    columns=columns,
+                    filters=[(symbol, "in", tickers)],
+                    memory_map=True,
+                )
+            else:
+                data = pa_csv.read_csv(
+                    path,
+                    parse_options=pa_csv.ParseOptions(
+                        delimiter="|",
+                        # The last line is a trailer with the number of records
+                        invalid_row_handler=lambda row: "skip",
+                    ),
+                    convert_options=pa_csv.ConvertOptions(
+                        include_columns=["Time", *names],
+                        column_types={"Time": pa.int64(), "Symbol": pa.string()},
+                    ),
+                )
+                # Symbols with suffixes have them after a space, so are left out too
+                data = data.filter(pc.is_in(data["Symbol"], pa.array(tickers)))
+
+            if raw:
+                arrays = {
+                    name: data[column].to_numpy(zero_copy_only=False)
+                    for column, name in names.items()
+                }
+                arrays["time_ns"] = _raw_time_ns(
+                    data["Time"].cast(pa.int64()).to_numpy(zero_copy_only=False)
+                )
+                if table == "complete_nbbo":
+                    arrays["best_bidsizeshares"] = (
+                        arrays["best_bidsizeshares"] * RAW_LOT_SIZE
+                    )
+                    arrays["best_asksizeshares"] = (
+                        arrays["best_asksizeshares"] * RAW_LOT_SIZE
+                    )
+            else:
+                data = data.filter(pc.is_null(data["sym_suffix"]))
+                arrays = {
+                    name: data[name].to_numpy(zero_copy_only=False)
+                    for name in names.values()
+                }
+                arrays["time_ns"] = _arrow_time_ns(data["time_m"])
+                if "time_m_nano" in data.column_names:
+                    arrays["time_ns"] += (
+                        data["time_m_nano"]
+                        .fill_null(0)
+                        .cast(pa.int64())
+                        .to_numpy(zero_copy_only=False)
+                    )
+            event.rows = len(data)
+        return arrays
+
+    def trade_bars(
+        self,
+        tickers: list[str],
+        date: datetime.date,
+        bar_minutes: int,
+        group_by_exchange: bool,
+        restrict_to_exchanges: tuple[str, ...] | str | None,
+        include_first_and_last: bool,
+        grid: tuple[int, datetime.time, datetime.time] | None,
+        statistics: tuple[str, ...] | None = None,
+        quantiles: tuple[float, ...] | None = None,
+    ) -> pd.DataFrame:
+        """Bars as taq_trade_bars_sql() would have WRDS compute them"""
+        trades = self._read("ctm", date, tickers)
+        if restrict_to_exchanges is not None:
+            if hasattr(restrict_to_exchanges, "strip"):
+                restrict_to_exchanges = [restrict_to_exchanges]
+            keep = np.isin(trades["ex"], list(restrict_to_exchanges))
+            trades = {name: values[keep] for name, values in trades.items()}
+        with metrics.measure("compute_bars") as event:
+            bars = trade_bars(
+                trades,
+                date,
+                bar_minutes,
+                grid,
+                group_by_exchange,
+                include_first_and_last,
+                statistics,
+                quantiles,
+            )
+            event.rows = len(bars)
+        return bars
+
+    def nbbo_bars(
+        self,
+        tickers: list[str],
+        date: datetime.date,
+        bar_minutes: int,
+        grid: tuple[int, datetime.time, datetime.time] | None,
+        quote_statistics: bool = False,
+    ) -> pd.DataFrame:
+        """Bars as taq_nbbo_bars_sql() would have WRDS compute them"""
+        quotes = self._read("complete_nbbo", date, tickers)
+        with metrics.measure("compute_bars") as event:
+            bars = nbbo_bars(quotes, date, bar_minutes, grid, quote_statistics)
+            event.rows = len(bars)
+        return bars
+
+
+#########################
+## Computation of Bars ##
+#########################
+
+
+def _grouped(
+    data: dict[str, np.ndarray],
+    bar_minutes: int,
+    grid: tuple[int, datetime.time, datetime.time] | None,
+    columns: list[str],
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict[str, np.ndarray]]:
+    """
+    The rows of `data` within the session, sorted by the first of `columns` (the ticker),
+    bar, the rest of `columns` and time, as (their order, where each group of them starts
+    and ends in it, and the values of each group, including the end of its bar as
+    window_ns).  As in the SQL, the session and bars go by time_m alone, but unlike it, ties
+    in time_m are broken by nanoseconds.
+    """
+    us = data["time_ns"] // _NANOS_PER_US
+    if grid is None:
+        in_session = (us > _OPEN_US) & (us < _CLOSE_US)
+        width_us, start_us, end_us = 60 * 10**6 * bar_minutes, 0, _CLOSE_US
+    else:
+        width, session_start, session_end = grid
+        width_us, start_us = width * 10**6, _time_us(session_start)
+        end_us = _time_us(session_end)
+        # Leaving out the open itself, as session_select_sql() does
+        after_start = us > start_us if start_us == _OPEN_US else us >= start_us
+        in_session = after_start & (us < end_us)
+    rows = np.flatnonzero(in_session)
+
+    keys = {"bucket": (us[rows] - start_us) // width_us}
+    uniques = {}
+    for column in columns:
+        uniques[column], keys[column] = np.unique(
+            data[column][rows], return_inverse=True
+        )
+    ordered = [keys[columns[0]], keys["bucket"], *(keys[c] for c in columns[1:])]
+    # np.lexsort sorts by its last key first, and ties by file order
+    by = np.lexsort((rows, data["time_ns"][rows], *ordered[::-1]))
+    order = rows[by]
+
+    changed = np.zeros(len(order), dtype=bool)
+    changed[:1] = True
+    for key in ordered:
+        key = key[by]
+        changed[1:] |= key[1:] != key[:-1]
+    starts = np.flatnonzero(changed)
+    ends = np.append(starts[1:], len(order))
+
+    groups = {column: uniques[column][keys[column][by][starts]] for column in columns}
+    # Bars end on the clock, or if bucketed, at the end of the session if that is sooner
+    bucket = keys["bucket"][by][starts]
+    window_us = np.minimum(start_us + (bucket + 1) * width_us, end_us)
+    groups["window_ns"] = window_us * _NANOS_PER_US
+    return order, starts, ends, groups
+
+
+def _times(time_ns: np.ndarray) -> tuple[np.ndarray, pd.arrays.IntegerArray]:
+    """time_m and time_m_nano, as they come back from the database"""
+    us, nanos = np.divmod(time_ns, _NANOS_PER_US)
+    times = pd.to_datetime(us * _NANOS_PER_US, unit="ns").time
+    return times, pd.array(nanos, dtype="Int64")
+
+
+def _median(
+    values: np.ndarray, group: np.ndarray, starts: np.ndarray, ends: np.ndarray
+) -> np.ndarray:
+    """PERCENTILE_CONT(0.5) of `values` within each group, numbered by `group`"""
+    values = values[np.lexsort((values, group))]
+    return (values[(starts + ends - 1) // 2] + values[(starts + ends) // 2]) / 2
+
+
+def _percentiles(
+    values: np.ndarray,
+    group: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    quantiles: tuple[float, ...],
+) -> np.ndarray:
+    """
+    PERCENTILE_CONT(ARRAY[`quantiles`]) of `values` within each group, as a row of the
+    quantiles for each, from a single sort
+    """
+    values = values[np.lexsort((values, group))]
+    # Interpolating between the values either side of each quantile's position
+    offset = np.multiply.outer(ends - starts - 1, quantiles)
+    below = starts[:, None] + np.floor(offset).astype(np.int64)
+    above = starts[:, None] + np.ceil(offset).astype(np.int64)
+    return values[below] + (offset - np.floor(offset)) * (values[above] - values[below])
+
+
+def _bars_frame(
+    date: datetime.date, groups: dict[str, np.ndarray], columns: dict
+) -> pd.DataFrame:
+    date = pd.Timestamp(date).as_unit("ns").to_datetime64()
+    window_time = date + groups["window_ns"].astype("timedelta64[ns]")
+    return pd.DataFrame(
+        {
+            "ticker": pd.array(groups["sym_root"], dtype=pd.StringDtype("python")),
+            "date": np.full(len(window_time), date),
+            "window_time": window_time,
+            **columns,
+        }
+    )
+
+
+def trade_bars(
+    trades: dict[str, np.ndarray],
+    date: datetime.date,
+    bar_minutes: int,
+    grid: tuple[int, datetime.time, datetime.time] | None,
+    group_by_exchange: bool = False,
+    include_first_and_last: bool = False,
+    statistics: tuple[str, ...] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+) -> pd.DataFrame:
+    """
+    The trade bars of taq_trade_bars_sql(), before timestamps are made, from arrays of
+    `trades` named like the columns of ctm tables, with time_ns, the nanoseconds since
+    midnight, in place of time_m and time_m_nano.  Of several trades at the same time, the
+    first in `trades` is taken as the first trade, and the last as the last.  Only the
+    `statistics` named, if given, are computed, along with any `quantiles`.
+    """
+    columns = ["sym_root"] + (["ex"] if group_by_exchange else [])
+    order, starts, ends, groups = _grouped(trades, bar_minutes, grid, columns)
+    price = trades["price"][order].astype(float)
+    size = trades["size"][order].astype(np.int64)
+    notional = price * size
+    # Group number of each sorted trade, for sorting within groups
+    group = np.repeat(np.arange(len(starts)), ends - starts)
+    counts = ends - starts
+
+    def total(values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, starts) if len(starts) else values[:0]
+
+    def extreme(ufunc: np.ufunc, values: np.ndarray) -> np.ndarray:
+        return ufunc.reduceat(values, starts) if len(starts) else values[:0]
+
+    # Medians, which take sorting, only if asked for
+    medians = {}
+    for name, values in (
+        ("median_size", size.astype(float)),
+        ("median_price", price),
+        ("median_notional", notional),
+    ):
+        if statistics is None or name in statistics:
+            medians[name] = pd.array(
+                _median(values, group, starts, ends), dtype="Float64"
+            )
+
+    total_qty = total(size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stats = {
+            "num_trades": pd.array(counts, dtype="Int64"),
+            "total_qty": pd.array(total_qty, dtype="Int64"),
+            "vwap": pd.array(total(notional) / total_qty, dtype="Float64"),
+            "mean_price_ignoring_size": pd.array(
+                total(price) / counts, dtype="Float64"
+            ),
+            **medians,
+            "max_price": pd.array(extreme(np.maximum, price), dtype="Float64"),
+            "min_price": pd.array(extreme(np.minimum, price), dtype="Float64"),
+            "max_size": pd.array(extreme(np.maximum, size), dtype="Int64"),
+            "min_size": pd.array(extreme(np.minimum, size), dtype="Int64"),
+        }
+    if statistics is not None:
+        stats = {name: values for name, values in stats.items() if name in statistics}
+    if quantiles:
+        names = iter(quantile_columns(quantiles))
+        for values in (size.astype(float), price, notional):
+            by_group = _percentiles(values, group, starts, ends, quantiles)
+            for i in range(len(quantiles)):
+                stats[next(names)] = pd.array(by_group[:, i], dtype="Float64")
+    ex = {}
+    if group_by_exchange:
+        ex["ex"] = pd.array(groups["ex"], dtype=pd.StringDtype("python"))
+
+    if not include_first_and_last:
+        return _bars_frame(date, groups, {**stats, **ex})
+
+    first, last = order[starts], order[ends - 1]
+    first_time, first_ns = _times(trades["time_ns"][first])
+    last_time, last_ns = _times(trades["time_ns"][last])
+    if not group_by_exchange:
+        ex["first_trade_ex"] = pd.array(
+            trades["ex"][first], dtype=pd.StringDtype("python")
+        )
+        ex["last_trade_ex"] = pd.array(
+            trades["ex"][last], dtype=pd.StringDtype("python")
+        )
+    columns = {
+        **stats,
+        "last_trade_price": pd.array(
+            trades["price"][last].astype(float), dtype="Float64"
+        ),
+        "last_trade_size": pd.array(
+            trades["size"][last].astype(np.int64), dtype="Int64"
+        ),
+        "last_trade_time": last_time,
+        "first_trade_price": pd.array(
+            trades["price"][first].astype(float), dtype="Float64"
+        ),
+        "first_trade_size": pd.array(
+            trades["size"][first].astype(np.int64), dtype="Int64"
+        ),
+        "first_trade_time": first_time,
+        "first_trade_time_ns": first_ns,
+        "last_trade_time_ns": last_ns,
+    }
+    # In the order of the SQL's columns, which has any quantiles before the first trade
+    at = FIRST_LAST_ORDER.index("first_trade_price")
+    order = FIRST_LAST_ORDER[:at] + quantile_columns(quantiles) + FIRST_LAST_ORDER[at:]
+    return _bars_frame(
+        date,
+        groups,
+        {**{name: columns[name] for name in order if name in columns}, **ex},
+    )
+
+
+def nbbo_bars(
+    quotes: dict[str, np.ndarray],
+    date: datetime.date,
+    bar_minutes: int,
+    grid: tuple[int, datetime.time, datetime.time] | None,
+    quote_statistics: bool = False,
+) -> pd.DataFrame:
+    """
+    The NBBO bars of taq_nbbo_bars_sql(), before timestamps are made, from arrays of
+    `quotes` as for trade_bars().  Of several quotes at the same time, the last in
+    `quotes` is taken as the last quote, and the first as the first.
+    """
+    order, starts, ends, groups = _grouped(quotes, bar_minutes, grid, ["sym_root"])
+    last = order[ends - 1]
+    time_of_last_quote, time_of_last_quote_ns = _times(quotes["time_ns"][last])
+    statistics = {}
+    if quote_statistics:
+        statistics = _quote_statistics(quotes, order, starts, ends, groups)
+    return _bars_frame(
+        date,
+        groups,
+        {
+            "best_bid": pd.array(
+                quotes["best_bid"][last].astype(float), dtype="Float64"
+            ),
+            "best_bidsizeshares": pd.array(
+                quotes["best_bidsizeshares"][last], dtype="Int64"
+            ),
+            "best_ask": pd.array(
+                quotes["best_ask"][last].astype(float), dtype="Float64"
+            ),
+            "best_asksizeshares": pd.array(
+                quotes["best_asksizeshares"][last], dtype="Int64"
+            ),
+            "time_of_last_quote": time_of_last_quote,
+            "time_of_last_quote_ns": time_of_last_quote_ns,
+            **statistics,
+        },
+    )
+
+
+def _quote_statistics(
+    quotes: dict[str, np.ndarray],
+    order: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    groups: dict[str, np.ndarray],
+) -> dict[str, pd.api.extensions.ExtensionArray]:
+    """The QUOTE_STATISTICS of taq_nbbo_bars_sql() for each group of the sorted `quotes`"""
+    bid = quotes["best_bid"][order].astype(float)
+    ask = quotes["best_ask"][order].astype(float)
+    us = quotes["time_ns"][order] // _NANOS_PER_US
+    # Each quote stands until the next in its bar, or the end of the bar, to the microsecond
+    until = np.append(us[1:], 0)
+    until[ends - 1] = groups["window_ns"] // _NANOS_PER_US
+    seconds = (until - us) / 10**6
+    two_sided = (bid > 0) & (ask > 0)
+    mid = (ask + bid) / 2
+
+    def total(values: np.ndarray) -> np.ndarray:
+        return np.add.reduceat(values, starts) if len(starts) else values[:0]
+
+    def extreme(ufunc: np.ufunc, values: np.ndarray) -> np.ndarray:
+        return ufunc.reduceat(values, starts) if len(starts) else values[:0]
+
+    weight = total(np.where(two_sided, seconds, 0.0))
+    spread = total(np.where(two_sided, seconds * (ask - bid), 0.0))
+    weighted_mid = total(np.where(two_sided, seconds * mid, 0.0))
+    first = extreme(np.minimum, np.where(two_sided, np.arange(len(order)), len(order)))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        statistics = {
+            "time_weighted_spread": spread / weight,
+            "time_weighted_midquote": weighted_mid / weight,
+            "min_midquote": extreme(np.minimum, np.where(two_sided, mid, np.inf)),
+            "max_midquote": extreme(np.maximum, np.where(two_sided, mid, -np.inf)),
+            "first_midquote": np.append(mid, np.nan)[first],
+        }
+    # Bars without a two-sided quote have none of the statistics but the count
+    return {
+        "num_quotes": pd.array(ends - starts, dtype="Int64"),
+        **{
+            name: pd.array(
+                np.where(np.isfinite(values), values, np.nan), dtype="Float64"
+            )
+            for name, values in statistics.items()
+        },
+    }
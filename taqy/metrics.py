@@ -0,0 +1,192 @@
+import time
+import inspect
+import datetime
+import functools
+import threading
+import contextlib
+import contextvars
+import dataclasses
+from typing import Callable, Iterator
+
+import pandas as pd
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Timings and counts of what taqy does, for finding where the time goes.
+
+Every phase of a query, from building its SQL to making timestamps of the results, is
+reported as an Event to each of the functions in HOOKS.  Events carry the labels of the
+bar function call they are part of: the function, the number of tickers, the date and the
+bar width.  With no hooks, nothing is measured.
+
+MetricsAggregator is a hook which simply adds everything up.
+"""
+
+# Functions called with each Event
+HOOKS: list[Callable[["Event"], None]] = []
+
+_LABELS: contextvars.ContextVar[dict] = contextvars.ContextVar("labels", default={})
+
+
+@dataclasses.dataclass
+class Event:
+    """
+    Something that happened: a phase that took `seconds`, perhaps producing `rows` of
+    results taking up `bytes` in memory, or `count` occurrences of something, such as cache
+    hits or retries
+    """
+
+    name: str
+    labels: dict = dataclasses.field(default_factory=dict)
+    seconds: float | None = None
+    count: int = 1
+    rows: int | None = None
+    bytes: int | None = None
+
+
+def add_hook(hook: Callable[[Event], None]):
+    HOOKS.append(hook)
+
+
+def remove_hook(hook: Callable[[Event], None]):
+    HOOKS.remove(hook)
+
+
+def enabled() -> bool:
+    return bool(HOOKS)
+
+
+def emit(event: Event):
+    for hook in tuple(HOOKS):
+        hook(event)
+
+
+def count(name: str, n: int = 1, **labels):
+    """Report `n` occurrences of `name`"""
+    if HOOKS and n:
+        emit(Event(name, {**_LABELS.get(), **labels}, count=n))
+
+
+@contextlib.contextmanager
+def labelled(**labels) -> Iterator[None]:
+    """Add `labels` to the events of the with block, on this thread"""
+    token = _LABELS.set({**_LABELS.get(), **labels})
+    try:
+        yield
+    finally:
+        _LABELS.reset(token)
+
+
+@contextlib.contextmanager
+def measure(name: str, **labels) -> Iterator[Event]:
+    """
+    Report the time taken by the with block as an Event named `name`, whose rows and bytes
+    the block may fill in.  Should the block raise, the event is labeled with the error.
+    """
+    event = Event(name, {**_LABELS.get(), **labels} if HOOKS else {})
+    if not HOOKS:
+        yield event
+        return
+
+    start = time.perf_counter()
+    try:
+        yield event
+    except BaseException as exc:
+        event.labels["error"] = type(exc).__name__
+        raise
+    finally:
+        event.seconds = time.perf_counter() - start
+        emit(event)
+
+
+def _call_labels(function: str, arguments: dict) -> dict:
+    labels = {"function": function}
+    tickers = arguments.get("tickers")
+    if tickers is not None:
+        labels["tickers"] = 1 if hasattr(tickers, "strip") else len(set(tickers))
+    if isinstance(arguments.get("date"), datetime.date):
+        labels["date"] = arguments["date"].isoformat()
+    elif isinstance(arguments.get("start"), datetime.date):
+        labels["date"] = (
+            f"{arguments['start'].isoformat()}/{arguments['end'].isoformat()}"
+        )
+    if arguments.get("bar_seconds") is not None:
+        labels["bar_seconds"] = arguments["bar_seconds"]
+    elif arguments.get("bar_minutes") is not None:
+        labels["bar_seconds"] = 60 * arguments["bar_minutes"]
+    return labels
+
+
+def instrumented(fn: Callable) -> Callable:
+    """
+    Decorate a bar function so that the events of each call to it carry its labels, and
+    the call as a whole is reported as an Event named "call"
+    """
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not HOOKS:
+            return fn(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        with labelled(**_call_labels(fn.__name__, bound.arguments)):
+            with measure("call") as event:
+                result = fn(*args, **kwargs)
+                event.rows = len(result)
+                return result
+
+    return wrapper
+
+
+class MetricsAggregator:
+    """
+    A hook adding up events by name and the labels named in `by`, safe to share between
+    threads.  summary() has their number, total count, time, rows and bytes.
+    """
+
+    def __init__(self, by: tuple[str, ...] = ("function",)):
+        self.by = tuple(by)
+        self._lock = threading.Lock()
+        self._totals: dict[tuple, dict] = {}
+
+    def __call__(self, event: Event):
+        key = (event.name,) + tuple(event.labels.get(label) for label in self.by)
+        with self._lock:
+            totals = self._totals.setdefault(
+                key,
+                {
+                    "events": 0,
+                    "count": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "rows": 0,
+                    "bytes": 0,
+                },
+            )
+            totals["events"] += 1
+            totals["count"] += event.count
+            if event.seconds is not None:
+                totals["seconds"] += event.seconds
+                totals["max_seconds"] = max(totals["max_seconds"], event.seconds)
+            totals["rows"] += event.rows or 0
+            totals["bytes"] += event.bytes or 0
+
+    def summary(self) -> pd.DataFrame:
+        with self._lock:
+            totals = {key: dict(values) for key, values in self._totals.items()}
+        if not totals:
+            return pd.DataFrame()
+        summary = pd.DataFrame(
+            list(totals.values()),
+            index=pd.MultiIndex.from_tuples(list(totals), names=("name",) + self.by),
+        )
+        summary.insert(3, "mean_seconds", summary["seconds"] / summary["events"])
+        return summary
+
+    def clear(self):
+        with self._lock:
+            self._totals.clear()
@@ -0,0 +1,107 @@
+import pandas as pd
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Coarse bars computed locally from finer ones.  Counts, quantities and notionals add up,
+extremes are extremes of extremes, and the first and last trades or quotes of a coarse bar
+are those of its first and last fine bars.  Medians do not decompose, so must still come
+from WRDS.
+
+These work on bars as they come back from the database, before timestamps are localized.
+"""
+
+MEDIAN_COLUMNS = ("median_size", "median_price", "median_notional")
+
+
+def finer_bar_minutes(bar_minutes: int) -> list[int]:
+    """Valid bar widths evenly dividing `bar_minutes`, coarsest first"""
+    return [
+        m for m in range(bar_minutes - 1, 0, -1) if bar_minutes % m == 0 and 30 % m == 0
+    ]
+
+
+def coarse_window_time(
+    window_time: pd.Series, fine_minutes: int, bar_minutes: int
+) -> pd.Series:
+    """The window_time of the coarse bar containing each fine bar"""
+    assert bar_minutes % fine_minutes == 0
+    # Bars are labeled by their end, and aligned to the clock, so 60 minute bars are hours
+    start = window_time - pd.Timedelta(minutes=fine_minutes)
+    return start.dt.floor(f"{bar_minutes}min") + pd.Timedelta(minutes=bar_minutes)
+
+
+def _in_coarse_order(
+    bars: pd.DataFrame, fine_minutes: int, bar_minutes: int, keys: list[str]
+) -> pd.DataFrame:
+    return bars.assign(
+        fine_window_time=bars["window_time"],
+        window_time=coarse_window_time(bars["window_time"], fine_minutes, bar_minutes),
+    ).sort_values(keys + ["fine_window_time"], ignore_index=True)
+
+
+def rollup_trade_bars(
+    bars: pd.DataFrame,
+    fine_minutes: int,
+    bar_minutes: int,
+    group_by_exchange: bool = False,
+    medians: pd.DataFrame | None = None,
+) -> pd.DataFrame:
+    """
+    `bar_minutes` trade bars from `fine_minutes` ones, with or without first and last trades.
+
+    Median columns are dropped unless `medians` holds them for the coarse bars, keyed by
+    ticker, date, window_time and, if grouping by exchange, ex.
+    """
+    keys = ["ticker", "date", "window_time"] + (["ex"] if group_by_exchange else [])
+    fine = _in_coarse_order(
+        bars.assign(
+            notional=bars["vwap"] * bars["total_qty"],
+            price_total=bars["mean_price_ignoring_size"] * bars["num_trades"],
+        ),
+        fine_minutes,
+        bar_minutes,
+        keys,
+    )
+
+    coarse = (
+        fine.groupby(keys, sort=False, dropna=False)
+        .agg(
+            num_trades=("num_trades", "sum"),
+            total_qty=("total_qty", "sum"),
+            notional=("notional", "sum"),
+            price_total=("price_total", "sum"),
+            max_price=("max_price", "max"),
+            min_price=("min_price", "min"),
+            max_size=("max_size", "max"),
+            min_size=("min_size", "min"),
+        )
+        .reset_index()
+    )
+    coarse["vwap"] = coarse.pop("notional") / coarse["total_qty"]
+    coarse["mean_price_ignoring_size"] = (
+        coarse.pop("price_total") / coarse["num_trades"]
+    )
+
+    # Groups appear in the same order here as in the aggregation
+    for keep, prefix in (("first", "first_trade_"), ("last", "last_trade_")):
+        columns = [c for c in bars.columns if c.startswith(prefix)]
+        if columns:
+            ends = fine.drop_duplicates(keys, keep=keep, ignore_index=True)
+            for column in columns:
+                coarse[column] = ends[column]
+
+    if medians is not None:
+        coarse = coarse.merge(medians[keys + list(MEDIAN_COLUMNS)], on=keys, how="left")
+    return coarse[[c for c in bars.columns if c in coarse.columns]]
+
+
+def rollup_nbbo_bars(
+    bars: pd.DataFrame, fine_minutes: int, bar_minutes: int
+) -> pd.DataFrame:
+    """`bar_minutes` NBBO bars from `fine_minutes` ones"""
+    keys = ["ticker", "date", "window_time"]
+    fine = _in_coarse_order(bars, fine_minutes, bar_minutes, keys)
+    return fine.drop_duplicates(keys, keep="last", ignore_index=True)[bars.columns]
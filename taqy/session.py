@@ -0,0 +1,260 @@
+import time
+import threading
+import contextlib
+from typing import Callable
+
+import pandas as pd
+import sqlalchemy as sa
+import wrds
+
+from . import metrics
+from .cache import MemoryCache
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+A wrds Connection wraps a single database connection, so it cannot be shared between
+threads, and once it drops it stays dropped.  A Session stands in for one, handing each
+call its own connection from a pool and replacing connections that have gone bad.
+"""
+
+
+def _is_open(db: wrds.sql.Connection) -> bool:
+    if db.engine is None:
+        return False
+    return not (db.connection.closed or db.connection.invalidated)
+
+
+def _ping(db: wrds.sql.Connection) -> bool:
+    try:
+        db.connection.exec_driver_sql("SELECT 1")
+        return True
+    except Exception:
+        return False
+
+
+def cancel_query(db: wrds.sql.Connection) -> bool:
+    """
+    Ask the server to abandon whatever query `db` is running.  Safe to call from any thread.
+    """
+    dbapi_connection = db.connection.connection.dbapi_connection
+    if hasattr(dbapi_connection, "cancel"):  # psycopg2
+        dbapi_connection.cancel()
+    elif hasattr(dbapi_connection, "interrupt"):  # sqlite3, handy for testing
+        dbapi_connection.interrupt()
+    else:
+        return False
+    return True
+
+
+class ConnectionPool:
+    """
+    Up to `size` connections made by `connect()`, opened as demand requires.  Connections
+    found closed, or idle for more than `ping_interval` seconds and failing a trivial
+    query, are discarded and replaced at checkout.
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], wrds.sql.Connection],
+        size: int = 1,
+        ping_interval: float = 60.0,
+    ):
+        assert size >= 1
+        self.size = size
+        self.ping_interval = ping_interval
+        self.discarded = 0
+        self._connect = connect
+        self._idle: list[tuple[float, wrds.sql.Connection]] = []
+        self._num_open = 0
+        self._cond = threading.Condition()
+
+    def _checkout(self) -> wrds.sql.Connection:
+        while True:
+            with self._cond:
+                while not self._idle and self._num_open >= self.size:
+                    self._cond.wait()
+                if self._idle:
+                    last_used, db = self._idle.pop()
+                else:
+                    self._num_open += 1
+                    db = None
+
+            if db is None:
+                try:
+                    return self._connect()
+                except BaseException:
+                    with self._cond:
+                        self._num_open -= 1
+                        self._cond.notify()
+                    raise
+
+            if _is_open(db) and (
+                time.monotonic() - last_used < self.ping_interval or _ping(db)
+            ):
+                return db
+            self._discard(db)
+
+    def _checkin(self, db: wrds.sql.Connection):
+        with self._cond:
+            self._idle.append((time.monotonic(), db))
+            self._cond.notify()
+
+    def _discard(self, db: wrds.sql.Connection):
+        with contextlib.suppress(Exception):
+            db.close()
+        with self._cond:
+            self._num_open -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        db = self._checkout()
+        reusable = True
+        try:
+            yield db
+        except BaseException:
+            reusable = _is_open(db)
+            raise
+        finally:
+            if reusable:
+                self._checkin(db)
+            else:
+                self._discard(db)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for _, db in idle:
+            self._discard(db)
+
+
+class Session:
+    """
+    Thread-safe replacement for a wrds Connection, accepted anywhere taqy takes `wrds_db`.
+
+    Each call is run on a pooled connection of its own, so up to `pool_size` queries may be
+    in flight at once from different threads.  Queries failing because their connection
+    dropped are retried up to `retries` times on a fresh one.  Query results are cached
+    in `cache`, which is private to the session unless one is passed in.
+
+    Keyword arguments are those of wrds.Connection, e.g. `wrds_username`.  Alternatively
+    `connect` may be any callable returning an open wrds Connection.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 1,
+        cache: MemoryCache | None = None,
+        retries: int = 1,
+        ping_interval: float = 60.0,
+        connect: Callable[[], wrds.sql.Connection] | None = None,
+        **kwargs,
+    ):
+        self.cache = cache if cache is not None else MemoryCache()
+        self.retries = retries
+        self.closed = False
+        self._connect_kwargs = kwargs
+        # Connections checked out by each thread, innermost last, as a thread may run a
+        # query while still reading the result of another
+        self._in_use: dict[int, list[wrds.sql.Connection]] = {}
+        self.pool = ConnectionPool(
+            connect or self._connect, size=pool_size, ping_interval=ping_interval
+        )
+        # Connect now, so that any prompting for credentials happens up front
+        with self.pool.connection():
+            pass
+
+    def _connect(self) -> wrds.sql.Connection:
+        db = wrds.Connection(autoconnect=False, **self._connect_kwargs)
+        db.connect()
+        # Reuse the credentials the first connection settled on rather than prompting again
+        self._connect_kwargs.setdefault("wrds_username", db._username)
+        self._connect_kwargs.setdefault("wrds_password", db._password)
+        return db
+
+    @property
+    def pool_size(self) -> int:
+        return self.pool.size
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Check out a pooled connection for the duration of the with block, e.g. to read a
+        result in pieces.  Not retried should the connection drop.
+        """
+        if self.closed:
+            raise ValueError("The session has been closed.  Please reconnect.")
+        thread_id = threading.get_ident()
+        held = self._in_use.get(thread_id, [])
+        if len(held) >= self.pool.size:
+            # Waiting would be waiting on ourselves
+            raise ValueError(
+                f"This thread already holds all {self.pool.size} of the session's "
+                "connections, e.g. by streaming a result.  Finish or close the stream "
+                "first, or connect with a larger pool_size."
+            )
+        with self.pool.connection() as db:
+            self._in_use.setdefault(thread_id, []).append(db)
+            try:
+                yield db
+            finally:
+                held = self._in_use[thread_id]
+                held.remove(db)
+                if not held:
+                    del self._in_use[thread_id]
+
+    def _run(self, fn: Callable[[wrds.sql.Connection], object]):
+        for attempt in range(self.retries + 1):
+            try:
+                with self.connection() as db:
+                    return fn(db)
+            except sa.exc.DBAPIError as dbe:
+                if not dbe.connection_invalidated or attempt == self.retries:
+                    raise
+                metrics.count("retry", error=type(dbe.orig).__name__)
+
+    def cancel(self, thread_id: int) -> bool:
+        """Cancel the query, if any, that thread `thread_id` is running on this session"""
+        held = self._in_use.get(thread_id)
+        return bool(held) and cancel_query(held[-1])
+
+    def raw_sql(self, sql: str, **kwargs) -> pd.DataFrame:
+        return self._run(lambda db: db.raw_sql(sql, **kwargs))
+
+    def describe_table(self, library: str, table: str) -> pd.DataFrame:
+        """
+        As wrds.Connection.describe_table(), but without printing a row count, or the
+        extra query needed to find it
+        """
+
+        def describe(db: wrds.sql.Connection) -> pd.DataFrame:
+            columns = sa.inspect(db.connection).get_columns(table, schema=library)
+            return pd.DataFrame.from_dict(columns).reindex(
+                columns=["name", "nullable", "type", "comment"]
+            )
+
+        return self._run(describe)
+
+    def list_tables(self, library: str) -> list[str]:
+        def list_tables(db: wrds.sql.Connection) -> list[str]:
+            insp = sa.inspect(db.connection)
+            tables = insp.get_view_names(schema=library)
+            tables += insp.get_table_names(schema=library)
+            tables += insp.get_foreign_table_names(schema=library)
+            return tables
+
+        return self._run(list_tables)
+
+    def close(self):
+        self.closed = True
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
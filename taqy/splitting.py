@@ -0,0 +1,203 @@
+import time
+import datetime
+import threading
+import contextlib
+import collections
+from typing import Callable
+
+import pandas as pd
+import sqlalchemy as sa
+
+from . import metrics
+from .session import Session
+from .transfer import concat_tables
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Queries too big for WRDS to answer in one go.  The server is told to give up on any query
+running longer than a statement timeout, and a query that times out or runs out of memory
+is asked again as smaller ones: for fewer days, fewer tickers, and then fewer bars.
+"""
+
+# PostgreSQL errors of queries that wanted more of the server than it would give
+_OUT_OF_RESOURCES = {
+    "53100",  # disk_full, as by temporary files for sorts
+    "53200",  # out_of_memory
+    "53400",  # configuration_limit_exceeded, as by temp_file_limit
+}
+_QUERY_CANCELED = "57014"
+
+
+def too_big(error: BaseException) -> bool:
+    """Whether `error` says a query ran out of time or memory, so a smaller one might not"""
+    if isinstance(error, MemoryError):
+        return True
+    if not isinstance(error, sa.exc.DBAPIError):
+        return False
+    pgcode = getattr(error.orig, "pgcode", None)
+    if pgcode == _QUERY_CANCELED:
+        # Cancelled by the statement timeout, rather than by a caller such as taqy.aio
+        return "statement timeout" in str(error.orig)
+    return pgcode in _OUT_OF_RESOURCES
+
+
+@contextlib.contextmanager
+def statement_timeout(db, seconds: float | None):
+    """
+    `db`, or for a Session one of its connections, on which the server abandons statements
+    running longer than `seconds` for the duration of the with block
+    """
+    if seconds is None:
+        yield db
+        return
+    checkout = (
+        db.connection() if isinstance(db, Session) else contextlib.nullcontext(db)
+    )
+    with checkout as db:
+        milliseconds = max(1, round(1000 * seconds))
+        db.connection.exec_driver_sql(f"SET statement_timeout = {milliseconds}")
+        try:
+            yield db
+        finally:
+            # A dropped connection takes the setting with it
+            with contextlib.suppress(Exception):
+                db.connection.exec_driver_sql("RESET statement_timeout")
+
+
+class QuerySplitter:
+    """
+    Runs bar queries with a `statement_timeout` in seconds.  A query running out of time or
+    memory is run again as two, each for half of its tickers or, once down to one ticker,
+    for half of its bars.  Queries which cannot be split any further are retried up to
+    `retries` times, after waiting `backoff` seconds, then twice as long each time after.
+
+    The most tickers and bars that a query of each shape could manage are remembered, so
+    that later queries of the same shape, on other days or for other tickers, are split
+    as finely from the outset.
+    """
+
+    def __init__(
+        self,
+        statement_timeout: float | None = 600.0,
+        retries: int = 2,
+        backoff: float = 10.0,
+    ):
+        assert retries >= 0
+        self.statement_timeout = statement_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.granularity: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, shape: str, most_tickers: int, most_bars: int):
+        with self._lock:
+            tickers, bars = self.granularity.get(shape, (most_tickers, most_bars))
+            self.granularity[shape] = (
+                min(tickers, most_tickers),
+                min(bars, most_bars),
+            )
+
+    def query(
+        self,
+        db,
+        tickers: list[str],
+        ticker_sql: Callable[..., str],
+        edges: list[datetime.time] | None,
+        shape: str,
+        query: Callable[[object, str], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """
+        The result of `query(db, ticker_sql(tickers))`, from as many queries as it takes.
+        Each is of `ticker_sql(some_tickers, (start, end))` for the bars from one of the
+        `edges` to a later one, or if those are None, of `ticker_sql(some_tickers)`.
+        Queries are alike in `shape` if they are split alike.
+        """
+        num_bars = 1 if edges is None else len(edges) - 1
+        most_tickers, most_bars = self.granularity.get(shape, (len(tickers), num_bars))
+        # Pieces of tickers, a run of the bars and how often it has been tried, in order
+        pending = collections.deque()
+        for first in range(0, len(tickers), most_tickers):
+            some = tickers[first:][:most_tickers]
+            for start in range(0, num_bars, most_bars):
+                pending.append((some, (start, min(start + most_bars, num_bars)), 0))
+
+        results = []
+        while pending:
+            some, (start, end), attempt = pending.popleft()
+            if (start, end) == (0, num_bars):
+                sql = ticker_sql(some)
+            else:
+                sql = ticker_sql(some, (edges[start], edges[end]))
+            try:
+                with statement_timeout(db, self.statement_timeout) as piece_db:
+                    results.append(query(piece_db, sql))
+                continue
+            except Exception as error:
+                if not too_big(error):
+                    raise
+                failure = error
+
+            # Halves in the order their bars would have come in
+            if len(some) > 1:
+                half = len(some) // 2
+                halves = [(some[:half], (start, end)), (some[half:], (start, end))]
+                self._remember(shape, len(some) - half, most_bars)
+                metrics.count("split", by="tickers")
+            elif end - start > 1:
+                middle = (start + end) // 2
+                halves = [(some, (start, middle)), (some, (middle, end))]
+                self._remember(shape, 1, end - middle)
+                metrics.count("split", by="bars")
+            elif attempt < self.retries:
+                metrics.count("retry", error=type(failure).__name__)
+                time.sleep(self.backoff * 2**attempt)
+                pending.appendleft((some, (start, end), attempt + 1))
+                continue
+            else:
+                raise failure
+            pending.extendleft(reversed([(*half, 0) for half in halves]))
+
+        return _concat(results)
+
+    def query_days(
+        self,
+        db,
+        days: list,
+        days_sql: Callable[[list], str],
+        one_day: Callable[[object], pd.DataFrame],
+        query: Callable[[object, str], pd.DataFrame],
+    ) -> pd.DataFrame:
+        """
+        The result of `query(db, days_sql(days))` for a batch of several `days`, with the
+        statement timeout.  A batch running out of time or memory is run again as two, each
+        of half its days, and a single day as `one_day(day)`, which may split it further.
+        """
+        if len(days) == 1:
+            return one_day(days[0])
+        try:
+            with statement_timeout(db, self.statement_timeout) as batch_db:
+                return query(batch_db, days_sql(days))
+        except Exception as error:
+            if not too_big(error):
+                raise
+        metrics.count("split", by="days")
+        half = len(days) // 2
+        return _concat(
+            [
+                self.query_days(db, some, days_sql, one_day, query)
+                for some in (days[:half], days[half:])
+            ]
+        )
+
+
+def _concat(results: list[pd.DataFrame]) -> pd.DataFrame:
+    # Empty results may lack the types of the others
+    nonempty = [result for result in results if len(result)] or results[:1]
+    if len(nonempty) == 1:
+        return nonempty[0]
+    if not isinstance(nonempty[0], pd.DataFrame):
+        return concat_tables(nonempty)  # Copied out as Arrow
+    return pd.concat(nonempty, ignore_index=True)
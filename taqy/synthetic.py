@@ -0,0 +1,341 @@
+import io
+import string
+import datetime
+import itertools
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Synthetic TAQ data, for trying out and timing our queries without WRDS.
+
+synthetic_day() makes a day of trades and NBBO quotes shaped like the WRDS ctm_YYYYMMDD and
+complete_nbbo_YYYYMMDD tables, and load_synthetic_day() puts them in a PostgreSQL database
+of our own, which LocalConnection then lets taqy query as it would WRDS.
+
+The data are only realistic in the ways that matter to the cost of our queries: a few
+tickers are far busier than the rest, activity bunches up at the open and close, some
+trades and quotes fall outside regular hours, several may share a microsecond, and trades
+happen at the prevailing bid or ask.
+"""
+
+# Rough shares of trades reported by each exchange.  D is FINRA's off-exchange facility.
+EXCHANGES = {
+    "D": 0.30,
+    "Q": 0.20,
+    "N": 0.12,
+    "P": 0.10,
+    "Z": 0.08,
+    "K": 0.07,
+    "V": 0.05,
+    "J": 0.04,
+    "Y": 0.04,
+}
+
+# TAQ days run from 4AM to 8PM, with regular trading from 9:30 to 16:00
+_DAY_START_US = 4 * 3600 * 10**6
+_DAY_END_US = 20 * 3600 * 10**6
+_OPEN_US = (9 * 3600 + 30 * 60) * 10**6
+_CLOSE_US = 16 * 3600 * 10**6
+
+
+def synthetic_tickers(n: int) -> list[str]:
+    """`n` distinct ticker symbols, starting with some familiar ones"""
+    familiar = ["SPY", "JPM", "LLY"]
+    made_up = map("".join, itertools.product(string.ascii_uppercase, repeat=4))
+    return familiar[:n] + list(itertools.islice(made_up, max(n - len(familiar), 0)))
+
+
+def _event_times(
+    rng: np.random.Generator,
+    n: int,
+    extended_hours_share: float,
+    same_time_share: float,
+) -> np.ndarray:
+    """
+    `n` sorted times of day in microseconds, busiest around the open and close, with a
+    share of them outside regular hours and another share repeating the time before them
+    """
+    regular_us = _CLOSE_US - _OPEN_US
+    extended_us = _DAY_END_US - _DAY_START_US - regular_us
+    regular = rng.random(n) >= extended_hours_share
+    us = np.where(
+        regular,
+        _OPEN_US + rng.beta(0.7, 0.7, n) * regular_us,
+        _DAY_START_US + rng.random(n) * extended_us,
+    ).astype(np.int64)
+    # Outside regular hours, skip over them
+    us = np.where(~regular & (us >= _OPEN_US), us + regular_us, us)
+    us.sort()
+    repeats = np.flatnonzero(rng.random(n) < same_time_share)
+    repeats = repeats[repeats > 0]
+    us[repeats] = us[repeats - 1]
+    return us
+
+
+def _by_ticker(
+    rng: np.random.Generator,
+    tickers: list[str],
+    per_second: float,
+    extended_hours_share: float,
+    same_time_share: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Ticker numbers and times of events happening `per_second` on average per ticker over
+    regular hours, with the i-th ticker about i times less busy than the first
+    """
+    weights = 1.0 / np.arange(1, len(tickers) + 1)
+    per_ticker = weights / weights.sum() * len(tickers) * per_second
+    counts = rng.poisson(per_ticker * (_CLOSE_US - _OPEN_US) / 10**6)
+    ticker_ids = np.repeat(np.arange(len(tickers)), counts)
+    times = [
+        _event_times(rng, count, extended_hours_share, same_time_share)
+        for count in counts
+    ]
+    return ticker_ids, np.concatenate(times) if times else np.empty(0, np.int64)
+
+
+def _frame(
+    date: datetime.date,
+    tickers: list[str],
+    ticker_ids: np.ndarray,
+    us: np.ndarray,
+    nanos: np.ndarray | None,
+    columns: dict,
+) -> pd.DataFrame:
+    """A table of events in time order, as WRDS has them"""
+    order = np.lexsort((ticker_ids, us))
+    df = pd.DataFrame(
+        {
+            "date": pd.Timestamp(date),
+            "time_m": pd.to_timedelta(us[order], unit="us"),
+            **({} if nanos is None else {"time_m_nano": nanos[order]}),
+            "sym_root": np.array(tickers, dtype=object)[ticker_ids[order]],
+            "sym_suffix": None,
+            **{name: values[order] for name, values in columns.items()},
+        }
+    )
+    return df
+
+
+def synthetic_day(
+    date: datetime.date,
+    tickers: int | list[str] = 10,
+    trades_per_second: float = 1.0,
+    quotes_per_second: float = 10.0,
+    exchanges: dict[str, float] = EXCHANGES,
+    nanoseconds: bool = True,
+    extended_hours_share: float = 0.05,
+    same_time_share: float = 0.05,
+    seed: int = 0,
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    A day of synthetic trades and NBBO quotes for `tickers`, or that many made up ones,
+    as (ctm, complete_nbbo) tables.  Rates are averages per ticker over regular trading
+    hours, and `exchanges` maps each exchange to its share of trades.  Without
+    `nanoseconds` the tables have no time_m_nano column, as in years before 2016.
+
+    time_m is a timedelta since midnight, which load_synthetic_day() makes a time.
+    """
+    tickers = synthetic_tickers(tickers) if isinstance(tickers, int) else list(tickers)
+    rng = np.random.default_rng(seed)
+
+    # Quotes: each ticker's mid price wanders from an opening quote at 4AM, with a
+    # spread of a cent or a few
+    quote_tickers, quote_us = _by_ticker(
+        rng, tickers, quotes_per_second, extended_hours_share, same_time_share
+    )
+    quote_tickers = np.concatenate([np.arange(len(tickers)), quote_tickers])
+    quote_us = np.concatenate(
+        [np.full(len(tickers), _DAY_START_US, dtype=np.int64), quote_us]
+    )
+    by_ticker = np.lexsort((quote_us, quote_tickers))
+    quote_tickers, quote_us = quote_tickers[by_ticker], quote_us[by_ticker]
+    num_quotes = len(quote_us)
+
+    opening_mid = np.round(np.exp(rng.uniform(np.log(10), np.log(1000), len(tickers))))
+    steps = rng.normal(0.0, 2e-4, num_quotes)
+    first = np.flatnonzero(np.r_[True, quote_tickers[1:] != quote_tickers[:-1]])
+    steps[first] = 0.0
+    walk = np.cumsum(steps)
+    walk -= np.repeat(walk[first], np.diff(np.r_[first, num_quotes]))
+    mid = opening_mid[quote_tickers] * np.exp(walk)
+    spread = 0.01 * rng.geometric(0.6, num_quotes)
+    best_bid = np.round(mid - spread / 2, 2)
+    best_ask = np.round(best_bid + spread, 2)
+
+    nbbo = _frame(
+        date,
+        tickers,
+        quote_tickers,
+        quote_us,
+        rng.integers(0, 1000, num_quotes, dtype=np.int16) if nanoseconds else None,
+        {
+            "qu_cond": np.full(num_quotes, "R", dtype=object),
+            "best_bid": best_bid,
+            "best_bidsizeshares": 100 * rng.geometric(0.3, num_quotes),
+            "best_ask": best_ask,
+            "best_asksizeshares": 100 * rng.geometric(0.3, num_quotes),
+        },
+    )
+
+    # Trades: at the prevailing bid or ask, now and then at the midpoint, mostly in
+    # round lots
+    trade_tickers, trade_us = _by_ticker(
+        rng, tickers, trades_per_second, extended_hours_share, same_time_share
+    )
+    num_trades = len(trade_us)
+    quote_keys = quote_tickers * _DAY_END_US + quote_us
+    prevailing = np.searchsorted(
+        quote_keys, trade_tickers * _DAY_END_US + trade_us, side="right"
+    )
+    prevailing = np.maximum(prevailing - 1, 0)
+    side = rng.random(num_trades)
+    price = np.where(
+        side < 0.45,
+        best_bid[prevailing],
+        np.where(
+            side < 0.9,
+            best_ask[prevailing],
+            np.round((best_bid[prevailing] + best_ask[prevailing]) / 2, 4),
+        ),
+    )
+    size = np.where(
+        rng.random(num_trades) < 0.4,
+        rng.integers(1, 100, num_trades),
+        100 * rng.geometric(0.5, num_trades),
+    )
+    exchange_names = list(exchanges)
+    exchange_shares = np.array(list(exchanges.values()), dtype=float)
+
+    ctm = _frame(
+        date,
+        tickers,
+        trade_tickers,
+        trade_us,
+        rng.integers(0, 1000, num_trades, dtype=np.int16) if nanoseconds else None,
+        {
+            "ex": rng.choice(
+                exchange_names, num_trades, p=exchange_shares / exchange_shares.sum()
+            ).astype(object),
+            "tr_scond": np.full(num_trades, "@", dtype=object),
+            "size": size,
+            "price": price,
+            "tr_corr": np.full(num_trades, "00", dtype=object),
+        },
+    )
+    ctm["tr_seqnum"] = np.arange(1, num_trades + 1)
+    nbbo["qu_seqnum"] = np.arange(1, num_quotes + 1)
+    return ctm, nbbo
+
+
+_COLUMN_TYPES = {
+    "date": "DATE",
+    "time_m": "BIGINT",  # Microseconds until loaded, then TIME
+    "time_m_nano": "SMALLINT",
+    "ex": "VARCHAR(1)",
+    "sym_root": "VARCHAR(6)",
+    "sym_suffix": "VARCHAR(10)",
+    "tr_scond": "VARCHAR(4)",
+    "size": "INTEGER",
+    "price": "NUMERIC(11,4)",
+    "tr_corr": "VARCHAR(2)",
+    "tr_seqnum": "BIGINT",
+    "qu_cond": "VARCHAR(1)",
+    "qu_seqnum": "BIGINT",
+    "best_bid": "NUMERIC(11,4)",
+    "best_bidsizeshares": "INTEGER",
+    "best_ask": "NUMERIC(11,4)",
+    "best_asksizeshares": "INTEGER",
+}
+
+
+def load_table(db, library: str, table: str, df: pd.DataFrame, index: bool = True):
+    """
+    Replace `library`.`table` with `df`, one of the tables from synthetic_day(), using
+    COPY.  With `index`, the table is indexed by sym_root so that queries on a few
+    tickers need not read all of it.
+    """
+    connection = db.connection
+    columns = ", ".join(f"{name} {_COLUMN_TYPES[name]}" for name in df.columns)
+    connection.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {library}")
+    connection.exec_driver_sql(f"DROP TABLE IF EXISTS {library}.{table}")
+    connection.exec_driver_sql(f"CREATE TABLE {library}.{table} ({columns})")
+
+    csv = io.StringIO()
+    df.assign(
+        date=np.datetime_as_string(df["date"].to_numpy(), unit="D"),
+        time_m=df["time_m"].to_numpy(dtype="timedelta64[us]").view(np.int64),
+    ).to_csv(csv, index=False, header=False)
+    csv.seek(0)
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {library}.{table} FROM STDIN WITH (FORMAT csv)", csv)
+    finally:
+        cursor.close()
+
+    connection.exec_driver_sql(
+        f"""ALTER TABLE {library}.{table}
+        ALTER COLUMN time_m TYPE TIME USING '00:00'::time + time_m * '1 microsecond'::interval"""
+    )
+    if index:
+        connection.exec_driver_sql(
+            f"CREATE INDEX ON {library}.{table} (sym_root, time_m)"
+        )
+    connection.exec_driver_sql(f"ANALYZE {library}.{table}")
+
+
+def load_synthetic_day(db, ctm: pd.DataFrame, nbbo: pd.DataFrame, index: bool = True):
+    """Store tables from synthetic_day() where taqy looks for that day's data"""
+    date = ctm["date"].iloc[0] if len(ctm) else nbbo["date"].iloc[0]
+    library = f"taqm_{date.strftime('%Y')}"
+    load_table(db, library, f"ctm_{date.strftime('%Y%m%d')}", ctm, index)
+    load_table(db, library, f"complete_nbbo_{date.strftime('%Y%m%d')}", nbbo, index)
+
+
+class LocalConnection:
+    """
+    Just enough of a wrds Connection for taqy, on a PostgreSQL database of our own given
+    by its SQLAlchemy `url`, such as one holding synthetic tables
+    """
+
+    def __init__(self, url: str):
+        self.engine = sa.create_engine(url, isolation_level="AUTOCOMMIT")  # As wrds
+        self.connection = self.engine.connect()
+
+    def raw_sql(
+        self,
+        sql: str,
+        coerce_float: bool = True,
+        date_cols: list[str] | None = None,
+        index_col: str | list[str] | None = None,
+        params: dict | None = None,
+        dtype_backend: str = "numpy_nullable",  # As wrds.Connection.raw_sql() does
+    ) -> pd.DataFrame:
+        return pd.read_sql_query(
+            sql,
+            self.connection,
+            coerce_float=coerce_float,
+            parse_dates=date_cols,
+            index_col=index_col,
+            params=params,
+            dtype_backend=dtype_backend,
+        )
+
+    def describe_table(self, library: str, table: str) -> pd.DataFrame:
+        columns = sa.inspect(self.connection).get_columns(table, schema=library)
+        return pd.DataFrame.from_records(
+            columns, columns=["name", "nullable", "type", "comment"]
+        )
+
+    def list_tables(self, library: str) -> list[str]:
+        return sa.inspect(self.connection).get_table_names(schema=library)
+
+    def close(self):
+        self.connection.close()
+        self.engine.dispose()
@@ -0,0 +1,277 @@
+import io
+import re
+import contextlib
+
+import numpy as np
+import pandas as pd
+import sqlalchemy as sa
+
+from .session import Session
+from .utils import (
+    CATEGORICAL_COLUMNS,
+    INTEGER_COLUMNS,
+    NEW_YORK,
+    PRICE_COLUMNS,
+    QUANTILE_VALUES,
+    SINGLE_PRECISION_COLUMNS,
+    single_precision,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:  # Only needed to COPY results, or return bars in Arrow
+    pa = None
+
+try:
+    import polars as pl
+except ImportError:  # Only needed to return bars as polars DataFrames
+    pl = None
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+"""
+Query results copied out of PostgreSQL in bulk.  Rather than have the driver make a Python
+object of every value and pandas gather them back up into columns, the server streams the
+whole result as CSV from `COPY (...) TO STDOUT`, and pyarrow parses it into typed columns,
+on several threads at once.
+
+Bars wanted as Arrow or polars need never become pandas DataFrames at all: the tables
+copied out are cached, finished and trimmed as they are, by the functions below.
+"""
+
+TRANSFER_METHODS = ("raw_sql", "copy")
+OUTPUTS = ("pandas", "arrow", "polars")
+
+# Bar columns of double precision, whatever values they hold
+_FLOAT_COLUMNS = (*PRICE_COLUMNS, *SINGLE_PRECISION_COLUMNS)
+_QUANTILE_COLUMN = re.compile(rf"(?:{'|'.join(QUANTILE_VALUES)})_q[\d_]+")
+
+# The pandas types raw_sql() gives for those of pyarrow, nullable as WRDS makes them
+_PANDAS_TYPES = {
+    "int64": pd.Int64Dtype(),
+    "double": pd.Float64Dtype(),
+    "string": pd.StringDtype("python"),
+}
+
+
+def arrow_type(
+    name: str, time_cols: tuple[str], date_cols: tuple[str]
+) -> "pa.DataType | None":
+    """The type of the bar column `name`, or None if pyarrow is to work it out"""
+    if name in date_cols:
+        return pa.timestamp("ns")
+    if name in time_cols:
+        return pa.time64("us")
+    if name in CATEGORICAL_COLUMNS:
+        return pa.string()
+    if name in INTEGER_COLUMNS or name.endswith("_ns"):
+        return pa.int64()
+    if name in _FLOAT_COLUMNS or _QUANTILE_COLUMN.fullmatch(name):
+        return pa.float64()
+    return None
+
+
+def copy_csv(db, sql: str) -> bytes:
+    """
+    The result of `sql` as CSV with a header line, as copied out by the PostgreSQL server
+    behind `db`.  Errors are raised as SQLAlchemy's, as from raw_sql().
+    """
+    checkout = (
+        db.connection() if isinstance(db, Session) else contextlib.nullcontext(db)
+    )
+    with checkout as db:
+        connection = db.connection
+        copy = f"COPY ({sql}\n) TO STDOUT WITH (FORMAT csv, HEADER)"
+        buffer = io.BytesIO()
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(copy, buffer)
+        except connection.dialect.loaded_dbapi.Error as error:
+            raise sa.exc.DBAPIError.instance(
+                copy, None, error, connection.dialect.loaded_dbapi.Error
+            ) from error
+        finally:
+            cursor.close()
+    return buffer.getvalue()
+
+
+def csv_to_arrow(
+    csv: bytes, time_cols: tuple[str], date_cols: tuple[str]
+) -> "pa.Table":
+    """
+    A table of the result copied by copy_csv(), its bar columns of fixed types and times
+    of day parsed along with everything else
+    """
+    if pa is None:
+        raise ImportError("Copying results requires pyarrow: pip install pyarrow")
+    header = csv[: csv.find(b"\n")].decode()
+    types = {
+        name: arrow_type(name, time_cols, date_cols)
+        for name in (name.strip('"') for name in header.split(","))
+    }
+    options = pa_csv.ConvertOptions(
+        column_types={name: t for name, t in types.items() if t is not None},
+        # Unquoted empty fields are NULL, quoted ones empty strings
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=False,
+    )
+    return pa_csv.read_csv(pa.BufferReader(csv), convert_options=options)
+
+
+def arrow_to_pandas(table: "pa.Table") -> pd.DataFrame:
+    """`table` with the pandas types raw_sql() would have given, and times as datetime.time"""
+    df = table.to_pandas(
+        types_mapper=lambda t: _PANDAS_TYPES.get(str(t)),
+        coerce_temporal_nanoseconds=True,
+    )
+    for field in table.schema:
+        if pa.types.is_time(field.type) and table[field.name].null_count:
+            # Missing times are NaT, as pandas parses them from strings
+            df[field.name] = df[field.name].where(df[field.name].notna(), pd.NaT)
+    return df
+
+
+def check_output(output: str):
+    if output not in OUTPUTS:
+        raise ValueError(f"No output {output!r}, only {OUTPUTS}")
+
+
+def pandas_to_table(df: pd.DataFrame) -> "pa.Table":
+    """A query result fetched as a pandas DataFrame, as the table COPY would have given"""
+    # Nothing about pandas to carry along, such as its index
+    return pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+
+
+def _dictionary_encoded(table: "pa.Table") -> "pa.Table":
+    for i, name in enumerate(table.column_names):
+        column = table.column(i)
+        if name in CATEGORICAL_COLUMNS and not pa.types.is_dictionary(column.type):
+            table = table.set_column(i, name, column.dictionary_encode())
+    return table.replace_schema_metadata(None)
+
+
+def pandas_to_arrow(df: pd.DataFrame) -> "pa.Table":
+    """
+    `df` as an Arrow table, its tickers and exchanges dictionary encoded and its timestamps
+    nanoseconds, timezone and all, ready to write to Parquet or IPC as is
+    """
+    if pa is None:
+        raise ImportError("Arrow output requires pyarrow: pip install pyarrow")
+    return _dictionary_encoded(pandas_to_table(df))
+
+
+def as_output(result: "pd.DataFrame | pa.Table", output: str):
+    """
+    `result`, a pandas DataFrame or an Arrow table, as a pandas DataFrame, an Arrow table or
+    a polars DataFrame, as `output` says.  Arrow tables, such as those copied out by COPY,
+    become Arrow or polars output without passing through pandas, whereas DataFrames are
+    converted, for a moment needing both copies.
+    """
+    check_output(output)
+    if isinstance(result, pd.DataFrame):
+        if output == "pandas":
+            return result
+        table = pandas_to_arrow(result)
+    elif output == "pandas":
+        return arrow_to_pandas(result)
+    else:
+        table = _dictionary_encoded(result)
+    if output == "arrow":
+        return table
+    if pl is None:
+        raise ImportError("Polars output requires polars: pip install polars")
+    return pl.from_arrow(table)
+
+
+def concat_tables(tables: list["pa.Table"]) -> "pa.Table":
+    """`tables` one after another, columns of empty ones without types taking the others'"""
+    try:
+        return pa.concat_tables(tables, promote_options="default")
+    except TypeError:  # pyarrow before 14
+        return pa.concat_tables(tables, promote=True)
+
+
+def sort_table(table: "pa.Table", keys: list[str]) -> "pa.Table":
+    """`table` sorted by its `keys` columns, rows alike in those keeping their order"""
+    return table.sort_by([(key, "ascending") for key in keys])
+
+
+def table_groups(table: "pa.Table", keys: list[str]) -> dict[tuple, "pa.Table"]:
+    """
+    The rows of `table` for each distinct combination of values of its `keys` columns, keyed
+    by those values as Python objects.  Each group is a slice of one copy of `table` sorted
+    by its `keys`, its rows in the order they had.
+    """
+    if not len(table):
+        return {}
+    table = sort_table(table, keys)
+    changed = np.zeros(len(table) - 1, dtype=bool)
+    for key in keys:
+        column = table[key]
+        following, preceding = column.slice(1), column.slice(0, len(table) - 1)
+        changed |= pc.not_equal(following, preceding).to_numpy(zero_copy_only=False)
+    starts = [0, *(np.flatnonzero(changed) + 1), len(table)]
+    return {
+        tuple(table[key][start].as_py() for key in keys): table.slice(
+            start, end - start
+        )
+        for start, end in zip(starts[:-1], starts[1:])
+    }
+
+
+def localize_table(table: "pa.Table", name: str) -> "pa.Table":
+    """As localize_new_york(), for the column `name` of `table`"""
+    localized = pc.assume_timezone(table[name], timezone=NEW_YORK.zone)
+    return table.set_column(table.schema.get_field_index(name), name, localized)
+
+
+def table_timestamps(table: "pa.Table", field_name_root: str) -> "pa.Table":
+    """
+    As make_timestamps(), for `table`, with the times of day of the column `field_name_root`
+    replaced by the timestamps and their extra nanoseconds dropped
+    """
+    times_ns = pc.multiply(pc.cast(table[field_name_root], pa.int64()), 1000)
+    wall_clock_ns = pc.add(pc.cast(table["date"], pa.int64()), times_ns)
+    extra_ns = pc.fill_null(table[f"{field_name_root}_ns"].cast(pa.int64()), 0)
+    # Missing times of day stay missing
+    timestamps = pc.add(wall_clock_ns, extra_ns).cast(pa.timestamp("ns"))
+    table = table.set_column(
+        table.schema.get_field_index(field_name_root), field_name_root, timestamps
+    )
+    table = localize_table(table, field_name_root)
+    return table.select(
+        [name for name in table.column_names if name != f"{field_name_root}_ns"]
+    )
+
+
+def compact_table(table: "pa.Table") -> "pa.Table":
+    """
+    As compact_bars(), for `table`, tickers and exchanges dictionary encoded with indices
+    as narrow as the codes of pandas categoricals.  Missing values are nulls in Arrow
+    whatever the type.
+    """
+    int32 = np.iinfo(np.int32)
+    for i, name in enumerate(table.column_names):
+        if name in CATEGORICAL_COLUMNS and pa.types.is_string(table.schema[i].type):
+            categories = len(pc.unique(table[name]).drop_null())
+            indices = next(
+                t
+                for t in (pa.int8(), pa.int16(), pa.int32())
+                if categories < np.iinfo(t.to_pandas_dtype()).max
+            )
+            encoded = table[name].dictionary_encode()
+            encoded = encoded.cast(pa.dictionary(indices, encoded.type.value_type))
+            table = table.set_column(i, name, encoded)
+        elif name in INTEGER_COLUMNS:
+            extremes = pc.min_max(table[name]).as_py()
+            if extremes["min"] is None or (
+                int32.min <= extremes["min"] and extremes["max"] <= int32.max
+            ):
+                table = table.set_column(i, name, table[name].cast(pa.int32()))
+        elif single_precision(name) and pa.types.is_floating(table.schema[i].type):
+            table = table.set_column(i, name, table[name].cast(pa.float32()))
+    return table
@@ -1,10 +1,49 @@
+import os
+import re
+import queue
 import datetime
-import pytz
+import itertools
+import contextvars
+from typing import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import wrds
 
-from .utils import HidePrinting, _make_timestamp
+from . import metrics
+from .local import TAQFiles
+from .cache import (
+    MemoryCache,
+    ParquetCache,
+    SchemaCache,
+    DEFAULT_DISK_CACHE_BYTES,
+    frame_bytes,
+)
+from .rollup import finer_bar_minutes, rollup_nbbo_bars, rollup_trade_bars
+from .session import Session
+from .splitting import QuerySplitter
+from .transfer import (
+    TRANSFER_METHODS,
+    arrow_to_pandas,
+    as_output,
+    compact_table,
+    concat_tables,
+    copy_csv,
+    csv_to_arrow,
+    localize_table,
+    pandas_to_table,
+    sort_table,
+    table_groups,
+    table_timestamps,
+)
+from .utils import (
+    QUANTILE_VALUES,
+    HidePrinting,
+    compact_bars,
+    localize_new_york,
+    make_timestamps,
+    quantile_columns,
+)
 
 # License: GPLv3 or later
 # Copyright 2025 by Brian K. Boonstra
@@ -20,8 +59,19 @@ Information about the source data set is mainly available from NYSE at:
 https://www.nyse.com/publicdocs/nyse/data/Daily_TAQ_Client_Spec_v3.0.pdf
 """
 
-DEFAULT_WRDS_CONNECTION: wrds.sql.Connection | None = None
-CACHED_QUERIES: dict[str, pd.DataFrame] = {}
+# Anything we accept as wrds_db
+Connectable = wrds.sql.Connection | Session | TAQFiles
+
+DEFAULT_WRDS_CONNECTION: Connectable | None = None
+CACHED_QUERIES: MemoryCache = MemoryCache()
+DISK_CACHE: ParquetCache | None = None
+SCHEMA_CACHE: SchemaCache = SchemaCache()
+SPLITTER: QuerySplitter | None = None
+TRANSFER: str = "raw_sql"
+
+# Regular trading hours, as wall clock times in New York
+MARKET_OPEN = datetime.time(9, 30)
+MARKET_CLOSE = datetime.time(16, 0)
 
 TIME_COLUMNS = ("time_m", "time_of_last_quote", "last_trade_time", "first_trade_time")
 DATE_COLUMNS = (
@@ -29,67 +79,569 @@ DATE_COLUMNS = (
     "window_time",
 )
 
+# The aggregate computing each statistic of the trades in a bar
+TRADE_STATISTICS = {
+    "num_trades": "COUNT(size)",
+    "total_qty": "SUM(size)",
+    "vwap": "SUM(price * size) / SUM(size)",
+    "mean_price_ignoring_size": "AVG(price)",
+    "median_size": "PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY size)",
+    "median_price": "PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price)",
+    "median_notional": "PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price*size)",
+    "max_price": "MAX(price)",
+    "min_price": "MIN(price)",
+    "max_size": "MAX(size)",
+    "min_size": "MIN(size)",
+}
+MEDIAN_COLUMNS = ("median_size", "median_price", "median_notional")
+
+# Named sets of statistics.  Each median sorts the trades of every bar, whereas the
+# other statistics can all be added up in a single pass over them.
+STATISTIC_SETS = {
+    "all": tuple(TRADE_STATISTICS),
+    "cheap": tuple(name for name in TRADE_STATISTICS if name not in MEDIAN_COLUMNS),
+    "medians": MEDIAN_COLUMNS,
+}
+
+# Ways of finding the first and last trades of each bar, as for taq_trade_bars_sql()
+FIRST_LAST_METHODS = ("windows", "aggregates")
+
+# Columns of the bars besides the ticker, date, window_time (and ex) identifying each
+TRADE_BAR_COLUMNS = tuple(TRADE_STATISTICS)
+FIRST_LAST_COLUMNS = (
+    "first_trade_price",
+    "first_trade_size",
+    "first_trade_time",
+    "last_trade_price",
+    "last_trade_size",
+    "last_trade_time",
+)
+NBBO_BAR_COLUMNS = (
+    "best_bid",
+    "best_bidsizeshares",
+    "best_ask",
+    "best_asksizeshares",
+    "time_of_last_quote",
+)
+
+# The aggregate computing each statistic of the quotes in a bar, from windowable_nbbo.
+# Quotes are weighted by the seconds they stood within the bar, and only those with both
+# a bid and an offer count towards spreads and midquotes.  The first has the highest
+# rownum, counting back from the last.
+TWO_SIDED = "FILTER (WHERE best_bid > 0 AND best_ask > 0)"
+QUOTE_STATISTICS = {
+    "num_quotes": "COUNT(*)",
+    "time_weighted_spread": f"SUM(quote_seconds * (best_ask - best_bid)) {TWO_SIDED} / NULLIF(SUM(quote_seconds) {TWO_SIDED}, 0)",
+    "time_weighted_midquote": f"SUM(quote_seconds * (best_ask + best_bid) / 2) {TWO_SIDED} / NULLIF(SUM(quote_seconds) {TWO_SIDED}, 0)",
+    "min_midquote": f"MIN((best_ask + best_bid) / 2) {TWO_SIDED}",
+    "max_midquote": f"MAX((best_ask + best_bid) / 2) {TWO_SIDED}",
+    "first_midquote": f"(MAX(ARRAY[rownum, (best_ask + best_bid) / 2]) {TWO_SIDED})[2]",
+}
+
 ##########################
 # Connection management ##
 ##########################
 
 
-def set_default_connection(cnxn: wrds.sql.Connection):
+def set_default_connection(cnxn: Connectable):
     global DEFAULT_WRDS_CONNECTION
     print(f"Setting default WRDS connection to a {cnxn.__class__}")
     DEFAULT_WRDS_CONNECTION = cnxn
 
 
+def _is_closed(db: Connectable) -> bool:
+    return db.closed if isinstance(db, (Session, TAQFiles)) else db.connection.closed
+
+
 def get_wrds_connection(
-    wrds_db: wrds.sql.Connection | None = None,
-) -> wrds.sql.Connection:
+    wrds_db: Connectable | None = None,
+) -> Connectable:
     db = wrds_db or DEFAULT_WRDS_CONNECTION
     if db is None:
         raise ValueError(
             "Please initialize the module-level DB with connect_to_wrds(...), or specify a wrds Connection object to use as wrds_db"
         )
-    elif db.connection.closed:
+    elif _is_closed(db):
         raise ValueError("The database connection has been closed.  Please reconnect.")
     return db
 
 
-def connect_to_wrds(reconnect: bool = False, **kwargs):
-    if DEFAULT_WRDS_CONNECTION is None or DEFAULT_WRDS_CONNECTION.connection.closed:
+def connect_to_wrds(reconnect: bool = False, pool_size: int = 1, **kwargs):
+    """
+    Make the module default connection a Session of up to `pool_size` WRDS connections, which
+    reconnects by itself if need be, and caches results in CACHED_QUERIES.  Keyword arguments
+    are passed to wrds.Connection.
+    """
+    if DEFAULT_WRDS_CONNECTION is None or _is_closed(DEFAULT_WRDS_CONNECTION):
         reconnect = True
     if reconnect:
-        set_default_connection(wrds.Connection(**kwargs))
+        set_default_connection(
+            Session(pool_size=pool_size, cache=CACHED_QUERIES, **kwargs)
+        )
 
 
-def cached_sql(
-    db: wrds.sql.Connection,
+def _describe_table(db: Connectable, library: str, table: str) -> pd.DataFrame:
+    with metrics.measure("describe_table", table=f"{library}.{table}"):
+        if isinstance(db, Session):
+            return db.describe_table(library=library, table=table)  # Already quiet
+        with HidePrinting():
+            return db.describe_table(library=library, table=table)
+
+
+def table_columns(db: Connectable, library: str, table: str) -> frozenset[str]:
+    """
+    Names of the columns in `library`.`table`, asking the database only the first time
+    """
+    columns = SCHEMA_CACHE.get(library, table)
+    if columns is None:
+        columns = frozenset(_describe_table(db, library, table).name)
+        SCHEMA_CACHE.put(library, table, columns)
+    return columns
+
+
+def prewarm_schema_cache(
+    years: int | list[int], wrds_db: Connectable | None = None
+) -> int:
+    """
+    Learn the columns of every table in the taqm_YYYY library for each of `years`, using a
+    single query per library, so that later bar queries need no table lookups at all.
+    Returns the number of tables found.
+    """
+    db = get_wrds_connection(wrds_db)
+    num_tables = 0
+    for year in [years] if isinstance(years, int) else years:
+        library = f"taqm_{year}"
+        columns = db.raw_sql(f"""SELECT table_name, column_name
+                FROM information_schema.columns
+                WHERE table_schema = '{library}'""")
+        tables = columns.groupby("table_name")["column_name"].agg(frozenset)
+        SCHEMA_CACHE.update(library, tables.to_dict())
+        num_tables += len(tables)
+    return num_tables
+
+
+def set_disk_cache(
+    directory: str | None = None,
+    max_bytes: int | None = DEFAULT_DISK_CACHE_BYTES,
+) -> ParquetCache:
+    """
+    Persist query results as Parquet files under `directory` (by default $TAQY_CACHE_DIR or
+    ~/.cache/taqy) so that later Python sessions need not go back to WRDS for them.  Once the
+    cache holds more than `max_bytes`, least recently used results are discarded.
+    """
+    global DISK_CACHE, SCHEMA_CACHE
+    DISK_CACHE = ParquetCache(directory=directory, max_bytes=max_bytes)
+    SCHEMA_CACHE = SchemaCache(directory=os.path.join(DISK_CACHE.directory, "schemas"))
+    return DISK_CACHE
+
+
+def disable_disk_cache():
+    global DISK_CACHE, SCHEMA_CACHE
+    DISK_CACHE = None
+    SCHEMA_CACHE = SchemaCache()
+
+
+def set_adaptive_splitting(
+    statement_timeout: float | None = 600.0,
+    retries: int = 2,
+    backoff: float = 10.0,
+) -> QuerySplitter:
+    """
+    Have WRDS abandon bar queries running longer than `statement_timeout` seconds, and
+    should one time out or run out of memory, get its bars from smaller queries instead:
+    first of fewer tickers, then of fewer bars.  See QuerySplitter.
+    """
+    global SPLITTER
+    SPLITTER = QuerySplitter(statement_timeout, retries, backoff)
+    return SPLITTER
+
+
+def disable_adaptive_splitting():
+    global SPLITTER
+    SPLITTER = None
+
+
+def set_transfer_method(method: str):
+    """
+    How query results come back from WRDS: "raw_sql", through the database driver row by
+    row, or "copy", in bulk as CSV from PostgreSQL's COPY command, parsed by pyarrow.  The
+    results are the same either way.
+    """
+    global TRANSFER
+    if method not in TRANSFER_METHODS:
+        raise ValueError(f"No transfer method {method!r}, only {TRANSFER_METHODS}")
+    TRANSFER = method
+
+
+def _parse_time_columns(df: pd.DataFrame, time_cols: tuple[str]) -> pd.DataFrame:
+    with metrics.measure("parse_times") as event:
+        event.rows = len(df)
+        # WRDS itself has no support for time-of-day columns
+        for time_col in time_cols:
+            if time_col in df.columns:
+                df[time_col] = pd.to_datetime(
+                    df[time_col], format="%H:%M:%S.%f"
+                ).dt.time
+    return df
+
+
+def query_sql(
+    db: Connectable,
     sql: str,
     time_cols: tuple[str] = TIME_COLUMNS,
     date_cols: tuple[str] = DATE_COLUMNS,
-):
+) -> pd.DataFrame:
     """
-    Query WRDS with reasonable parameters for our purposes
+    Query WRDS with reasonable parameters for our purposes, bypassing the caches
 
     TODO: If sqlalchemy ever works nicely with decimal types, start using those
     """
+    if TRANSFER == "copy":
+        return _copy_sql(db, sql, time_cols, date_cols)
+
+    # Server execution and transfer of the results, which the driver does all at once
+    with metrics.measure("query") as event:
+        df = db.raw_sql(
+            sql,
+            coerce_float=True,  # This is the default but let's remember it's being done
+            date_cols=list(date_cols),
+        )
+        event.rows = len(df)
+        if metrics.enabled():
+            event.bytes = frame_bytes(df)
+    return _parse_time_columns(df, time_cols)
+
+
+def _copy_sql(
+    db: Connectable,
+    sql: str,
+    time_cols: tuple[str] = TIME_COLUMNS,
+    date_cols: tuple[str] = DATE_COLUMNS,
+    to_pandas: bool = True,
+):
+    """The result of `sql` copied out in bulk, as a pandas DataFrame or an Arrow table"""
+    with metrics.measure("query") as event:
+        csv = copy_csv(db, sql)
+        event.bytes = len(csv)
+    with metrics.measure("decode") as event:
+        result = csv_to_arrow(csv, time_cols, date_cols)
+        if to_pandas:
+            result = arrow_to_pandas(result)
+        event.rows = len(result)
+    return result
+
+
+def _copy_table(db: Connectable, sql: str):
+    return _copy_sql(db, sql, to_pandas=False)
+
+
+def _keeps_arrow(output: str) -> bool:
+    """Whether results for `output` are fetched, cached and finished as Arrow tables"""
+    return output != "pandas" and TRANSFER == "copy"
+
+
+def _in_format(result, arrow: bool):
+    """A cached `result`, if any, as an Arrow table if `arrow`, or else a DataFrame"""
+    if result is None or isinstance(result, pd.DataFrame) != arrow:
+        return result
+    return pandas_to_table(result) if arrow else arrow_to_pandas(result)
+
+
+def _own_copy(bars):
+    """
+    `bars` no longer sharing the read-only buffers of the cache, as those concatenated
+    from several tickers' never do, so that callers may modify any bars in place
+    """
+    return bars.copy() if isinstance(bars, pd.DataFrame) else bars
+
+
+def _memory_cache(db: Connectable) -> MemoryCache:
+    return db.cache if isinstance(db, Session) else CACHED_QUERIES
+
+
+def _store_result(db: Connectable, sql: str, df: pd.DataFrame) -> pd.DataFrame:
+    if DISK_CACHE is not None:
+        DISK_CACHE.put(sql, df)
+    return _memory_cache(db).put(sql, df)
+
+
+def cached_sql(
+    db: Connectable,
+    sql: str,
+    time_cols: tuple[str] = TIME_COLUMNS,
+    date_cols: tuple[str] = DATE_COLUMNS,
+    output: str = "pandas",
+):
+    """
+    As query_sql(), but remembering results in memory and, if enabled, on disk.  With an
+    `output` of "arrow" or "polars", results copied out by COPY are kept as Arrow tables
+    throughout, never becoming pandas DataFrames.  Results are cached as they were
+    fetched, and converted as need be, as by as_output(), should they be wanted otherwise.
+    """
     # Standard lru_cache decorator will not play nice with the db arg.  No great
     # workaround at this time
-    if sql in CACHED_QUERIES:
-        return CACHED_QUERIES[sql].copy()
+    df = _memory_cache(db).get(sql)
+    if df is not None:
+        metrics.count("cache_hit", cache="memory")
+        return as_output(df, output)
+
+    df = DISK_CACHE.get(sql) if DISK_CACHE is not None else None
+    if df is not None:
+        metrics.count("cache_hit", cache="disk")
+        return as_output(_memory_cache(db).put(sql, df), output)
+
+    metrics.count("cache_miss")
+    if _keeps_arrow(output):
+        result = _copy_sql(db, sql, time_cols, date_cols, to_pandas=False)
+    else:
+        result = query_sql(db, sql, time_cols, date_cols)
+    return as_output(_store_result(db, sql, result), output)
+
+
+def cached_result(db: Connectable, sql: str):
+    """
+    The result of `sql` if we have it in memory or on disk, without asking WRDS, as a
+    DataFrame or as an Arrow table, as it was fetched
+    """
+    memory_cache = _memory_cache(db)
+    df = memory_cache.get(sql) if sql in memory_cache else None
+    if df is not None:
+        metrics.count("cache_hit", cache="memory")
+        return df
+    if DISK_CACHE is not None and sql in DISK_CACHE:
+        df = DISK_CACHE.get(sql)
+        if df is not None:
+            metrics.count("cache_hit", cache="disk")
+            return memory_cache.put(sql, df)
+    metrics.count("cache_miss")
+    return None
+
+
+def _unique_tickers(tickers: list[str] | str) -> list[str]:
+    if hasattr(tickers, "strip"):  # Allow single ticker as argument
+        return [tickers]
+    return list(dict.fromkeys(tickers))
+
+
+def _sort_bars(bars: pd.DataFrame) -> pd.DataFrame:
+    """Put bars in the order WRDS returns them: by ticker, then bar, then exchange"""
+    if not isinstance(bars, pd.DataFrame):
+        return sort_table(bars, _bar_keys("ex" in bars.column_names))
+    keys = ["ticker", "date", "window_time"] + (["ex"] if "ex" in bars else [])
+    return bars.sort_values(keys, ignore_index=True, kind="stable")
+
+
+def _concat_bars(bars: list) -> pd.DataFrame:
+    if bars and not isinstance(bars[0], pd.DataFrame):
+        return concat_tables(bars)
+    return pd.concat(bars, ignore_index=True)
+
+
+def _bar_keys(group_by_exchange: bool) -> list[str]:
+    return ["ticker", "date", "window_time"] + (["ex"] if group_by_exchange else [])
+
+
+def _shaped(
+    bars: pd.DataFrame,
+    columns: list[str] | None,
+    group_by_exchange: bool,
+    compact: bool,
+    output: str = "pandas",
+):
+    """
+    `bars`, a DataFrame or an Arrow table, cut down to their keys and `columns`, if given,
+    made compact if asked, and as the `output` of as_output()
+    """
+    arrow = not isinstance(bars, pd.DataFrame)
+    if columns is not None:
+        wanted = list(dict.fromkeys(_bar_keys(group_by_exchange) + list(columns)))
+        if arrow:
+            bars = bars.select(wanted)
+        else:
+            # Ranges without any trading days have no columns at all
+            bars = bars[wanted] if len(bars.columns) else pd.DataFrame(columns=wanted)
+    if compact:
+        bars = compact_table(bars) if arrow else compact_bars(bars)
+    return as_output(bars, output)
+
+
+def _query_shape(ticker_sql: Callable[..., str]) -> str:
+    """What the queries of `ticker_sql` have in common, whatever their tickers and date"""
+    sql = ticker_sql("?")
+    return re.sub(r"taqm_\d{4}\.(\w+)_\d{8}", r"\1", sql)
+
 
-    df = db.raw_sql(
-        sql,
-        coerce_float=True,  # This is the default but let's remember it's being done
-        date_cols=list(date_cols),
+def _fetch_bars(
+    db: Connectable,
+    tickers: list[str],
+    ticker_sql: Callable[..., str],
+    edges: list[datetime.time] | None,
+    arrow: bool = False,
+) -> pd.DataFrame:
+    """
+    The result of `ticker_sql(tickers)` from WRDS, or with adaptive splitting enabled, of
+    as many queries of `ticker_sql(some_tickers, (start, end))` as it takes.  With `arrow`,
+    it is copied out as an Arrow table.
+    """
+    query = _copy_table if arrow else query_sql
+    if SPLITTER is None:
+        with metrics.measure("build_sql"):
+            sql = ticker_sql(tickers)
+        return query(db, sql)
+    return SPLITTER.query(
+        db, tickers, ticker_sql, edges, _query_shape(ticker_sql), query
     )
 
-    # WRDS itself has no support for time-of-day columns
-    for time_col in time_cols:
-        if time_col in df.columns:
-            df[time_col] = pd.to_datetime(df[time_col], format="%H:%M:%S.%f").dt.time
 
-    CACHED_QUERIES[sql] = df.copy()
+def _fetch_days(
+    db: Connectable,
+    missing: dict[datetime.date, list[str]],
+    day_sql: Callable[..., str],
+    edges: list[datetime.time] | None,
+    arrow: bool = False,
+) -> pd.DataFrame:
+    """
+    The bars of `day_sql(tickers, date)` for the `missing` tickers of each date, in a single
+    UNION ALL query, or with adaptive splitting enabled, in as many as it takes.  With
+    `arrow`, they are copied out as an Arrow table.
+    """
+    query = _copy_table if arrow else query_sql
+
+    def days_sql(dates: list[datetime.date]) -> str:
+        with metrics.measure("build_sql"):
+            return union_all_sql([day_sql(missing[date], date) for date in dates])
 
-    return df
+    if SPLITTER is None:
+        return query(db, days_sql(list(missing)))
+
+    def one_day(date: datetime.date) -> pd.DataFrame:
+        def ticker_sql(tickers: list[str] | str, *span) -> str:
+            return day_sql(tickers, date, *span)
+
+        return _fetch_bars(db, missing[date], ticker_sql, edges, arrow)
+
+    return SPLITTER.query_days(db, list(missing), days_sql, one_day, query)
+
+
+def _rows_of(fetched, wanted: list, by_date: bool = False):
+    """
+    (key, bars) of the `fetched` bars, a DataFrame or an Arrow table, for each of the
+    `wanted` tickers, or with `by_date`, the `wanted` (date, ticker) pairs
+    """
+    if not isinstance(fetched, pd.DataFrame):
+        groups = {}
+        keys = ["date", "ticker"] if by_date else ["ticker"]
+        for key, bars in table_groups(fetched, keys).items():
+            groups[(key[0].date(), key[1]) if by_date else key[0]] = bars
+        for key in wanted:
+            yield key, groups.get(key, fetched.slice(0, 0))
+        return
+
+    if by_date:
+        days = pd.to_datetime(fetched["date"]).dt.date
+        rows = (
+            fetched.groupby([days, "ticker"], sort=False).indices
+            if len(fetched)
+            else {}
+        )
+    else:
+        rows = fetched.groupby("ticker", sort=False).indices
+    for key in wanted:
+        yield key, fetched.iloc[rows.get(key, [])].reset_index(drop=True)
+
+
+def cached_sql_by_ticker(
+    db: Connectable,
+    tickers: list[str] | str,
+    ticker_sql: Callable[..., str],
+    fetch: bool = True,
+    edges: list[datetime.time] | None = None,
+    arrow: bool = False,
+) -> pd.DataFrame | None:
+    """
+    The bars of `ticker_sql(tickers)`, cached ticker by ticker under `ticker_sql(ticker)`,
+    so that the order of `tickers` does not matter and a query overlapping earlier ones
+    need only ask WRDS about the tickers it has not seen.  Those are fetched in a single
+    query, or if `fetch` is False, None is returned.  Unlike results of cached_sql(), the
+    bars are the caller's own, however many tickers there are, and may be modified in place.
+
+    Given the bar_edges() of the bars, `ticker_sql(tickers, (start, end))` must give just
+    those between two of them, so that adaptive splitting may split queries by time.
+
+    With `arrow`, bars are copied out, cached and returned as Arrow tables.
+    """
+    tickers = _unique_tickers(tickers)
+    with metrics.measure("build_sql"):
+        keys = {ticker: ticker_sql(ticker) for ticker in tickers}
+    found = {
+        ticker: _in_format(cached_result(db, sql), arrow)
+        for ticker, sql in keys.items()
+    }
+    missing = [ticker for ticker, bars in found.items() if bars is None]
+
+    if missing:
+        if not fetch:
+            return None
+        fetched = _fetch_bars(db, missing, ticker_sql, edges, arrow)
+        for ticker, bars in _rows_of(fetched, missing):
+            # Tickers without any bars are remembered as such too
+            found[ticker] = _store_result(db, keys[ticker], bars)
+
+    if len(found) == 1:
+        return _own_copy(found[tickers[0]])
+    return _sort_bars(_concat_bars(list(found.values())))
+
+
+def cached_sql_by_date_and_ticker(
+    db: Connectable,
+    tickers: list[str] | str,
+    dates: list[datetime.date],
+    day_sql: Callable[..., str],
+    edges: list[datetime.time] | None = None,
+    arrow: bool = False,
+) -> list[pd.DataFrame]:
+    """
+    As cached_sql_by_ticker() with `day_sql(tickers, date)` for each of `dates`, but with
+    all the days' missing tickers fetched in a single UNION ALL query, saving a round trip
+    to WRDS per day.  The bars are cached day by day and ticker by ticker just the same.
+    A single day is fetched as by cached_sql_by_ticker(), `edges` and all.  With adaptive
+    splitting, a batch too big for WRDS is split by days first, then as for a single day.
+    """
+    if len(dates) == 1:
+        (date,) = dates
+
+        def ticker_sql(tickers: list[str] | str, *span) -> str:
+            return day_sql(tickers, date, *span)
+
+        return [cached_sql_by_ticker(db, tickers, ticker_sql, edges=edges, arrow=arrow)]
+
+    tickers = _unique_tickers(tickers)
+    with metrics.measure("build_sql"):
+        keys = {
+            (date, ticker): day_sql(ticker, date)
+            for date in dates
+            for ticker in tickers
+        }
+    found = {
+        key: _in_format(cached_result(db, sql), arrow) for key, sql in keys.items()
+    }
+    missing = {}
+    for (date, ticker), bars in found.items():
+        if bars is None:
+            missing.setdefault(date, []).append(ticker)
+
+    if missing:
+        fetched = _fetch_days(db, missing, day_sql, edges, arrow)
+        wanted = [(date, ticker) for date, some in missing.items() for ticker in some]
+        for key, bars in _rows_of(fetched, wanted, by_date=True):
+            # Tickers without any bars are remembered as such too
+            found[key] = _store_result(db, keys[key], bars)
+
+    if len(tickers) == 1:
+        return [_own_copy(found[date, tickers[0]]) for date in dates]
+    return [
+        _sort_bars(_concat_bars([found[date, t] for t in tickers])) for date in dates
+    ]
 
 
 #################################
@@ -97,6 +649,7 @@ def cached_sql(
 #################################
 
 
+# Bars of the original form, ending on multiples of `bar_minutes` past the hour
 def bar_sql(bar_minutes: int) -> str:
     assert bar_minutes == 60 or (bar_minutes <= 30 and 30 % bar_minutes == 0)
     return f"sym_root, date, EXTRACT(HOUR FROM time_m), DIV(EXTRACT(MINUTE FROM time_m),{bar_minutes})"
@@ -110,8 +663,250 @@ def window_time_sql(bar_minutes: int) -> str:
         return f"date + (EXTRACT(HOUR FROM time_m) || ':' || {bar_minutes} * DIV(EXTRACT(MINUTE FROM time_m),{bar_minutes}))::interval + ( '00:{bar_minutes}' )::interval"
 
 
+# Bars of any whole number of seconds, counted from the start of the session
+BarGrid = tuple[int, datetime.time, datetime.time]
+
+
+def bar_grid(
+    bar_minutes: int,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+) -> BarGrid | None:
+    """
+    The width in seconds, start and end of bucketed bars, or None if neither `bar_seconds`
+    nor `session` is given and we have bars of the original form
+    """
+    if bar_seconds is None and session is None:
+        assert bar_minutes == 60 or (bar_minutes <= 30 and 30 % bar_minutes == 0)
+        return None
+    session_start, session_end = session or (MARKET_OPEN, MARKET_CLOSE)
+    width = 60 * bar_minutes if bar_seconds is None else bar_seconds
+    assert isinstance(width, int) and width >= 1
+    assert session_start < session_end
+    return width, session_start, session_end
+
+
+def bar_edges(bar_minutes: int, grid: BarGrid | None) -> list[datetime.time]:
+    """
+    The times at which bars begin and end, from the start of the session to its end, where
+    queries for the bars may be split.  Those of 60 minute bars of the original form, not
+    counted from the open, are not given, nor is the open itself within a longer session.
+    """
+    if grid is None:
+        if bar_minutes == 60:
+            return [MARKET_OPEN, MARKET_CLOSE]
+        grid = (60 * bar_minutes, MARKET_OPEN, MARKET_CLOSE)
+    width, session_start, session_end = grid
+    day = datetime.date(2000, 1, 1)
+    start = datetime.datetime.combine(day, session_start)
+    end = datetime.datetime.combine(day, session_end)
+    num_bars = -(-(end - start).total_seconds() // width)
+    edges = [
+        start + datetime.timedelta(seconds=i * width) for i in range(int(num_bars))
+    ]
+    # A piece of the session starting at 9:30 would leave out the open, as only a session
+    # starting there should
+    return [
+        edge.time()
+        for edge in edges
+        if edge.time() != MARKET_OPEN or edge.time() == session_start
+    ] + [session_end]
+
+
+def span_grid(
+    bar_minutes: int,
+    bar_seconds: int | None,
+    session: tuple[datetime.time, datetime.time] | None,
+    span: tuple[datetime.time, datetime.time] | None,
+) -> tuple[int | None, tuple[datetime.time, datetime.time] | None]:
+    """
+    The `bar_seconds` and `session` giving just the bars from the start to the end of
+    `span`, two of their bar_edges(), or all of them if it is None.  As for the whole day, a
+    span from the open leaves out anything stamped exactly 9:30:00.
+    """
+    if span is None:
+        return bar_seconds, session
+    return bar_seconds or 60 * bar_minutes, span
+
+
+def bar_bucket_sql(grid: BarGrid) -> str:
+    """Integer id of the bar holding time_m, counting from 0 at the start of the session"""
+    width, session_start, _ = grid
+    return f"FLOOR(EXTRACT(EPOCH FROM time_m - '{session_start}'::time) / {width})::integer"
+
+
+def bucket_window_time_sql(grid: BarGrid) -> str:
+    """The end of the bar with id `bucket`, or of the session if that comes first"""
+    width, session_start, session_end = grid
+    return f"date + LEAST('{session_start}'::interval + (bucket + 1) * '{width} seconds'::interval, '{session_end}'::interval)"
+
+
+def session_select_sql(session: tuple[datetime.time, datetime.time] | None) -> str:
+    """
+    The rows of the `session`, by default regular trading hours.  Whatever the width of
+    the bars, anything stamped exactly at the 9:30 open is left out, as it always has been
+    from the bars of the original form.
+    """
+    if session is None:
+        return "time_m > '09:30:00' AND time_m < '16:00:00'"
+    # Bars are whole seconds wide, so the nanoseconds of time_m_nano never move a trade
+    # or quote across a bar's edges, or the session's
+    session_start, session_end = session
+    after = ">" if session_start == MARKET_OPEN else ">="
+    return f"time_m {after} '{session_start}' AND time_m < '{session_end}'"
+
+
+def trade_statistics(statistics: str | list[str] | None) -> tuple[str, ...]:
+    """
+    The names of the statistics meant by `statistics`, one of the STATISTIC_SETS or a list
+    of TRADE_STATISTICS, in the usual order of their columns.  None means all of them.
+    """
+    if statistics is None:
+        return TRADE_BAR_COLUMNS
+    if hasattr(statistics, "strip"):
+        if statistics not in STATISTIC_SETS:
+            raise ValueError(
+                f"No set of statistics {statistics!r}, only {list(STATISTIC_SETS)}"
+            )
+        return STATISTIC_SETS[statistics]
+    unknown = [name for name in statistics if name not in TRADE_STATISTICS]
+    if unknown:
+        raise ValueError(f"No statistics {unknown}, only {list(TRADE_STATISTICS)}")
+    return tuple(name for name in TRADE_STATISTICS if name in statistics)
+
+
+def _quantile_fields(quantiles: tuple[float, ...] | None) -> dict[str, str]:
+    """
+    The `quantiles` of each of the QUANTILE_VALUES, by column, as elements of the array of
+    a single PERCENTILE_CONT for each.  PostgreSQL computes identical aggregates only once,
+    so however many quantiles there are, each value is sorted just once per bar.  The
+    fractions are written exactly, as the TAQFiles engine uses them.
+    """
+    names = iter(quantile_columns(quantiles))
+    fractions = ", ".join(repr(float(q)) for q in quantiles or ())
+    fields = {}
+    for value in QUANTILE_VALUES.values():
+        aggregate = (
+            f"PERCENTILE_CONT(ARRAY[{fractions}]) WITHIN GROUP (ORDER BY {value})"
+        )
+        for i in range(len(quantiles or ())):
+            fields[next(names)] = f"({aggregate})[{i + 1}]"
+    return fields
+
+
+def _first_last_trade_fields(nano: str) -> dict[str, str]:
+    """
+    The first and last trades of a bar, by column, as the least and greatest arrays of each
+    trade's microseconds since midnight, `nano`seconds, price, size and exchange.  Arrays
+    compare element by element, so these are plain aggregates needing no sort, and again
+    each is computed only once for all the columns taken from it.  Of trades at the very
+    same time, the first is that of the lowest price, and the last of the highest.
+    """
+    trade = f"ARRAY[ROUND(EXTRACT(EPOCH FROM time_m) * 1000000), {nano}, price, size, ASCII(ex)]"
+    fields = {}
+    for which, extreme in (("first", "MIN"), ("last", "MAX")):
+        aggregate = f"{extreme}({trade})"
+        fields[f"{which}_trade_price"] = f"({aggregate})[3]"
+        fields[f"{which}_trade_size"] = f"({aggregate})[4]::bigint"
+        fields[f"{which}_trade_time"] = (
+            f"'00:00'::time + ({aggregate})[1] * '1 microsecond'::interval"
+        )
+        fields[f"{which}_trade_time_ns"] = f"({aggregate})[2]::smallint"
+        fields[f"{which}_trade_ex"] = f"CHR(({aggregate})[5]::integer)"
+    return fields
+
+
+def _first_last_columns(quantiles: tuple[float, ...] | None) -> list[str]:
+    """Columns of trade bars with first and last trades, in order, after the bar's keys"""
+    return [
+        "vwap",
+        "last_trade_price",
+        "last_trade_size",
+        "last_trade_time",
+        "num_trades",
+        "total_qty",
+        "mean_price_ignoring_size",
+        "median_size",
+        "median_price",
+        "median_notional",
+        "min_price",
+        "max_price",
+        "min_size",
+        "max_size",
+        *quantile_columns(quantiles),
+        "first_trade_price",
+        "first_trade_size",
+        "first_trade_time",
+        "first_trade_time_ns",
+        "last_trade_time_ns",
+    ]
+
+
+def bar_query_columns(
+    columns: list[str] | None,
+    trades: bool = True,
+    nbbo: bool = False,
+    group_by_exchange: bool = False,
+    include_first_and_last: bool = False,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    quote_statistics: bool = False,
+) -> list[str] | None:
+    """
+    What to select to end up with `columns` of trade and/or NBBO bars: those, the keys of
+    each bar and the nanoseconds of its times.  None, for everything, if `columns` is.
+    """
+    if columns is None:
+        return None
+    known = _bar_keys(group_by_exchange)
+    if trades:
+        known += trade_statistics(statistics) + quantile_columns(quantiles)
+    if trades and include_first_and_last:
+        known += FIRST_LAST_COLUMNS
+        if not group_by_exchange:
+            known += ["first_trade_ex", "last_trade_ex"]
+    if nbbo:
+        known += NBBO_BAR_COLUMNS
+    if nbbo and quote_statistics:
+        known += tuple(QUOTE_STATISTICS)
+    unknown = [column for column in columns if column not in known]
+    if unknown:
+        raise ValueError(f"No bar columns {unknown}, only {known}")
+
+    selected = _bar_keys(group_by_exchange)
+    for column in columns:
+        selected.append(column)
+        if column in TIME_COLUMNS:
+            selected.append(f"{column}_ns")
+    return list(dict.fromkeys(selected))
+
+
+def union_all_sql(sqls: list[str]) -> str:
+    """
+    The rows of all of `sqls`, which must have the same columns, from one statement.  Each
+    keeps its own WITH and ORDER BY clauses within parentheses.
+    """
+    if len(sqls) == 1:
+        return sqls[0]
+    return "\nUNION ALL\n".join(f"({sql}\n)" for sql in sqls)
+
+
+def projected_sql(sql: str, columns: list[str] | None) -> str:
+    """
+    `sql` cut down to `columns`, or left alone if None.  PostgreSQL drops the unused
+    outputs of subqueries, so the server does not even compute the other columns.
+    """
+    if columns is None:
+        return sql
+    return f"""SELECT {", ".join(columns)}
+        FROM ({sql}
+        ) AS bars"""
+
+
 def taq_trade_bar_select_sql(
-    tickers: list[str] | str, restrict_to_exchanges: tuple[str, ...] | str | None = None
+    tickers: list[str] | str,
+    restrict_to_exchanges: tuple[str, ...] | str | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
 ) -> str:
     assert bool(tickers)
 
@@ -135,40 +930,92 @@ def taq_trade_bar_select_sql(
     ssql = f"""{exchange_select}
                   AND {symbol_select}
                   AND sym_suffix IS NULL
-                  AND time_m > '09:30:00' AND time_m < '16:00:00'"""
+                  AND {session_select_sql(session)}"""
 
     return ssql
 
 
+def bucketed_trades_sql(
+    tickers: list[str] | str,
+    date: datetime.date,
+    grid: BarGrid,
+    restrict_to_exchanges: tuple[str, ...] | str | None = None,
+    nano_in_window: str | None = None,
+) -> str:
+    """
+    Trades of the session, each with the `bucket` id of its bar computed just once, for
+    use as a bucketed_trades CTE
+    """
+    db_name = f"taqm_{date.strftime('%Y')}"
+    table_name = f"ctm_{date.strftime('%Y%m%d')}"
+    nano = f"\n                    , {nano_in_window}" if nano_in_window else ""
+    return f"""SELECT
+                    sym_root
+                    , date
+                    , time_m{nano}
+                    , price
+                    , size
+                    , ex
+                    , {bar_bucket_sql(grid)} AS bucket
+                FROM {db_name}.{table_name}
+                WHERE {taq_trade_bar_select_sql(tickers, restrict_to_exchanges, grid[1:])}"""
+
+
+def _trade_statistics_fields(
+    window_time: str,
+    statistics: tuple[str, ...] = TRADE_BAR_COLUMNS,
+    quantiles: tuple[float, ...] | None = None,
+) -> str:
+    fields = ["sym_root AS ticker", "date", f"{window_time} AS window_time"]
+    fields += [f"{TRADE_STATISTICS[name]} AS {name}" for name in statistics]
+    fields += [f"{sql} AS {name}" for name, sql in _quantile_fields(quantiles).items()]
+    return "\n                    , ".join(fields)
+
+
+def _bucketed_aggregate_sql(fields: str, group_by_exchange: bool) -> str:
+    """Aggregate `fields` over each bar of the bucketed_trades CTE"""
+    grouping = "sym_root, date, bucket"
+    if group_by_exchange:
+        grouping += ", ex"
+        fields += "\n                    , ex"
+    return f"""SELECT
+                    {fields}
+                FROM bucketed_trades
+                GROUP BY
+                  {grouping}"""
+
+
 def taq_trade_bar_statistics_sql(
     tickers: list[str] | str,
     date: datetime.date,
     bar_minutes: int = 30,
     group_by_exchange: bool = False,
     restrict_to_exchanges: tuple[str, ...] | str | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
 ) -> str:
     """
-    Return SQL suitable for finding aggregate bar statistics from WRDS / TAQ
+    Return SQL suitable for finding aggregate bar statistics from WRDS / TAQ, by default
+    all of them, else just those of trade_statistics(`statistics`), and any `quantiles`
     """
+    grid = bar_grid(bar_minutes, bar_seconds, session)
+    statistics = trade_statistics(statistics)
+    if grid is not None:
+        return f"""WITH bucketed_trades AS (
+                {bucketed_trades_sql(tickers, date, grid, restrict_to_exchanges)}
+                )
+                {_bucketed_aggregate_sql(_trade_statistics_fields(bucket_window_time_sql(grid), statistics, quantiles), group_by_exchange)}"""
+
     date_str = date.strftime("%Y%m%d")
     year_str = date.strftime("%Y")
     db_name = f"taqm_{year_str}"
     table_name = f"ctm_{date_str} "
 
-    fields = f"""sym_root AS ticker
-                    , date
-                    , {window_time_sql(bar_minutes)} AS window_time
-                    , COUNT(size) AS num_trades
-                    , SUM(size) AS total_qty
-                    , SUM(price * size) / SUM(size) AS vwap
-                    , AVG(price) AS mean_price_ignoring_size
-                    , PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY size) AS median_size
-                    , PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price) AS median_price
-                    , PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price*size) AS median_notional
-                    , MAX(price) AS max_price
-                    , MIN(price) AS min_price
-                    , MAX(size) AS max_size
-                    , MIN(size) AS min_size"""
+    fields = _trade_statistics_fields(
+        window_time_sql(bar_minutes), statistics, quantiles
+    )
 
     grouping = bar_sql(bar_minutes)
 
@@ -185,6 +1032,48 @@ def taq_trade_bar_statistics_sql(
     return tbsql
 
 
+def taq_trade_bar_medians_sql(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    group_by_exchange: bool = False,
+    restrict_to_exchanges: tuple[str, ...] | str | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+) -> str:
+    """
+    Return SQL for just the median statistics of taq_trade_bar_statistics_sql(), which
+    unlike the others cannot be rolled up from finer bars
+    """
+    grid = bar_grid(bar_minutes, bar_seconds, session)
+    if grid is not None:
+        return f"""WITH bucketed_trades AS (
+                {bucketed_trades_sql(tickers, date, grid, restrict_to_exchanges)}
+                )
+                {_bucketed_aggregate_sql(_trade_statistics_fields(bucket_window_time_sql(grid), MEDIAN_COLUMNS), group_by_exchange)}"""
+
+    date_str = date.strftime("%Y%m%d")
+    year_str = date.strftime("%Y")
+    db_name = f"taqm_{year_str}"
+    table_name = f"ctm_{date_str}"
+
+    fields = _trade_statistics_fields(window_time_sql(bar_minutes), MEDIAN_COLUMNS)
+
+    grouping = bar_sql(bar_minutes)
+
+    if group_by_exchange:
+        grouping += ", ex"
+        fields += "\n                    , ex"
+
+    msql = f"""SELECT
+                    {fields}
+                FROM {db_name}.{table_name}
+                WHERE {taq_trade_bar_select_sql(tickers, restrict_to_exchanges)}
+                GROUP BY
+                  {grouping}"""
+    return msql
+
+
 def taq_trade_bars_sql(
     tickers: list[str] | str,
     date: datetime.date,
@@ -192,8 +1081,37 @@ def taq_trade_bars_sql(
     group_by_exchange: bool = False,
     restrict_to_exchanges: tuple[str, ...] | str | None = None,
     include_first_and_last: bool = False,
-    wrds_db: wrds.sql.Connection | None = None,
+    wrds_db: Connectable | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    first_last_method: str = "windows",
 ) -> str:
+    """
+    SQL for trade bars, `bar_minutes` wide and ending on multiples of that past the hour.
+
+    Given `bar_seconds`, bars are instead that many seconds wide, counted from the start of
+    `session`, itself defaulting to regular trading hours.  Each trade's bar is then
+    computed once, as an integer bucket id all the CTEs share.
+
+    Only the `statistics` asked for, as for trade_statistics(), are computed.
+    Without the medians, the server need not sort the trades of each bar.  Each of
+    `quantiles`, such as (0.1, 0.5, 0.9), adds a column for the size, price and notional,
+    as from quantile_columns(), at the cost of about one median each.
+
+    With `include_first_and_last`, the first and last trades of each bar are by default
+    found by numbering the trades of each bar both ways, in window functions, and joined
+    to the statistics computed in a separate pass.  With `first_last_method="aggregates"`,
+    they are instead found by plain aggregates alongside the statistics, in a single
+    pass over the trades, as from _first_last_trade_fields().
+    """
+    statistics = trade_statistics(statistics)
+    if first_last_method not in FIRST_LAST_METHODS:
+        raise ValueError(
+            f"No method {first_last_method!r} of finding first and last trades, only {FIRST_LAST_METHODS}"
+        )
+    grid = bar_grid(bar_minutes, bar_seconds, session)
     date_str = date.strftime("%Y%m%d")
     year_str = date.strftime("%Y")
     db_name = f"taqm_{year_str}"
@@ -201,61 +1119,74 @@ def taq_trade_bars_sql(
 
     if not include_first_and_last:
         bsql = taq_trade_bar_statistics_sql(
-            tickers, date, bar_minutes, group_by_exchange, restrict_to_exchanges
+            tickers,
+            date,
+            bar_minutes,
+            group_by_exchange,
+            restrict_to_exchanges,
+            bar_seconds=bar_seconds,
+            session=session,
+            statistics=statistics,
+            quantiles=quantiles,
         )
     else:
         # Latter years have a nanoseconds field
         db = get_wrds_connection(wrds_db)
-        with HidePrinting():
-            table_field_names = db.describe_table(library=db_name, table=table_name)
-
         # Latter years have a nanoseconds field
         nano_in_window = (
             "time_m_nano"
-            if "time_m_nano" in set(table_field_names.name)
+            if "time_m_nano" in table_columns(db, db_name, table_name)
             else "0::smallint as time_m_nano"
         )
 
-        fields = """  trade_stats_in_bar.ticker
-                , trade_stats_in_bar.date
-                , trade_stats_in_bar.window_time
-                , vwap
-                , last_trade_price
-                , last_trade_size
-                , last_trade_time
-                , num_trades
-                , total_qty
-                , mean_price_ignoring_size
-                , median_size
-                , median_price
-                , median_notional
-                , min_price
-                , max_price
-                , min_size
-                , max_size
-                , first_trade_price
-                , first_trade_size
-                , first_trade_time
-                , first_trade_time_ns
-                , last_trade_time_ns"""
+        if first_last_method == "aggregates":
+            return _first_last_aggregates_sql(
+                tickers,
+                date,
+                bar_minutes,
+                group_by_exchange,
+                restrict_to_exchanges,
+                nano_in_window,
+                grid,
+                statistics,
+                quantiles,
+            )
+
+        fields = [
+            "trade_stats_in_bar.ticker",
+            "trade_stats_in_bar.date",
+            "trade_stats_in_bar.window_time",
+            *_first_last_columns(quantiles),
+        ]
+        fields = "  " + "\n                , ".join(
+            field
+            for field in fields
+            if field not in TRADE_STATISTICS or field in statistics
+        )
 
         order = "trade_stats_in_bar.ticker, trade_stats_in_bar.date, trade_stats_in_bar.window_time"
 
+        if grid is None:
+            bar_columns = "hour_of_day, minute_of_hour"
+            partition = bar_sql(bar_minutes)
+        else:
+            bar_columns = "bucket"
+            partition = "sym_root, date, bucket"
+
         if group_by_exchange:
             fields += "\n                , ex"
             order += ", trade_stats_in_bar.ex"
-            first_last_distinct = "(ticker, date, hour_of_day, minute_of_hour, ex)"
-            partition = f"{bar_sql(bar_minutes)}, ex"
+            first_last_distinct = f"(ticker, date, {bar_columns}, ex)"
+            partition += ", ex"
         else:
             fields += (
                 "\n                , first_trade_ex\n                , last_trade_ex"
             )
-            first_last_distinct = "(ticker, date, hour_of_day, minute_of_hour)"
-            partition = bar_sql(bar_minutes)
+            first_last_distinct = f"(ticker, date, {bar_columns})"
 
-        bsql = f"""
-            WITH 
-              windowable_trades AS (
+        if grid is None:
+            window_time = window_time_sql(bar_minutes)
+            windowable_trades = f"""windowable_trades AS (
                 SELECT
                     sym_root AS ticker
                     , date
@@ -271,25 +1202,64 @@ def taq_trade_bars_sql(
                     , ex
                 FROM {db_name}.{table_name}
                 WHERE {taq_trade_bar_select_sql(tickers, restrict_to_exchanges)}
-            ),
-            last_trades AS (
-              SELECT DISTINCT ON {first_last_distinct}
-                    ticker
+            )"""
+        else:
+            window_time = bucket_window_time_sql(grid)
+            windowable_trades = f"""bucketed_trades AS (
+                {bucketed_trades_sql(tickers, date, grid, restrict_to_exchanges, nano_in_window)}
+              ),
+              windowable_trades AS (
+                SELECT
+                    sym_root AS ticker
                     , date
-                    , {window_time_sql(bar_minutes)} AS window_time
-                    , time_m AS last_trade_time
-                    , time_m_nano AS last_trade_time_ns
-                    , price AS last_trade_price
-                    , size as last_trade_size
-                    , ex AS last_trade_ex
-                FROM windowable_trades
-                WHERE windowable_trades.rownum = 1
+                    , time_m
+                    , time_m_nano
+                    , bucket
+                    , ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY time_m DESC) AS rownum
+                    , ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY time_m ASC) AS asc_rownum
+                    , price
+                    , size
+                    , ex
+                FROM bucketed_trades
+            )"""
+
+        if grid is None:
+            trade_stats_in_bar = taq_trade_bar_statistics_sql(
+                tickers,
+                date,
+                bar_minutes,
+                group_by_exchange,
+                restrict_to_exchanges,
+                statistics=statistics,
+                quantiles=quantiles,
+            )
+        else:
+            trade_stats_in_bar = _bucketed_aggregate_sql(
+                _trade_statistics_fields(window_time, statistics, quantiles),
+                group_by_exchange,
+            )
+
+        bsql = f"""
+            WITH 
+              {windowable_trades},
+            last_trades AS (
+              SELECT DISTINCT ON {first_last_distinct}
+                    ticker
+                    , date
+                    , {window_time} AS window_time
+                    , time_m AS last_trade_time
+                    , time_m_nano AS last_trade_time_ns
+                    , price AS last_trade_price
+                    , size as last_trade_size
+                    , ex AS last_trade_ex
+                FROM windowable_trades
+                WHERE windowable_trades.rownum = 1
             ),
             first_trades AS (
               SELECT DISTINCT ON {first_last_distinct}
                     ticker
                     , date
-                    , {window_time_sql(bar_minutes)} AS window_time
+                    , {window_time} AS window_time
                     , time_m AS first_trade_time
                     , time_m_nano AS first_trade_time_ns
                     , price AS first_trade_price
@@ -299,7 +1269,7 @@ def taq_trade_bars_sql(
                 WHERE windowable_trades.asc_rownum = 1
             ),
             trade_stats_in_bar AS (
-                {taq_trade_bar_statistics_sql(tickers, date, bar_minutes, group_by_exchange, restrict_to_exchanges)}
+                {trade_stats_in_bar}
             )
             SELECT
                 {fields}
@@ -318,79 +1288,82 @@ def taq_trade_bars_sql(
     return bsql
 
 
-#########################
-## Making WRDS Queries ##
-#########################
-
-
-def taq_trade_bars_on_date(
+def _first_last_aggregates_sql(
     tickers: list[str] | str,
     date: datetime.date,
-    bar_minutes: int = 30,
-    group_by_exchange: bool = False,
-    restrict_to_exchanges: tuple[str] | None = None,
-    include_first_and_last: bool = False,
-    wrds_db: wrds.sql.Connection | None = None,
-) -> pd.DataFrame:
+    bar_minutes: int,
+    group_by_exchange: bool,
+    restrict_to_exchanges: tuple[str, ...] | str | None,
+    nano_in_window: str,
+    grid: BarGrid | None,
+    statistics: tuple[str, ...],
+    quantiles: tuple[float, ...] | None,
+) -> str:
     """
-    Starting from 9:30AM NYC time and ending at 16:00, obtain bars of trade information
-    as a Pandas dataframe by querying WRDS TAQ ctm_20??_* tables.
-
-    No checking is done here for weekends, half days or holidays.  60 minute bars by necessity have one
-    window that really only contains 30 minutes of data
-
-    No support for symbol suffixes.
-
-    Rookie alert: prices here are not dividend adjusted
+    The trade bars of taq_trade_bars_sql() with first and last trades, in the same columns,
+    computed in a single aggregation over the trades
     """
-    db = get_wrds_connection(wrds_db)
-
-    sql = taq_trade_bars_sql(
-        tickers,
-        date,
-        bar_minutes,
-        group_by_exchange,
-        restrict_to_exchanges,
-        include_first_and_last=include_first_and_last,
-        wrds_db=db,
-    )
-
-    bars = cached_sql(db, sql)
-    bars["window_time"] = pd.to_datetime(bars["window_time"]).dt.tz_localize(
-        pytz.timezone("America/New_York")
+    # Bucketed trades carry their nanoseconds, or zero for years before there were any
+    nano = "time_m_nano" if grid is not None else nano_in_window.split()[0]
+    aggregates = {name: TRADE_STATISTICS[name] for name in statistics}
+    aggregates.update(_quantile_fields(quantiles))
+    aggregates.update(_first_last_trade_fields(nano))
+    columns = _first_last_columns(quantiles)
+    if not group_by_exchange:
+        columns += ["first_trade_ex", "last_trade_ex"]
+    window_time = (
+        window_time_sql(bar_minutes) if grid is None else bucket_window_time_sql(grid)
     )
-
-    if include_first_and_last:
-        # Make timestamps Pythonic
-        bars["last_trade_time"] = bars.apply(
-            _make_timestamp, field_name_root="last_trade_time", axis=1
-        )
-        del bars["last_trade_time_ns"]
-        bars["first_trade_time"] = bars.apply(
-            _make_timestamp, field_name_root="first_trade_time", axis=1
+    fields = ["sym_root AS ticker", "date", f"{window_time} AS window_time"]
+    fields += [
+        f"{aggregates[name]} AS {name}" for name in columns if name in aggregates
+    ]
+
+    order = "ticker, date, window_time" + (", ex" if group_by_exchange else "")
+    if grid is not None:
+        aggregate_sql = _bucketed_aggregate_sql(
+            "\n                    , ".join(fields), group_by_exchange
         )
-        del bars["first_trade_time_ns"]
-    return bars
+        return f"""WITH bucketed_trades AS (
+                {bucketed_trades_sql(tickers, date, grid, restrict_to_exchanges, nano_in_window)}
+                )
+                {aggregate_sql}
+                ORDER BY {order}"""
+
+    db_name = f"taqm_{date.strftime('%Y')}"
+    table_name = f"ctm_{date.strftime('%Y%m%d')}"
+    grouping = bar_sql(bar_minutes)
+    if group_by_exchange:
+        grouping += ", ex"
+        fields.append("ex")
+    fields = "\n                    , ".join(fields)
+    return f"""SELECT
+                    {fields}
+                FROM {db_name}.{table_name}
+                WHERE {taq_trade_bar_select_sql(tickers, restrict_to_exchanges)}
+                GROUP BY
+                  {grouping}
+                ORDER BY {order}"""
 
 
-def taq_nbbo_bars_on_date(
+def taq_nbbo_bars_sql(
     tickers: list[str] | str,
     date: datetime.date,
     bar_minutes: int = 30,
-    wrds_db: wrds.sql.Connection | None = None,
-) -> pd.DataFrame:
+    wrds_db: Connectable | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    quote_statistics: bool = False,
+) -> str:
     """
-    Starting from 9:30AM NYC time and ending at 16:00, obtain bars of national best bed and offer (NBBO)
-    as a Pandas dataframe by querying WRDS TAQ complete_nbbo_* tables.
-
-    No checking is done here for weekends, half days or holidays.  60 minute bars by necessity have one
-    window that really only contains 30 minutes of data
-
-    No support for symbol suffixes.
+    SQL for the last NBBO quote of each bar, with bars as for taq_trade_bars_sql()
 
-    Rookie alert: prices here are not dividend adjusted
+    With `quote_statistics`, each bar also has the QUOTE_STATISTICS of all its quotes, such
+    as their spread weighted by how long each stood, until the next quote or the end of the
+    bar.  Durations come from the same window over the bar's quotes as finds the last,
+    so the quotes are still scanned and sorted just once, then aggregated bar by bar.
     """
-    assert bar_minutes == 60 or (bar_minutes <= 30 and 30 % bar_minutes == 0)
+    grid = bar_grid(bar_minutes, bar_seconds, session)
     assert bool(tickers)
 
     db = get_wrds_connection(wrds_db)
@@ -406,18 +1379,36 @@ def taq_nbbo_bars_on_date(
     year_str = date.strftime("%Y")
     db_name = f"taqm_{year_str}"
     table_name = f"complete_nbbo_{date_str}"
-    with HidePrinting():
-        table_field_names = db.describe_table(library=db_name, table=table_name)
-
+    nbbo_columns = table_columns(db, db_name, table_name)
     # Latter years have a nanoseconds field
     nano_in_window = (
-        "time_m_nano"
-        if "time_m_nano" in set(table_field_names.name)
-        else "0::smallint as time_m_nano"
+        "time_m_nano" if "time_m_nano" in nbbo_columns else "0::smallint as time_m_nano"
     )
 
-    sql = f"""
-            WITH windowable_nbbo AS (
+    if grid is None:
+        partition = f"sym_root, EXTRACT(HOUR FROM time_m), DIV(EXTRACT(MINUTE FROM time_m),{bar_minutes})"
+        window_time = window_time_sql(bar_minutes)
+    else:
+        partition = "sym_root, bucket"
+        window_time = bucket_window_time_sql(grid)
+    durations = ""
+    sequence = ""
+    latest_first = "time_m DESC"
+    if quote_statistics:
+        # Quotes in the same microsecond take turns by nanosecond, and those in the same
+        # nanosecond by sequence number, else each's duration would depend on which the
+        # server happened to put first
+        latest_first += f", {nano_in_window.split()[0]} DESC"
+        if "qu_seqnum" in nbbo_columns:
+            latest_first += ", qu_seqnum DESC"
+            sequence = "\n                    , qu_seqnum"
+        # Until the next quote in the bar, the one before in descending order, or its end
+        durations = f"""
+                    , {window_time} AS window_time
+                    , EXTRACT(EPOCH FROM COALESCE(LAG(time_m) OVER (PARTITION BY {partition} ORDER BY {latest_first}), ({window_time} - date)::time) - time_m) AS quote_seconds"""
+
+    if grid is None:
+        windowable_nbbo = f"""windowable_nbbo AS (
                 SELECT
                     sym_root AS ticker
                     , date
@@ -431,17 +1422,85 @@ def taq_nbbo_bars_on_date(
                     , best_asksizeshares
                     , EXTRACT(HOUR FROM time_m) AS hour_of_day
                     , {bar_minutes} * DIV(EXTRACT(MINUTE FROM time_m),{bar_minutes}) AS minute_of_hour
-                    , ROW_NUMBER() OVER (PARTITION BY sym_root, EXTRACT(HOUR FROM time_m), DIV(EXTRACT(MINUTE FROM time_m),{bar_minutes}) ORDER BY time_m DESC) AS rownum
+                    , ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {latest_first}) AS rownum{durations}
                 FROM {db_name}.{table_name}
                 WHERE 1=1
                   AND {symbol_select}
                   AND sym_suffix IS NULL
-                  AND time_m > '09:30:00' AND time_m < '16:00:00'
+                  AND {session_select_sql(None)}
+            )"""
+        bar_columns = "hour_of_day, minute_of_hour"
+    else:
+        windowable_nbbo = f"""bucketed_nbbo AS (
+                SELECT
+                    sym_root
+                    , date
+                    , time_m
+                    , {nano_in_window}
+                    , qu_cond
+                    , best_bid
+                    , best_bidsizeshares
+                    , best_ask
+                    , best_asksizeshares{sequence}
+                    , {bar_bucket_sql(grid)} AS bucket
+                FROM {db_name}.{table_name}
+                WHERE 1=1
+                  AND {symbol_select}
+                  AND sym_suffix IS NULL
+                  AND {session_select_sql(grid[1:])}
+            ),
+            windowable_nbbo AS (
+                SELECT
+                    sym_root AS ticker
+                    , date
+                    , time_m
+                    , time_m_nano
+                    , qu_cond
+                    , best_bid
+                    , best_bidsizeshares
+                    , best_ask
+                    , best_asksizeshares{sequence}
+                    , bucket
+                    , ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY {latest_first}) AS rownum{durations}
+                FROM bucketed_nbbo
+            )"""
+        bar_columns = "bucket"
+
+    if quote_statistics:
+        # The last quote's columns, and the statistics of all, in a single aggregation
+        last_quote = {
+            column: f"MAX({source}) FILTER (WHERE rownum = 1)"
+            for column, source in (
+                ("best_bid", "best_bid"),
+                ("best_bidsizeshares", "best_bidsizeshares"),
+                ("best_ask", "best_ask"),
+                ("best_asksizeshares", "best_asksizeshares"),
+                ("time_of_last_quote", "time_m"),
+                ("time_of_last_quote_ns", "time_m_nano"),
             )
-            SELECT DISTINCT ON (ticker, date, hour_of_day, minute_of_hour)
+        }
+        fields = "\n                , ".join(
+            f"{sql} AS {name}"
+            for name, sql in {**last_quote, **QUOTE_STATISTICS}.items()
+        )
+        return f"""
+            WITH {windowable_nbbo}
+            SELECT
                 ticker
                 , date
-                , {window_time_sql(bar_minutes)} AS window_time
+                , window_time
+                , {fields}
+            FROM windowable_nbbo
+            GROUP BY ticker, date, window_time
+            ORDER BY ticker, date, window_time
+            """
+
+    sql = f"""
+            WITH {windowable_nbbo}
+            SELECT DISTINCT ON (ticker, date, {bar_columns})
+                ticker
+                , date
+                , {window_time} AS window_time
                 , best_bid
                 , best_bidsizeshares
                 , best_ask
@@ -451,15 +1510,992 @@ def taq_nbbo_bars_on_date(
             FROM windowable_nbbo
             WHERE windowable_nbbo.rownum = 1
             """
-    bars = cached_sql(db, sql)
+    return sql
 
-    # Make timestamps Pythonic
-    bars["time_of_last_quote"] = bars.apply(
-        _make_timestamp, field_name_root="time_of_last_quote", axis=1
+
+def taq_bars_sql(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    group_by_exchange: bool = False,
+    restrict_to_exchanges: tuple[str, ...] | str | None = None,
+    include_first_and_last: bool = False,
+    how: str = "outer",
+    wrds_db: Connectable | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    first_last_method: str = "windows",
+    quote_statistics: bool = False,
+) -> str:
+    """
+    Trade and NBBO bars joined on (ticker, date, window_time) by the server.  `how` is
+    "inner", "left" (keeping windows with trades) or "outer", as for pandas.merge().
+    """
+    join = {"inner": "JOIN", "left": "LEFT JOIN", "outer": "FULL JOIN"}[how]
+    order = "ticker, date, window_time" + (", ex" if group_by_exchange else "")
+
+    trade_sql = taq_trade_bars_sql(
+        tickers,
+        date,
+        bar_minutes,
+        group_by_exchange,
+        restrict_to_exchanges,
+        include_first_and_last=include_first_and_last,
+        wrds_db=wrds_db,
+        bar_seconds=bar_seconds,
+        session=session,
+        statistics=statistics,
+        quantiles=quantiles,
+        first_last_method=first_last_method,
     )
-    del bars["time_of_last_quote_ns"]
-    bars["window_time"] = pd.to_datetime(bars["window_time"]).dt.tz_localize(
-        pytz.timezone("America/New_York")
+    nbbo_sql = taq_nbbo_bars_sql(
+        tickers,
+        date,
+        bar_minutes,
+        wrds_db=wrds_db,
+        bar_seconds=bar_seconds,
+        session=session,
+        quote_statistics=quote_statistics,
     )
 
+    sql = f"""
+        WITH
+          trade_bars AS ({trade_sql}
+          ),
+          nbbo_bars AS ({nbbo_sql}
+          )
+        SELECT *
+        FROM trade_bars
+          {join} nbbo_bars USING (ticker, date, window_time)
+        ORDER BY {order}"""
+    return sql
+
+
+#########################
+## Making WRDS Queries ##
+#########################
+
+
+def _finish_trade_bars(
+    bars: pd.DataFrame, include_first_and_last: bool
+) -> pd.DataFrame:
+    with metrics.measure("timestamps") as event:
+        event.rows = len(bars)
+        time_cols = ("last_trade_time", "first_trade_time")
+        if not isinstance(bars, pd.DataFrame):
+            bars = localize_table(bars, "window_time")
+            if include_first_and_last:
+                for time_col in time_cols:
+                    if time_col in bars.column_names:
+                        bars = table_timestamps(bars, time_col)
+            return bars
+
+        bars["window_time"] = localize_new_york(bars["window_time"])
+
+        if include_first_and_last:
+            # Make timestamps Pythonic, of those times we have
+            for time_col in time_cols:
+                if time_col in bars:
+                    bars[time_col] = make_timestamps(bars, time_col)
+                    del bars[f"{time_col}_ns"]
+    return bars
+
+
+def _finish_quote_times(bars: pd.DataFrame) -> pd.DataFrame:
+    if not isinstance(bars, pd.DataFrame):
+        if "time_of_last_quote" in bars.column_names:
+            bars = table_timestamps(bars, "time_of_last_quote")
+        return bars
+    # Make timestamps Pythonic
+    if "time_of_last_quote" in bars:
+        bars["time_of_last_quote"] = make_timestamps(bars, "time_of_last_quote")
+        del bars["time_of_last_quote_ns"]
+    return bars
+
+
+def _finish_nbbo_bars(bars: pd.DataFrame) -> pd.DataFrame:
+    with metrics.measure("timestamps") as event:
+        event.rows = len(bars)
+        bars = _finish_quote_times(bars)
+        if not isinstance(bars, pd.DataFrame):
+            return localize_table(bars, "window_time")
+        bars["window_time"] = localize_new_york(bars["window_time"])
+
     return bars
+
+
+def _rolled_up_trade_bars(
+    db: Connectable,
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int,
+    group_by_exchange: bool,
+    restrict_to_exchanges: tuple[str] | None,
+    include_first_and_last: bool,
+    statistics: tuple[str, ...] = TRADE_BAR_COLUMNS,
+) -> pd.DataFrame | None:
+    """
+    Trade bars rolled up from the coarsest finer ones we have cached, if any, with just
+    the `statistics` asked for.  Only medians are fetched, if asked for.
+    """
+    for fine_minutes in finer_bar_minutes(bar_minutes):
+
+        def fine_sql(tickers: list[str] | str) -> str:
+            return taq_trade_bars_sql(
+                tickers,
+                date,
+                fine_minutes,
+                group_by_exchange,
+                restrict_to_exchanges,
+                include_first_and_last=include_first_and_last,
+                wrds_db=db,
+            )
+
+        fine = cached_sql_by_ticker(db, tickers, fine_sql, fetch=False)
+        if fine is not None:
+
+            def medians_sql(tickers: list[str] | str) -> str:
+                return taq_trade_bar_medians_sql(
+                    tickers, date, bar_minutes, group_by_exchange, restrict_to_exchanges
+                )
+
+            medians = None
+            if set(MEDIAN_COLUMNS) & set(statistics):
+                medians = cached_sql_by_ticker(db, tickers, medians_sql)
+            bars = rollup_trade_bars(
+                fine, fine_minutes, bar_minutes, group_by_exchange, medians=medians
+            )
+            unwanted = set(TRADE_BAR_COLUMNS) - set(statistics)
+            return bars.drop(columns=[name for name in bars if name in unwanted])
+    return None
+
+
+def _rolled_up_nbbo_bars(
+    db: Connectable, tickers: list[str] | str, date: datetime.date, bar_minutes: int
+) -> pd.DataFrame | None:
+    """NBBO bars rolled up from the coarsest finer ones we have cached, if any"""
+    for fine_minutes in finer_bar_minutes(bar_minutes):
+
+        def fine_sql(tickers: list[str] | str) -> str:
+            return taq_nbbo_bars_sql(tickers, date, fine_minutes, wrds_db=db)
+
+        fine = cached_sql_by_ticker(db, tickers, fine_sql, fetch=False)
+        if fine is not None:
+            return rollup_nbbo_bars(fine, fine_minutes, bar_minutes)
+    return None
+
+
+@metrics.instrumented
+def taq_trade_bars_on_date(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    group_by_exchange: bool = False,
+    restrict_to_exchanges: tuple[str] | None = None,
+    include_first_and_last: bool = False,
+    wrds_db: Connectable | None = None,
+    rollup: bool = False,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    first_last_method: str = "windows",
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    Starting from 9:30AM NYC time and ending at 16:00, obtain bars of trade information
+    as a Pandas dataframe by querying WRDS TAQ ctm_20??_* tables.
+
+    No checking is done here for weekends, half days or holidays.  60 minute bars by necessity have one
+    window that really only contains 30 minutes of data
+
+    No support for symbol suffixes.
+
+    With `rollup`, bars are computed locally from finer cached bars of the same tickers, if
+    there are any, and only the medians are fetched from WRDS.  Of several trades within
+    the same microsecond, which counts as first or last may then differ.
+
+    Bars may instead be `bar_seconds` wide, and cover a `session` other than regular trading
+    hours, as (start, end) wall clock times.  Such bars count from the start of the session,
+    so 60 minute ones end at 10:30, 11:30 and so on, with the last cut short at its end.
+    They are never rolled up.
+
+    Given a TAQFiles as `wrds_db`, bars are computed from its files instead.
+
+    Given `columns`, such as ["vwap", "num_trades"], only those are computed and fetched,
+    along with the ticker, date, window_time (and ex) identifying each bar.  With
+    `compact`, the bars come in the smaller dtypes of compact_bars().  With `output` of
+    "arrow" or "polars", they come as a pyarrow Table or polars DataFrame instead, with
+    nanosecond New York timestamps and dictionary encoded tickers and exchanges, ready to
+    write to Parquet or Arrow IPC files as they are.  Bars copied out by COPY, as after
+    set_transfer_method("copy"), are then cached and finished as Arrow tables, never
+    becoming pandas DataFrames.  Others, such as those rolled up or from TAQFiles, are
+    converted from pandas at the end.
+
+    `statistics` may be "cheap", for all but the medians, which are much the costliest to
+    compute, or "medians", or a list of the TRADE_STATISTICS wanted.  `quantiles`, such as
+    (0.1, 0.25, 0.5, 0.75, 0.9), add columns like price_q25 for those of the size, price
+    and notional of the trades, sorting each just once per bar.  Bars with quantiles are
+    never rolled up.
+
+    Rookie alert: prices here are not dividend adjusted
+    """
+    db = get_wrds_connection(wrds_db)
+    grid = bar_grid(bar_minutes, bar_seconds, session)
+    statistics = trade_statistics(statistics)
+    query_columns = bar_query_columns(
+        columns,
+        group_by_exchange=group_by_exchange,
+        include_first_and_last=include_first_and_last,
+        statistics=statistics,
+        quantiles=quantiles,
+    )
+
+    bars = None
+    if isinstance(db, TAQFiles):
+        bars = db.trade_bars(
+            _unique_tickers(tickers),
+            date,
+            bar_minutes,
+            group_by_exchange,
+            restrict_to_exchanges,
+            include_first_and_last,
+            grid,
+            statistics,
+            quantiles,
+        )
+    elif rollup and grid is None and not quantiles:
+        bars = _rolled_up_trade_bars(
+            db,
+            tickers,
+            date,
+            bar_minutes,
+            group_by_exchange,
+            restrict_to_exchanges,
+            include_first_and_last,
+            statistics,
+        )
+    if bars is None:
+
+        def sql(tickers: list[str] | str, span=None) -> str:
+            span_seconds, span_session = span_grid(
+                bar_minutes, bar_seconds, session, span
+            )
+            return projected_sql(
+                taq_trade_bars_sql(
+                    tickers,
+                    date,
+                    bar_minutes,
+                    group_by_exchange,
+                    restrict_to_exchanges,
+                    include_first_and_last=include_first_and_last,
+                    wrds_db=db,
+                    bar_seconds=span_seconds,
+                    session=span_session,
+                    statistics=statistics,
+                    quantiles=quantiles,
+                    first_last_method=first_last_method,
+                ),
+                query_columns,
+            )
+
+        edges = bar_edges(bar_minutes, grid)
+        bars = cached_sql_by_ticker(
+            db, tickers, sql, edges=edges, arrow=_keeps_arrow(output)
+        )
+    bars = _finish_trade_bars(bars, include_first_and_last)
+    return _shaped(bars, columns, group_by_exchange, compact, output)
+
+
+@metrics.instrumented
+def taq_nbbo_bars_on_date(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    wrds_db: Connectable | None = None,
+    rollup: bool = False,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    quote_statistics: bool = False,
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    Starting from 9:30AM NYC time and ending at 16:00, obtain bars of national best bed and offer (NBBO)
+    as a Pandas dataframe by querying WRDS TAQ complete_nbbo_* tables.
+
+    No checking is done here for weekends, half days or holidays.  60 minute bars by necessity have one
+    window that really only contains 30 minutes of data
+
+    No support for symbol suffixes.
+
+    With `rollup`, bars are computed locally from finer cached bars of the same tickers, if
+    there are any, without querying WRDS at all.
+
+    `bar_seconds`, `session`, a TAQFiles `wrds_db`, `columns`, `compact` and `output` are
+    as for taq_trade_bars_on_date().
+
+    With `quote_statistics`, bars also have the count of quotes, their time-weighted
+    spread and midquote, and the least, greatest and first midquote, as computed by
+    taq_nbbo_bars_sql().  Such bars are never rolled up.
+
+    Rookie alert: prices here are not dividend adjusted
+    """
+    db = get_wrds_connection(wrds_db)
+    grid = bar_grid(bar_minutes, bar_seconds, session)
+
+    query_columns = bar_query_columns(
+        columns, trades=False, nbbo=True, quote_statistics=quote_statistics
+    )
+
+    bars = None
+    if isinstance(db, TAQFiles):
+        bars = db.nbbo_bars(
+            _unique_tickers(tickers), date, bar_minutes, grid, quote_statistics
+        )
+    elif rollup and grid is None and not quote_statistics:
+        bars = _rolled_up_nbbo_bars(db, tickers, date, bar_minutes)
+    if bars is None:
+
+        def sql(tickers: list[str] | str, span=None) -> str:
+            span_seconds, span_session = span_grid(
+                bar_minutes, bar_seconds, session, span
+            )
+            return projected_sql(
+                taq_nbbo_bars_sql(
+                    tickers,
+                    date,
+                    bar_minutes,
+                    wrds_db=db,
+                    bar_seconds=span_seconds,
+                    session=span_session,
+                    quote_statistics=quote_statistics,
+                ),
+                query_columns,
+            )
+
+        edges = bar_edges(bar_minutes, grid)
+        bars = cached_sql_by_ticker(
+            db, tickers, sql, edges=edges, arrow=_keeps_arrow(output)
+        )
+
+    return _shaped(_finish_nbbo_bars(bars), columns, False, compact, output)
+
+
+@metrics.instrumented
+def taq_bars_on_date(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    group_by_exchange: bool = False,
+    restrict_to_exchanges: tuple[str] | None = None,
+    include_first_and_last: bool = False,
+    how: str = "outer",
+    wrds_db: Connectable | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    first_last_method: str = "windows",
+    quote_statistics: bool = False,
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    Trade bars as from taq_trade_bars_on_date() alongside NBBO bars as from
+    taq_nbbo_bars_on_date(), joined on (ticker, date, window_time) in a single query.
+
+    With the default `how="outer"`, windows with quotes but no trades are kept, their
+    trade columns missing, and vice versa.  Use "left" to keep only windows with trades,
+    or "inner" for those with both.  With `group_by_exchange`, each exchange's bar carries
+    the same NBBO.  `columns`, of either kind of bar, `compact`, `output`, `statistics`
+    and `quantiles` are as for taq_trade_bars_on_date(), and `quote_statistics` as for
+    taq_nbbo_bars_on_date().
+    """
+    db = get_wrds_connection(wrds_db)
+    statistics = trade_statistics(statistics)
+    query_columns = bar_query_columns(
+        columns,
+        nbbo=True,
+        quote_statistics=quote_statistics,
+        group_by_exchange=group_by_exchange,
+        include_first_and_last=include_first_and_last,
+        statistics=statistics,
+        quantiles=quantiles,
+    )
+
+    def sql(tickers: list[str] | str, span=None) -> str:
+        span_seconds, span_session = span_grid(bar_minutes, bar_seconds, session, span)
+        return projected_sql(
+            taq_bars_sql(
+                tickers,
+                date,
+                bar_minutes,
+                group_by_exchange,
+                restrict_to_exchanges,
+                include_first_and_last=include_first_and_last,
+                how=how,
+                wrds_db=db,
+                bar_seconds=span_seconds,
+                session=span_session,
+                quote_statistics=quote_statistics,
+                statistics=statistics,
+                quantiles=quantiles,
+                first_last_method=first_last_method,
+            ),
+            query_columns,
+        )
+
+    if isinstance(db, TAQFiles):
+        tickers = _unique_tickers(tickers)
+        grid = bar_grid(bar_minutes, bar_seconds, session)
+        trade_bars = db.trade_bars(
+            tickers,
+            date,
+            bar_minutes,
+            group_by_exchange,
+            restrict_to_exchanges,
+            include_first_and_last,
+            grid,
+            statistics,
+            quantiles,
+        )
+        nbbo_bars = db.nbbo_bars(tickers, date, bar_minutes, grid, quote_statistics)
+        # As the SQL's join, with its ORDER BY
+        bars = _sort_bars(
+            trade_bars.merge(nbbo_bars, how=how, on=["ticker", "date", "window_time"])
+        )
+    else:
+        edges = bar_edges(bar_minutes, bar_grid(bar_minutes, bar_seconds, session))
+        bars = cached_sql_by_ticker(
+            db, tickers, sql, edges=edges, arrow=_keeps_arrow(output)
+        )
+
+    bars = _finish_trade_bars(bars, include_first_and_last)
+    with metrics.measure("timestamps") as event:
+        event.rows = len(bars)
+        bars = _finish_quote_times(bars)
+    return _shaped(bars, columns, group_by_exchange, compact, output)
+
+
+#####################
+## Ranges of Dates ##
+#####################
+
+
+def open_wrds_connections(n: int, **kwargs) -> list[wrds.sql.Connection]:
+    """
+    Open `n` independent WRDS connections, suitable for passing as `wrds_db` to the
+    *_between functions so that they may run that many daily queries at once
+    """
+    return [wrds.Connection(**kwargs) for _ in range(n)]
+
+
+def taq_trading_dates(
+    start: datetime.date,
+    end: datetime.date,
+    table_prefix: str = "ctm",
+    wrds_db: Connectable | None = None,
+) -> list[datetime.date]:
+    """
+    Dates from `start` to `end` inclusive for which WRDS has a daily `{table_prefix}_YYYYMMDD`
+    table, looking in the taqm_YYYY library for each year the range touches.  Weekends and
+    holidays thus drop out naturally.
+    """
+    db = get_wrds_connection(wrds_db)
+    daily_table = re.compile(rf"{table_prefix}_(\d{{8}})")
+
+    dates = []
+    for year in range(start.year, end.year + 1):
+        for table in db.list_tables(library=f"taqm_{year}"):
+            match = daily_table.fullmatch(table)
+            if match:
+                date = datetime.datetime.strptime(match.group(1), "%Y%m%d").date()
+                if start <= date <= end:
+                    dates.append(date)
+    return sorted(dates)
+
+
+def _date_batches(
+    dates: list[datetime.date], batch_days: int
+) -> list[list[datetime.date]]:
+    """
+    `dates` in runs of up to `batch_days`, none of them spanning two years.  Every table in
+    a year's library is laid out alike, so the days of a run all give the same column types.
+    """
+    assert batch_days >= 1
+    batches = []
+    for _, year_dates in itertools.groupby(dates, key=lambda date: date.year):
+        year_dates = list(year_dates)
+        for start in range(0, len(year_dates), batch_days):
+            end = start + batch_days
+            batches.append(year_dates[start:end])
+    return batches
+
+
+def _bars_between(
+    tickers: list[str] | str,
+    dates: list[datetime.date],
+    day_sql,
+    finish,
+    wrds_db: Connectable | list[wrds.sql.Connection] | None,
+    day_files=None,
+    batch_days: int = 1,
+    edges: list[datetime.time] | None = None,
+    arrow: bool = False,
+) -> pd.DataFrame:
+    """
+    Query `day_sql(tickers, date, db)` for each date, with as many queries in flight at once
+    as we have connections, and post-process each day's result with `finish(bars)`.  From
+    TAQFiles, each day's bars are instead `day_files(tickers, date, files)`.  Up to
+    `batch_days` days are combined into each query.  The `edges` of the bars, and `arrow`,
+    are as for cached_sql_by_ticker(), though bars from TAQFiles are always DataFrames.
+    """
+    if isinstance(wrds_db, (list, tuple)):
+        connections = [get_wrds_connection(db) for db in wrds_db]
+    else:
+        db = get_wrds_connection(wrds_db)
+        # A Session gives each concurrent caller a pooled connection of its own
+        connections = [db] * db.pool_size if isinstance(db, Session) else [db]
+    arrow = arrow and not any(isinstance(db, TAQFiles) for db in connections)
+
+    # A wrds Connection is not safe to share between threads, so each is checked out in turn
+    idle_connections = queue.Queue()
+    for db in connections:
+        idle_connections.put(db)
+
+    def some_days(dates: list[datetime.date]) -> list[pd.DataFrame]:
+        label = "..".join(dict.fromkeys([dates[0].isoformat(), dates[-1].isoformat()]))
+        with metrics.labelled(date=label):
+            db = idle_connections.get()
+            try:
+                if isinstance(db, TAQFiles):
+                    days = [day_files(_unique_tickers(tickers), d, db) for d in dates]
+                else:
+                    days = cached_sql_by_date_and_ticker(
+                        db,
+                        tickers,
+                        dates,
+                        lambda tickers, date, *span: day_sql(tickers, date, db, *span),
+                        edges,
+                        arrow,
+                    )
+            finally:
+                idle_connections.put(db)
+            return [finish(bars) for bars in days]
+
+    batches = _date_batches(dates, batch_days)
+    # The spare worker lets post-processing of finished days overlap with queries in flight
+    with ThreadPoolExecutor(max_workers=len(connections) + 1) as executor:
+        # Each worker carries on with the labels of this call
+        contexts = [contextvars.copy_context() for _ in batches]
+        days = [
+            bars
+            for batch in executor.map(
+                lambda context, batch: context.run(some_days, batch), contexts, batches
+            )
+            for bars in batch
+        ]
+
+    if not days:
+        return pd.DataFrame()
+    return _concat_bars(days)
+
+
+@metrics.instrumented
+def taq_trade_bars_between(
+    tickers: list[str] | str,
+    start: datetime.date,
+    end: datetime.date,
+    bar_minutes: int = 30,
+    group_by_exchange: bool = False,
+    restrict_to_exchanges: tuple[str] | None = None,
+    include_first_and_last: bool = False,
+    wrds_db: Connectable | list[wrds.sql.Connection] | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    first_last_method: str = "windows",
+    batch_days: int = 1,
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    Trade bars as from taq_trade_bars_on_date() for every trading day from `start` to `end`
+    inclusive, in date order.
+
+    Days are queried concurrently, one per connection, when `wrds_db` is a list of
+    connections such as those from open_wrds_connections(), or up to `pool_size` at once
+    when it is a Session.
+
+    With `batch_days` above one, up to that many days of the same year are combined into a
+    single UNION ALL query, which for a few tickers saves much of the time spent waiting on
+    round trips to WRDS.  Each day's bars are still cached on their own.
+
+    Bars are made compact, or converted to the `output` asked for, only once all days are
+    together, so that their categories or dictionaries are the same throughout.
+    """
+    connections = wrds_db if isinstance(wrds_db, (list, tuple)) else [wrds_db]
+    dates = taq_trading_dates(start, end, "ctm", wrds_db=connections[0])
+    statistics = trade_statistics(statistics)
+    query_columns = bar_query_columns(
+        columns,
+        group_by_exchange=group_by_exchange,
+        include_first_and_last=include_first_and_last,
+        statistics=statistics,
+        quantiles=quantiles,
+    )
+
+    def day_sql(
+        tickers: list[str] | str, date: datetime.date, db: Connectable, span=None
+    ) -> str:
+        span_seconds, span_session = span_grid(bar_minutes, bar_seconds, session, span)
+        return projected_sql(
+            taq_trade_bars_sql(
+                tickers,
+                date,
+                bar_minutes,
+                group_by_exchange,
+                restrict_to_exchanges,
+                include_first_and_last=include_first_and_last,
+                wrds_db=db,
+                bar_seconds=span_seconds,
+                session=span_session,
+                statistics=statistics,
+                quantiles=quantiles,
+                first_last_method=first_last_method,
+            ),
+            query_columns,
+        )
+
+    def day_files(
+        tickers: list[str], date: datetime.date, files: TAQFiles
+    ) -> pd.DataFrame:
+        return files.trade_bars(
+            tickers,
+            date,
+            bar_minutes,
+            group_by_exchange,
+            restrict_to_exchanges,
+            include_first_and_last,
+            bar_grid(bar_minutes, bar_seconds, session),
+            statistics,
+            quantiles,
+        )
+
+    def finish(bars: pd.DataFrame) -> pd.DataFrame:
+        return _finish_trade_bars(bars, include_first_and_last)
+
+    edges = bar_edges(bar_minutes, bar_grid(bar_minutes, bar_seconds, session))
+    bars = _bars_between(
+        tickers,
+        dates,
+        day_sql,
+        finish,
+        wrds_db,
+        day_files,
+        batch_days,
+        edges,
+        _keeps_arrow(output),
+    )
+    return _shaped(bars, columns, group_by_exchange, compact, output)
+
+
+@metrics.instrumented
+def taq_nbbo_bars_between(
+    tickers: list[str] | str,
+    start: datetime.date,
+    end: datetime.date,
+    bar_minutes: int = 30,
+    wrds_db: Connectable | list[wrds.sql.Connection] | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    quote_statistics: bool = False,
+    batch_days: int = 1,
+    output: str = "pandas",
+) -> pd.DataFrame:
+    """
+    NBBO bars as from taq_nbbo_bars_on_date() for every trading day from `start` to `end`
+    inclusive, in date order.
+
+    Days are queried concurrently, one per connection, when `wrds_db` is a list of
+    connections such as those from open_wrds_connections(), or up to `pool_size` at once
+    when it is a Session.  `batch_days` is as for taq_trade_bars_between().
+    """
+    connections = wrds_db if isinstance(wrds_db, (list, tuple)) else [wrds_db]
+    dates = taq_trading_dates(start, end, "complete_nbbo", wrds_db=connections[0])
+    query_columns = bar_query_columns(
+        columns, trades=False, nbbo=True, quote_statistics=quote_statistics
+    )
+
+    def day_sql(
+        tickers: list[str] | str, date: datetime.date, db: Connectable, span=None
+    ) -> str:
+        span_seconds, span_session = span_grid(bar_minutes, bar_seconds, session, span)
+        return projected_sql(
+            taq_nbbo_bars_sql(
+                tickers,
+                date,
+                bar_minutes,
+                wrds_db=db,
+                bar_seconds=span_seconds,
+                session=span_session,
+                quote_statistics=quote_statistics,
+            ),
+            query_columns,
+        )
+
+    def day_files(
+        tickers: list[str], date: datetime.date, files: TAQFiles
+    ) -> pd.DataFrame:
+        grid = bar_grid(bar_minutes, bar_seconds, session)
+        return files.nbbo_bars(tickers, date, bar_minutes, grid, quote_statistics)
+
+    edges = bar_edges(bar_minutes, bar_grid(bar_minutes, bar_seconds, session))
+    bars = _bars_between(
+        tickers,
+        dates,
+        day_sql,
+        _finish_nbbo_bars,
+        wrds_db,
+        day_files,
+        batch_days,
+        edges,
+        _keeps_arrow(output),
+    )
+    return _shaped(bars, columns, False, compact, output)
+
+
+#######################
+## Streaming Results ##
+#######################
+
+
+def _stream_raw_sql(
+    db: wrds.sql.Connection,
+    sql: str,
+    fetch_size: int,
+    date_cols: tuple[str],
+) -> Iterator[pd.DataFrame]:
+    connection = db.connection
+    previous = connection.get_execution_options()
+    # Server-side cursors only live inside a transaction, which the AUTOCOMMIT connections
+    # wrds makes never open.  SQLAlchemy still tracks a nominal one, which must end before
+    # we can change the isolation level, but committing it has no effect.
+    if connection.in_transaction():
+        connection.commit()
+    connection.execution_options(
+        isolation_level=connection.default_isolation_level,
+        stream_results=True,
+        max_row_buffer=fetch_size,
+    )
+    chunks = None
+    try:
+        chunks = pd.read_sql_query(
+            sql,
+            connection,
+            chunksize=fetch_size,
+            coerce_float=True,
+            parse_dates=list(date_cols),
+            dtype_backend="numpy_nullable",  # As wrds.Connection.raw_sql() does
+        )
+        yield from chunks
+    finally:
+        if chunks is not None:
+            chunks.close()  # Closes the cursor on the server, should we stop early
+        connection.rollback()
+        connection.execution_options(
+            isolation_level=previous.get("isolation_level", "AUTOCOMMIT"),
+            stream_results=previous.get("stream_results", False),
+            max_row_buffer=previous.get("max_row_buffer", 1000),
+        )
+
+
+def stream_sql(
+    db: Connectable,
+    sql: str,
+    fetch_size: int = 100_000,
+    order_by: str | None = None,
+    time_cols: tuple[str] = TIME_COLUMNS,
+    date_cols: tuple[str] = DATE_COLUMNS,
+) -> Iterator[pd.DataFrame]:
+    """
+    As cached_sql(), but yielding the result `fetch_size` rows at a time from a server-side
+    cursor, sorted by the `order_by` SQL expression if given, and bypassing the caches.
+
+    The connection is tied up until the iteration finishes or the generator is closed.
+    """
+    if order_by is not None:
+        sql = f"SELECT * FROM ({sql}) AS unordered ORDER BY {order_by}"
+
+    if isinstance(db, Session):
+        with db.connection() as conn:
+            yield from stream_sql(conn, sql, fetch_size, None, time_cols, date_cols)
+        return
+
+    for chunk in _stream_raw_sql(db, sql, fetch_size, date_cols):
+        yield _parse_time_columns(chunk, time_cols)
+
+
+def _chunks(bars: pd.DataFrame, fetch_size: int) -> Iterator[pd.DataFrame]:
+    """Bars computed from TAQFiles, in chunks as if streamed"""
+    for start in range(0, len(bars), fetch_size):
+        end = start + fetch_size
+        yield bars.iloc[start:end].reset_index(drop=True)
+
+
+def _whole_tickers(chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+    """
+    Regroup chunks ordered by ticker so that no ticker is split between two of them,
+    holding back each chunk's last ticker until we have seen all its rows
+    """
+    held = None
+    for chunk in chunks:
+        if held is not None:
+            chunk = pd.concat([held, chunk], ignore_index=True)
+        last_ticker = chunk["ticker"].to_numpy()[-1]
+        complete = (chunk["ticker"] != last_ticker).to_numpy(dtype=bool)
+        held = chunk[~complete].reset_index(drop=True)
+        if complete.any():
+            yield chunk[complete].reset_index(drop=True)
+    if held is not None and len(held):
+        yield held
+
+
+def iter_trade_bars(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    group_by_exchange: bool = False,
+    restrict_to_exchanges: tuple[str] | None = None,
+    include_first_and_last: bool = False,
+    fetch_size: int = 100_000,
+    order_by_ticker: bool = False,
+    wrds_db: Connectable | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    statistics: str | list[str] | None = None,
+    quantiles: tuple[float, ...] | None = None,
+    first_last_method: str = "windows",
+    output: str = "pandas",
+) -> Iterator[pd.DataFrame]:
+    """
+    The bars of taq_trade_bars_on_date(), a chunk of about `fetch_size` rows at a time, so
+    that large pulls may be written out or reduced without holding them all in memory.
+
+    With `order_by_ticker`, bars come sorted by ticker and each ticker's bars arrive in a
+    single chunk.  Nothing is cached.  With `compact`, each chunk has categories of its own,
+    as with an `output` of "arrow" or "polars" each has dictionaries of its own.
+    """
+    db = get_wrds_connection(wrds_db)
+    statistics = trade_statistics(statistics)
+    if isinstance(db, TAQFiles):
+        bars = db.trade_bars(
+            _unique_tickers(tickers),
+            date,
+            bar_minutes,
+            group_by_exchange,
+            restrict_to_exchanges,
+            include_first_and_last,
+            bar_grid(bar_minutes, bar_seconds, session),
+            statistics,
+            quantiles,
+        )
+        chunks = _chunks(bars, fetch_size)
+    else:
+        sql = projected_sql(
+            taq_trade_bars_sql(
+                tickers,
+                date,
+                bar_minutes,
+                group_by_exchange,
+                restrict_to_exchanges,
+                include_first_and_last=include_first_and_last,
+                wrds_db=db,
+                bar_seconds=bar_seconds,
+                session=session,
+                statistics=statistics,
+                quantiles=quantiles,
+                first_last_method=first_last_method,
+            ),
+            bar_query_columns(
+                columns,
+                group_by_exchange=group_by_exchange,
+                include_first_and_last=include_first_and_last,
+                statistics=statistics,
+                quantiles=quantiles,
+            ),
+        )
+        order_by = None
+        if order_by_ticker:
+            order_by = "ticker, date, window_time" + (
+                ", ex" if group_by_exchange else ""
+            )
+        chunks = stream_sql(db, sql, fetch_size, order_by=order_by)
+    if order_by_ticker:
+        chunks = _whole_tickers(chunks)
+
+    for chunk in chunks:
+        chunk = _finish_trade_bars(chunk, include_first_and_last)
+        yield _shaped(chunk, columns, group_by_exchange, compact, output)
+
+
+def iter_nbbo_bars(
+    tickers: list[str] | str,
+    date: datetime.date,
+    bar_minutes: int = 30,
+    fetch_size: int = 100_000,
+    order_by_ticker: bool = False,
+    wrds_db: Connectable | None = None,
+    bar_seconds: int | None = None,
+    session: tuple[datetime.time, datetime.time] | None = None,
+    columns: list[str] | None = None,
+    compact: bool = False,
+    quote_statistics: bool = False,
+    output: str = "pandas",
+) -> Iterator[pd.DataFrame]:
+    """
+    The bars of taq_nbbo_bars_on_date(), a chunk of about `fetch_size` rows at a time.
+    See iter_trade_bars().
+    """
+    db = get_wrds_connection(wrds_db)
+    if isinstance(db, TAQFiles):
+        grid = bar_grid(bar_minutes, bar_seconds, session)
+        bars = db.nbbo_bars(
+            _unique_tickers(tickers), date, bar_minutes, grid, quote_statistics
+        )
+        chunks = _chunks(bars, fetch_size)
+    else:
+        sql = projected_sql(
+            taq_nbbo_bars_sql(
+                tickers,
+                date,
+                bar_minutes,
+                wrds_db=db,
+                bar_seconds=bar_seconds,
+                session=session,
+                quote_statistics=quote_statistics,
+            ),
+            bar_query_columns(
+                columns, trades=False, nbbo=True, quote_statistics=quote_statistics
+            ),
+        )
+        order_by = "ticker, date, window_time" if order_by_ticker else None
+        chunks = stream_sql(db, sql, fetch_size, order_by=order_by)
+    if order_by_ticker:
+        chunks = _whole_tickers(chunks)
+
+    for chunk in chunks:
+        yield _shaped(_finish_nbbo_bars(chunk), columns, False, compact, output)
@@ -6,11 +6,14 @@ import hashlib
 
 import pandas as pd
 import wrds
+import taqy.usequity as usequity
 from taqy.usequity import (
     connect_to_wrds,
     get_wrds_connection,
     set_default_connection,
     cached_sql as real_cached_sql,
+    query_sql as real_query_sql,
+    CACHED_QUERIES,
 )
 
 # License: GPLv3 or later
@@ -96,7 +99,8 @@ def mock_or_call_cached_sql(use_db_cache, db_cache_dir, write_db_cache):
                     return pd.read_parquet(cache_file)
 
                 mock_sql.side_effect = _mocked_cached_sql
-                yield
+                with patch("taqy.usequity.query_sql", side_effect=_mocked_cached_sql):
+                    yield
     else:
         print("Wrapping cached_sql", file=sys.stderr)
         wrds_username = os.environ.get("WRDS_USERNAME")
@@ -120,25 +124,45 @@ def mock_or_call_cached_sql(use_db_cache, db_cache_dir, write_db_cache):
             )
             connect_to_wrds(wrds_username=wrds_username)
 
-        if write_db_cache:
-
-            def _wrapped_cached_sql(db: wrds.sql.Connection | None, sql: str):
-                df = real_cached_sql(db=db or get_wrds_connection(), sql=sql)
-                sql_hash = hashlib.md5(sql.encode("utf-8")).hexdigest()
-                cache_file = os.path.join(db_cache_dir, f"{sql_hash}.parquet")
-                print(
-                    f"Writing DB cache file {cache_file}",
-                    file=sys.stderr,
-                )
-                df.to_parquet(cache_file, index=False)
+        def _wrap(real_sql):
+            def _wrapped_sql(db: wrds.sql.Connection | None, sql: str):
+                df = real_sql(db=db or get_wrds_connection(), sql=sql)
+                if write_db_cache:
+                    sql_hash = hashlib.md5(sql.encode("utf-8")).hexdigest()
+                    cache_file = os.path.join(db_cache_dir, f"{sql_hash}.parquet")
+                    print(
+                        f"Writing DB cache file {cache_file}",
+                        file=sys.stderr,
+                    )
+                    df.to_parquet(cache_file, index=False)
                 return df
 
-        else:
-            print("Skipped saving DB cache", file=sys.stderr)
+            return _wrapped_sql
 
-            def _wrapped_cached_sql(db: wrds.sql.Connection | None, sql: str):
-                df = real_cached_sql(db=db or get_wrds_connection(), sql=sql)
-                return df
+        if not write_db_cache:
+            print("Skipped saving DB cache", file=sys.stderr)
 
-        with patch("taqy.usequity.cached_sql", side_effect=_wrapped_cached_sql):
+        with (
+            patch("taqy.usequity.cached_sql", side_effect=_wrap(real_cached_sql)),
+            patch("taqy.usequity.query_sql", side_effect=_wrap(real_query_sql)),
+        ):
             yield
+
+
+@pytest.fixture(autouse=True)
+def fresh_query_cache():
+    """
+    Results are cached ticker by ticker, so without this a test could be served by its
+    predecessors and ask for different, possibly unmocked, queries
+    """
+    CACHED_QUERIES.clear()
+    yield
+
+
+@pytest.fixture
+def unmocked(monkeypatch):
+    """Undo the mocking of WRDS access above, for tests with databases of their own"""
+    monkeypatch.setattr(usequity, "cached_sql", real_cached_sql)
+    monkeypatch.setattr(usequity, "query_sql", real_query_sql)
+    monkeypatch.setattr(usequity, "get_wrds_connection", get_wrds_connection)
+    monkeypatch.setattr(usequity, "DISK_CACHE", None)
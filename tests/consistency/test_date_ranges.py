@@ -0,0 +1,155 @@
+import os
+import datetime
+import pandas as pd
+import pytest
+import taqy.usequity as usequity
+from taqy.synthetic import LocalConnection, load_synthetic_day, synthetic_day
+from taqy.usequity import (
+    taq_nbbo_bars_between,
+    taq_nbbo_bars_on_date,
+    taq_trade_bars_between,
+    taq_trade_bars_on_date,
+    union_all_sql,
+)
+
+DATES = [datetime.date(2024, 2, 29), datetime.date(2024, 7, 25)]
+
+
+def _list_tables(library: str) -> list[str]:
+    tables = []
+    for date in DATES:
+        if library == f"taqm_{date.year}":
+            date_str = date.strftime("%Y%m%d")
+            tables += [f"ctm_{date_str}", f"complete_nbbo_{date_str}"]
+            tables += [f"luld_ctm_{date_str}", f"nbbom_{date_str}"]
+    tables += [f"ctm_{library[-4:]}", f"complete_nbbo_{library[-4:]}"]
+    return tables
+
+
+def test_consistency_between():
+    """
+    Ensures date range queries agree with the single day queries they are made of
+    """
+    tickers = ["SPY", "JPM", "LLY"]
+    # The mocked connection from conftest
+    usequity.get_wrds_connection().list_tables.side_effect = _list_tables
+
+    nbbo = taq_nbbo_bars_between(
+        tickers,
+        start=datetime.date(2024, 1, 1),
+        end=datetime.date(2024, 12, 31),
+        bar_minutes=6,
+        wrds_db=[None, None],
+    )
+    pd.testing.assert_frame_equal(
+        nbbo,
+        pd.concat(
+            [taq_nbbo_bars_on_date(tickers, date=d, bar_minutes=6) for d in DATES],
+            ignore_index=True,
+        ),
+    )
+
+    trades = taq_trade_bars_between(
+        tickers,
+        start=datetime.date(2024, 2, 1),
+        end=datetime.date(2024, 2, 29),
+        bar_minutes=60,
+        group_by_exchange=True,
+        include_first_and_last=True,
+    )
+    pd.testing.assert_frame_equal(
+        trades,
+        taq_trade_bars_on_date(
+            tickers,
+            date=DATES[0],
+            bar_minutes=60,
+            group_by_exchange=True,
+            include_first_and_last=True,
+        ),
+    )
+
+
+def test_between_no_trading_days():
+    usequity.get_wrds_connection().list_tables.side_effect = _list_tables
+    bars = taq_trade_bars_between(
+        ["SPY"],
+        start=datetime.date(2024, 3, 1),
+        end=datetime.date(2024, 3, 31),
+        columns=["vwap"],
+    )
+    assert bars.empty
+    assert list(bars.columns) == ["ticker", "date", "window_time", "vwap"]
+
+
+def test_batched_between(monkeypatch):
+    """
+    Days batched into one query give the same bars as days queried one by one
+    """
+    tickers = ["SPY", "JPM", "LLY"]
+    usequity.get_wrds_connection().list_tables.side_effect = _list_tables
+    # The mocked responses are of single days, so answer each part of a batch with those
+    mocked_query_sql = usequity.query_sql
+    batches = []
+
+    def query_parts(db, sql):
+        parts = sql.split("\nUNION ALL\n")
+        batches.append(len(parts))
+        if len(parts) == 1:
+            return mocked_query_sql(db, sql)
+        return pd.concat(
+            [mocked_query_sql(db, part[1:-2]) for part in parts], ignore_index=True
+        )
+
+    monkeypatch.setattr(usequity, "query_sql", query_parts)
+    nbbo = taq_nbbo_bars_between(
+        tickers,
+        start=datetime.date(2024, 1, 1),
+        end=datetime.date(2024, 12, 31),
+        bar_minutes=6,
+        batch_days=5,
+    )
+    assert batches == [2]
+    pd.testing.assert_frame_equal(
+        nbbo,
+        pd.concat(
+            [taq_nbbo_bars_on_date(tickers, date=d, bar_minutes=6) for d in DATES],
+            ignore_index=True,
+        ),
+    )
+    # Each day is cached on its own, so a day can be had again without asking
+    taq_nbbo_bars_on_date(tickers[1:], date=DATES[1], bar_minutes=6)
+    assert batches == [2]
+
+    assert union_all_sql(["SELECT 1"]) == "SELECT 1"
+    assert usequity._date_batches(
+        [datetime.date(2023, 12, 29), *DATES, datetime.date(2024, 8, 1)], 2
+    ) == [[datetime.date(2023, 12, 29)], DATES, [datetime.date(2024, 8, 1)]]
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TAQY_BENCHMARK_DB_URL"),
+    reason="Needs a PostgreSQL database to fill, at $TAQY_BENCHMARK_DB_URL",
+)
+def test_batched_between_sql(unmocked):
+    """Batched days agree with days queried one by one, on synthetic days"""
+    tickers = ["SPY", "JPM", "LLY"]
+    dates = [datetime.date(2024, 2, 27), datetime.date(2024, 2, 28)]
+    db = LocalConnection(os.environ["TAQY_BENCHMARK_DB_URL"])
+    for date in dates:
+        ctm, nbbo = synthetic_day(date, 4, trades_per_second=0.5, same_time_share=0.0)
+        load_synthetic_day(db, ctm, nbbo)
+    try:
+        for between, kwargs in (
+            (taq_trade_bars_between, {"include_first_and_last": True}),
+            (taq_trade_bars_between, {"group_by_exchange": True, "bar_seconds": 90}),
+            (taq_nbbo_bars_between, {"quote_statistics": True}),
+            (taq_nbbo_bars_between, {"columns": ["best_bid"]}),
+        ):
+            one_by_one = between(tickers, dates[0], dates[-1], 5, wrds_db=db, **kwargs)
+            usequity.CACHED_QUERIES.clear()
+            batched = between(
+                tickers, dates[0], dates[-1], 5, wrds_db=db, batch_days=2, **kwargs
+            )
+            pd.testing.assert_frame_equal(batched, one_by_one)
+    finally:
+        db.close()
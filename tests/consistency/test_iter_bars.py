@@ -0,0 +1,59 @@
+import datetime
+import pandas as pd
+import taqy.usequity as usequity
+from taqy.usequity import (
+    iter_nbbo_bars,
+    iter_trade_bars,
+    taq_nbbo_bars_on_date,
+    taq_trade_bars_on_date,
+)
+
+
+def _stream_mocked_sql(db, sql, fetch_size, order_by=None):
+    """Serve the mocked cached_sql results a few rows at a time, as a cursor would"""
+    df = usequity.cached_sql(db, sql)
+    if order_by is not None:
+        df = df.sort_values(order_by.split(", "), ignore_index=True)
+    for start in range(0, len(df), fetch_size):
+        stop = start + fetch_size
+        yield df.iloc[start:stop].reset_index(drop=True)
+
+
+def test_consistency_streaming(monkeypatch):
+    """
+    Ensures streamed bars, however chunked, add up to the bars fetched all at once
+    """
+    monkeypatch.setattr(usequity, "stream_sql", _stream_mocked_sql)
+    tickers = ["SPY", "JPM", "LLY"]
+    date = datetime.date(2024, 2, 29)
+
+    nbbo = taq_nbbo_bars_on_date(tickers, date=date, bar_minutes=6)
+    chunks = list(iter_nbbo_bars(tickers, date=date, bar_minutes=6, fetch_size=7))
+    assert max(len(chunk) for chunk in chunks) == 7
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), nbbo)
+
+    trades = taq_trade_bars_on_date(
+        tickers,
+        date=date,
+        bar_minutes=60,
+        group_by_exchange=True,
+        include_first_and_last=True,
+    )
+    chunks = list(
+        iter_trade_bars(
+            tickers,
+            date=date,
+            bar_minutes=60,
+            group_by_exchange=True,
+            include_first_and_last=True,
+            fetch_size=50,
+            order_by_ticker=True,
+        )
+    )
+    # Each ticker's bars arrive together
+    assert [chunk.ticker.unique().tolist() for chunk in chunks] == [
+        ["JPM"],
+        ["LLY"],
+        ["SPY"],
+    ]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), trades)
@@ -0,0 +1,94 @@
+import datetime
+import pandas as pd
+import pytest
+import taqy.usequity as usequity
+from taqy.rollup import rollup_nbbo_bars, rollup_trade_bars
+from taqy.usequity import (
+    taq_nbbo_bars_on_date,
+    taq_nbbo_bars_sql,
+    taq_trade_bars_on_date,
+    taq_trade_bars_sql,
+)
+
+TICKERS = ["SPY", "JPM", "LLY", "PBPB"]
+DATE = datetime.date(2024, 2, 29)
+FINE_COARSE = [(1, 2), (1, 6), (2, 6), (6, 30), (6, 60), (30, 60), (1, 60)]
+
+
+@pytest.mark.parametrize("fine_minutes, bar_minutes", FINE_COARSE)
+def test_nbbo_rollup(fine_minutes, bar_minutes):
+    fine = usequity.cached_sql(None, taq_nbbo_bars_sql(TICKERS, DATE, fine_minutes))
+    coarse = usequity.cached_sql(None, taq_nbbo_bars_sql(TICKERS, DATE, bar_minutes))
+    pd.testing.assert_frame_equal(
+        rollup_nbbo_bars(fine, fine_minutes, bar_minutes),
+        coarse.sort_values(["ticker", "window_time"], ignore_index=True),
+    )
+
+
+@pytest.mark.parametrize("fine_minutes, bar_minutes", FINE_COARSE)
+@pytest.mark.parametrize("group_by_exchange", [False, True])
+@pytest.mark.parametrize("include_first_and_last", [False, True])
+def test_trade_rollup(
+    fine_minutes, bar_minutes, group_by_exchange, include_first_and_last
+):
+    def bars(minutes: int) -> pd.DataFrame:
+        sql = taq_trade_bars_sql(
+            TICKERS,
+            DATE,
+            minutes,
+            group_by_exchange,
+            include_first_and_last=include_first_and_last,
+        )
+        return usequity.cached_sql(None, sql)
+
+    keys = ["ticker", "date", "window_time"] + (["ex"] if group_by_exchange else [])
+    coarse = bars(bar_minutes).sort_values(keys, ignore_index=True)
+    rolled = rollup_trade_bars(
+        bars(fine_minutes), fine_minutes, bar_minutes, group_by_exchange, coarse
+    )
+    assert list(rolled.columns) == list(coarse.columns)
+
+    # Which of several trades in the same microsecond is first or last is arbitrary
+    ends = [c for c in coarse.columns if c.startswith(("first_trade_", "last_trade_"))]
+    pd.testing.assert_frame_equal(
+        rolled.drop(columns=ends), coarse.drop(columns=ends), check_exact=False
+    )
+    for column in ("first_trade_time", "last_trade_time"):
+        if column in ends:
+            pd.testing.assert_series_equal(rolled[column], coarse[column])
+
+
+def test_rollup_from_cache(monkeypatch):
+    """
+    Ensures bars are rolled up from finer cached ones, with only medians from the database
+    """
+    queried = []
+    mocked_sql = usequity.query_sql
+    coarse_sql = taq_trade_bars_sql(TICKERS, DATE, 30, include_first_and_last=True)
+    medians_sql = usequity.taq_trade_bar_medians_sql(TICKERS, DATE, 30)
+
+    def query_sql(db, sql):
+        queried.append(sql)
+        return mocked_sql(db, coarse_sql if sql == medians_sql else sql)
+
+    monkeypatch.setattr(usequity, "query_sql", query_sql)
+
+    direct = taq_trade_bars_on_date(
+        TICKERS, DATE, bar_minutes=30, include_first_and_last=True
+    )
+    taq_trade_bars_on_date(TICKERS, DATE, bar_minutes=6, include_first_and_last=True)
+    queried.clear()
+    rolled = taq_trade_bars_on_date(
+        TICKERS, DATE, bar_minutes=30, include_first_and_last=True, rollup=True
+    )
+    assert queried == [medians_sql]
+    pd.testing.assert_frame_equal(
+        rolled[["window_time", "num_trades", "median_price", "first_trade_time"]],
+        direct[["window_time", "num_trades", "median_price", "first_trade_time"]],
+    )
+
+    # Nothing cached that is fine enough, so straight to the database
+    queried.clear()
+    nbbo = taq_nbbo_bars_on_date(TICKERS, DATE, bar_minutes=30, rollup=True)
+    assert queried == [taq_nbbo_bars_sql(TICKERS, DATE, 30)]
+    assert len(nbbo) == 52
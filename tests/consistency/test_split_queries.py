@@ -0,0 +1,74 @@
+import os
+import re
+import datetime
+
+import pandas as pd
+import pytest
+import sqlalchemy as sa
+
+import taqy.usequity as usequity
+from taqy.splitting import statement_timeout, too_big
+from taqy.synthetic import LocalConnection, load_synthetic_day, synthetic_day
+
+
+class OutOfMemory(Exception):
+    pgcode = "53200"
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TAQY_BENCHMARK_DB_URL"),
+    reason="Needs a PostgreSQL database to fill, at $TAQY_BENCHMARK_DB_URL",
+)
+def test_consistency_split_queries(unmocked, monkeypatch):
+    """Bars from queries split by ticker and by time agree with those from one query"""
+    tickers = ["SPY", "JPM", "LLY"]
+    date = datetime.date(2024, 2, 29)
+    ctm, nbbo = synthetic_day(date, 4, trades_per_second=0.5, same_time_share=0.0)
+    # A trade stamped exactly at the open, which the whole day's bars leave out
+    at_open = ctm[ctm["sym_root"] == "SPY"].iloc[[0]]
+    at_open = at_open.assign(time_m=pd.Timedelta("09:30:00"), size=12345)
+    ctm = pd.concat([ctm, at_open], ignore_index=True)
+    db = LocalConnection(os.environ["TAQY_BENCHMARK_DB_URL"])
+    load_synthetic_day(db, ctm, nbbo)
+
+    query_sql = usequity.query_sql
+    span = re.compile(r"time_m >=? '([\d:]+)' AND time_m < '([\d:]+)'")
+
+    def at_most_an_hour_of_one_ticker(db, sql):
+        times = span.search(sql)
+        hours = None
+        if times:
+            start, end = (pd.Timedelta(time) for time in times.groups())
+            hours = (end - start) / pd.Timedelta(hours=1)
+        if "sym_root IN" in sql or hours is None or hours > 1:
+            raise sa.exc.OperationalError(sql, {}, OutOfMemory("out of memory"))
+        return query_sql(db, sql)
+
+    try:
+        with statement_timeout(db, 0.1) as timed_db:
+            with pytest.raises(sa.exc.OperationalError) as error:
+                timed_db.raw_sql("SELECT pg_sleep(2)")
+        assert too_big(error.value)
+        assert db.raw_sql("SHOW statement_timeout").iloc[0, 0] == "0"
+
+        for bars_on_date, kwargs in (
+            (usequity.taq_trade_bars_on_date, {"include_first_and_last": True}),
+            (usequity.taq_trade_bars_on_date, {"bar_seconds": 90}),
+            (usequity.taq_nbbo_bars_on_date, {"quote_statistics": True}),
+            (
+                usequity.taq_trade_bars_on_date,
+                {"session": (datetime.time(8, 30), datetime.time(10, 30))},
+            ),
+        ):
+            usequity.CACHED_QUERIES.clear()
+            whole = bars_on_date(tickers, date, 5, wrds_db=db, **kwargs)
+            usequity.CACHED_QUERIES.clear()
+            splitter = usequity.set_adaptive_splitting(statement_timeout=60)
+            monkeypatch.setattr(usequity, "query_sql", at_most_an_hour_of_one_ticker)
+            split = bars_on_date(tickers, date, 5, wrds_db=db, **kwargs)
+            monkeypatch.setattr(usequity, "query_sql", query_sql)
+            pd.testing.assert_frame_equal(split, whole)
+            assert list(splitter.granularity.values())[0][0] == 1
+    finally:
+        usequity.disable_adaptive_splitting()
+        db.close()
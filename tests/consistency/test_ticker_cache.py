@@ -0,0 +1,45 @@
+import datetime
+import pandas as pd
+import taqy.usequity as usequity
+from taqy.usequity import taq_nbbo_bars_on_date, taq_nbbo_bars_sql
+
+DATE = datetime.date(2024, 2, 29)
+
+
+def test_ticker_cache(monkeypatch):
+    """
+    Ensures overlapping requests only query for tickers not seen before, and give the same
+    bars as a single query would
+    """
+    queried = []
+    mocked_sql = usequity.query_sql
+
+    def query_sql(db, sql):
+        queried.append(sql)
+        return mocked_sql(db, sql)
+
+    monkeypatch.setattr(usequity, "query_sql", query_sql)
+
+    three = taq_nbbo_bars_on_date(["SPY", "JPM", "LLY"], DATE, bar_minutes=6)
+    assert queried == [taq_nbbo_bars_sql(["SPY", "JPM", "LLY"], DATE, 6)]
+
+    # Order and repetition do not matter
+    queried.clear()
+    pd.testing.assert_frame_equal(
+        taq_nbbo_bars_on_date(["LLY", "SPY", "JPM", "SPY"], DATE, bar_minutes=6), three
+    )
+    spy = taq_nbbo_bars_on_date("SPY", DATE, bar_minutes=6)
+    assert queried == []
+    pd.testing.assert_frame_equal(
+        spy, three[three.ticker == "SPY"].reset_index(drop=True)
+    )
+
+    # Only the new ticker is asked for
+    four = taq_nbbo_bars_on_date(["SPY", "JPM", "LLY", "PBPB"], DATE, bar_minutes=6)
+    assert queried == [taq_nbbo_bars_sql("PBPB", DATE, 6)]
+    pd.testing.assert_frame_equal(
+        four,
+        usequity._finish_nbbo_bars(
+            mocked_sql(None, taq_nbbo_bars_sql(["SPY", "JPM", "LLY", "PBPB"], DATE, 6))
+        ),
+    )
@@ -1,6 +1,11 @@
+import os
 import datetime
+
 import pandas as pd
-from taqy.usequity import taq_trade_bars_on_date
+import pytest
+
+from taqy.synthetic import LocalConnection, load_synthetic_day, synthetic_day
+from taqy.usequity import taq_trade_bars_on_date, taq_trade_bars_sql
 
 
 def test_consistency_first_last():
@@ -110,3 +115,60 @@ def test_consistency_first_last():
                         check_names=False,
                         atol=0.01,
                     )
+
+
+def test_first_last_methods_sql():
+    """Aggregates find first and last trades in the one pass that has the statistics"""
+    tickers = ["SPY", "JPM"]
+    date = datetime.date(2024, 2, 29)
+    for group_by_exchange, bar_seconds in [(False, None), (True, None), (False, 90)]:
+        sql = taq_trade_bars_sql(
+            tickers,
+            date,
+            6,
+            group_by_exchange=group_by_exchange,
+            include_first_and_last=True,
+            bar_seconds=bar_seconds,
+            first_last_method="aggregates",
+        )
+        assert sql.count("FROM taqm_2024.ctm_20240229") == 1
+        assert "ROW_NUMBER" not in sql
+        assert "JOIN" not in sql
+    with pytest.raises(ValueError):
+        taq_trade_bars_sql(
+            tickers, date, 6, include_first_and_last=True, first_last_method="sorted"
+        )
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TAQY_BENCHMARK_DB_URL"),
+    reason="Needs a PostgreSQL database to fill, at $TAQY_BENCHMARK_DB_URL",
+)
+def test_consistency_first_last_methods(unmocked):
+    """Either method finds the same first and last trades, on a synthetic day"""
+    tickers = ["SPY", "JPM", "LLY"]
+    date = datetime.date(2024, 2, 29)
+    ctm, nbbo = synthetic_day(date, 4, trades_per_second=0.5, same_time_share=0.0)
+    db = LocalConnection(os.environ["TAQY_BENCHMARK_DB_URL"])
+    load_synthetic_day(db, ctm, nbbo)
+    try:
+        for kwargs in (
+            {"bar_minutes": 6},
+            {"bar_minutes": 60, "group_by_exchange": True},
+            {"bar_minutes": 6, "restrict_to_exchanges": ("N", "Q")},
+            {"bar_minutes": 1, "bar_seconds": 90, "group_by_exchange": True},
+        ):
+            windows = taq_trade_bars_on_date(
+                tickers, date, include_first_and_last=True, wrds_db=db, **kwargs
+            )
+            aggregates = taq_trade_bars_on_date(
+                tickers,
+                date,
+                include_first_and_last=True,
+                first_last_method="aggregates",
+                wrds_db=db,
+                **kwargs,
+            )
+            pd.testing.assert_frame_equal(aggregates, windows)
+    finally:
+        db.close()
@@ -0,0 +1,52 @@
+import datetime
+import pandas as pd
+import taqy.usequity as usequity
+from taqy.usequity import (
+    taq_bars_on_date,
+    taq_bars_sql,
+    taq_nbbo_bars_on_date,
+    taq_nbbo_bars_sql,
+    taq_trade_bars_on_date,
+    taq_trade_bars_sql,
+)
+
+TICKERS = ["SPY", "JPM", "LLY"]
+DATE = datetime.date(2024, 2, 29)
+
+
+def test_consistency_combined(monkeypatch):
+    """
+    Ensures the combined bars are the trade and NBBO bars joined together, emulating the
+    server's side of the join with the mocked results of its two halves
+    """
+    mocked_sql = usequity.query_sql
+    combined_sql = taq_bars_sql(
+        TICKERS, DATE, bar_minutes=6, include_first_and_last=True
+    )
+
+    def query_sql(db, sql):
+        if sql != combined_sql:
+            return mocked_sql(db, sql)
+        trade_sql = taq_trade_bars_sql(
+            TICKERS, DATE, bar_minutes=6, include_first_and_last=True
+        )
+        nbbo_sql = taq_nbbo_bars_sql(TICKERS, DATE, bar_minutes=6)
+        keys = ["ticker", "date", "window_time"]
+        return (
+            mocked_sql(db, trade_sql)
+            .merge(mocked_sql(db, nbbo_sql), on=keys, how="outer")
+            .sort_values(keys, ignore_index=True)
+        )
+
+    monkeypatch.setattr(usequity, "query_sql", query_sql)
+
+    combined = taq_bars_on_date(
+        TICKERS, DATE, bar_minutes=6, include_first_and_last=True
+    )
+    trades = taq_trade_bars_on_date(
+        TICKERS, DATE, bar_minutes=6, include_first_and_last=True
+    )
+    nbbo = taq_nbbo_bars_on_date(TICKERS, DATE, bar_minutes=6)
+
+    pd.testing.assert_frame_equal(combined[trades.columns], trades)
+    pd.testing.assert_frame_equal(combined[nbbo.columns], nbbo)
@@ -0,0 +1,33 @@
+WITH bucketed_trades AS (
+                SELECT
+                    sym_root
+                    , date
+                    , time_m
+                    , price
+                    , size
+                    , ex
+                    , FLOOR(EXTRACT(EPOCH FROM time_m - '10:15:00'::time) / 3600)::integer AS bucket
+                FROM taqm_2024.ctm_20240229
+                WHERE 1=1
+                  AND sym_root IN ('SPY', 'JPM', 'LLY')
+                  AND sym_suffix IS NULL
+                  AND time_m >= '10:15:00' AND time_m < '12:40:00'
+                )
+                SELECT
+                    sym_root AS ticker
+                    , date
+                    , date + LEAST('10:15:00'::interval + (bucket + 1) * '3600 seconds'::interval, '12:40:00'::interval) AS window_time
+                    , COUNT(size) AS num_trades
+                    , SUM(size) AS total_qty
+                    , SUM(price * size) / SUM(size) AS vwap
+                    , AVG(price) AS mean_price_ignoring_size
+                    , PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY size) AS median_size
+                    , PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price) AS median_price
+                    , PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY price*size) AS median_notional
+                    , MAX(price) AS max_price
+                    , MIN(price) AS min_price
+                    , MAX(size) AS max_size
+                    , MIN(size) AS min_size
+                FROM bucketed_trades
+                GROUP BY
+                  sym_root, date, bucket
\ No newline at end of file
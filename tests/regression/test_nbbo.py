@@ -88,3 +88,6 @@ def test_taq_nbbo_bars_on_date(
             atol=0.01,
         )
         pd.testing.assert_series_equal(bars["window_time"], expected["window_time"])
+        pd.testing.assert_series_equal(
+            bars["time_of_last_quote"], expected["time_of_last_quote"]
+        )
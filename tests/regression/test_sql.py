@@ -114,3 +114,45 @@ def test_taq_trade_bar_statistics_sql(
     else:
         expected = read_gold_sql(gold_filename)
         assert stat_sql == expected
+
+
+@pytest.mark.parametrize(
+    "bar_seconds, session, group_by_exchange, restrict_to_exchanges, gold_filename",
+    [
+        (90, None, False, None, "taq_trade_bar_statistics_sql_90s_F_F.sql"),
+        (5, None, True, ("D", "P"), "taq_trade_bar_statistics_sql_5s_T_T.sql"),
+        (
+            3600,
+            (datetime.time(10, 15), datetime.time(12, 40)),
+            False,
+            None,
+            "taq_trade_bar_statistics_sql_3600s_session_F_F.sql",
+        ),
+    ],
+)
+def test_bucketed_taq_trade_bar_statistics_sql(
+    bar_seconds,
+    session,
+    group_by_exchange,
+    restrict_to_exchanges,
+    gold_filename,
+    request,
+):
+    stat_sql = taq_trade_bar_statistics_sql(
+        ["SPY", "JPM", "LLY"],
+        datetime.date(2024, 2, 29),
+        group_by_exchange=group_by_exchange,
+        restrict_to_exchanges=restrict_to_exchanges,
+        bar_seconds=bar_seconds,
+        session=session,
+    )
+    # Each trade's bar is worked out once, and no longer from its hour and minute
+    assert stat_sql.count("EXTRACT(EPOCH FROM time_m") == 1
+    assert "EXTRACT(HOUR" not in stat_sql
+
+    if request.config.getoption("--update-gold"):
+        write_gold_sql(gold_filename, stat_sql)
+        pytest.skip("Updated gold file")
+    else:
+        expected = read_gold_sql(gold_filename)
+        assert stat_sql == expected
@@ -218,3 +218,6 @@ def test_taq_trade_bar_statistics_sql(
         if "ex" in expected.columns:
             pd.testing.assert_series_equal(bars["ex"], expected["ex"])
         pd.testing.assert_series_equal(bars["window_time"], expected["window_time"])
+        for time_col in ("first_trade_time", "last_trade_time"):
+            if time_col in expected.columns:
+                pd.testing.assert_series_equal(bars[time_col], expected[time_col])
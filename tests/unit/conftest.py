@@ -0,0 +1,34 @@
+import pytest
+import pandas as pd
+import sqlalchemy as sa
+
+# License: GPLv3 or later
+# Copyright 2025 by Brian K. Boonstra
+
+
+class FakeConnection:
+    """Just enough of a wrds Connection, backed by an in-memory SQLite database"""
+
+    def __init__(self):
+        self.engine = sa.create_engine(
+            "sqlite://",
+            isolation_level="AUTOCOMMIT",  # As wrds connections are
+            connect_args={"check_same_thread": False},
+        )
+        self.connection = self.engine.connect()
+        self.connection.exec_driver_sql(
+            "CREATE TABLE ctm_20240229 (sym_root TEXT, time_m_nano INTEGER)"
+        )
+        self.queries = 0
+
+    def raw_sql(self, sql: str, **kwargs) -> pd.DataFrame:
+        self.queries += 1
+        return pd.read_sql_query(sql, self.connection)
+
+    def close(self):
+        self.connection.close()
+
+
+@pytest.fixture
+def fake_connection() -> type[FakeConnection]:
+    return FakeConnection
@@ -0,0 +1,125 @@
+import time
+import asyncio
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import pandas as pd
+
+from taqy import aio
+from taqy.cache import MemoryCache
+from taqy.local import TAQFiles
+from taqy.session import Session
+from taqy.usequity import taq_nbbo_bars_on_date, taq_trade_bars_on_date
+
+DATE = datetime.date(2024, 2, 29)
+TICKERS = ["SPY", "JPM", "LLY"]
+
+# Counts forever, until interrupted
+ENDLESS_SQL = """
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c)
+    SELECT COUNT(*) AS n FROM c
+"""
+
+
+def test_async_bars_match_sync():
+    async def both():
+        return await asyncio.gather(
+            aio.taq_trade_bars_on_date(
+                TICKERS, DATE, bar_minutes=6, include_first_and_last=True
+            ),
+            aio.taq_nbbo_bars_on_date(TICKERS, DATE, bar_minutes=6),
+        )
+
+    trades, nbbo = asyncio.run(both())
+    pd.testing.assert_frame_equal(
+        trades,
+        taq_trade_bars_on_date(
+            TICKERS, DATE, bar_minutes=6, include_first_and_last=True
+        ),
+    )
+    pd.testing.assert_frame_equal(
+        nbbo, taq_nbbo_bars_on_date(TICKERS, DATE, bar_minutes=6)
+    )
+
+
+def test_concurrency_is_limited_by_pool(fake_connection, unmocked):
+    in_flight, most_in_flight = set(), []
+
+    class SlowConnection(fake_connection):
+        def raw_sql(self, sql, **kwargs):
+            in_flight.add(threading.get_ident())
+            most_in_flight.append(len(in_flight))
+            time.sleep(0.02)
+            in_flight.discard(threading.get_ident())
+            return super().raw_sql(sql, **kwargs)
+
+    session = Session(pool_size=2, cache=MemoryCache(), connect=SlowConnection)
+
+    async def many():
+        return await asyncio.gather(
+            *(aio.cached_sql(f"SELECT {i} AS i", wrds_db=session) for i in range(8))
+        )
+
+    results = asyncio.run(many())
+    assert [r.i.iloc[0] for r in results] == list(range(8))
+    assert max(most_in_flight) == 2
+
+
+def test_timeout_cancels_server_query(fake_connection, unmocked):
+    session = Session(connect=fake_connection)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(aio.cached_sql(ENDLESS_SQL, wrds_db=session, timeout=0.1))
+
+    # The connection was freed up for other work, rather than counting forever
+    again = asyncio.run(aio.cached_sql("SELECT 1 AS one", wrds_db=session, timeout=1))
+    assert again.one.iloc[0] == 1
+
+
+def test_timeout_while_waiting_for_a_thread(fake_connection, unmocked):
+    queried = []
+
+    class CountingConnection(fake_connection):
+        def raw_sql(self, sql, **kwargs):
+            queried.append(sql)
+            return super().raw_sql(sql, **kwargs)
+
+    session = Session(connect=CountingConnection)
+    release = threading.Event()
+
+    async def behind_a_busy_executor():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+        busy = loop.run_in_executor(None, release.wait)
+        # Freed in the end regardless, so that waiting for it fails the test, not hangs it
+        threading.Timer(2, release.set).start()
+        started = time.monotonic()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await aio.cached_sql("SELECT 1 AS one", wrds_db=session, timeout=0.05)
+            # Given up on at once, rather than once the executor had a thread free
+            assert time.monotonic() - started < 1
+        finally:
+            release.set()
+            await busy
+        # The thread it finally got ran nothing
+        await loop.run_in_executor(None, lambda: None)
+
+    asyncio.run(behind_a_busy_executor())
+    assert queried == []
+
+
+def test_timeout_of_files(tmp_path, unmocked):
+    class SlowFiles(TAQFiles):
+        def trade_bars(self, *args):
+            time.sleep(0.3)
+            return super().trade_bars(*args)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(
+            aio.taq_trade_bars_on_date(
+                TICKERS, DATE, wrds_db=SlowFiles(str(tmp_path)), timeout=0.05
+            )
+        )
@@ -0,0 +1,76 @@
+import datetime
+
+import pandas as pd
+
+import taqy.usequity as usequity
+from taqy import benchmark, metrics
+
+
+def timings(run: str, seconds: list[float]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "variant": ["trade", "trade", "nbbo"],
+            "tickers": 10,
+            "trades_per_second": 1.0,
+            "phase": ["total", "parse_times", "total"],
+            "seconds": seconds,
+            "run": run,
+            "host": "here",
+        }
+    )
+
+
+def test_find_regressions():
+    history = pd.concat(
+        [
+            timings("2025-01-01T00:00:00", [1.0, 0.001, 2.0]),
+            timings("2025-01-02T00:00:00", [1.2, 0.001, 2.2]),
+            timings("2025-01-03T00:00:00", [1.1, 0.001, 2.1]),
+        ]
+    )
+    # Against the median of the last two runs, 1.15 and 2.15 seconds
+    results = timings("2025-01-04T00:00:00", [1.5, 0.003, 2.2])
+    regressions = benchmark.find_regressions(
+        results, pd.concat([history, results]), window=2
+    )
+    assert regressions["variant"].tolist() == ["trade"]
+    assert regressions["phase"].tolist() == ["total"]
+    assert regressions["baseline"].tolist() == [1.15]
+
+    # Only runs on the same machine count
+    assert benchmark.find_regressions(results.assign(host="there"), history).empty
+
+
+def test_history(tmp_path):
+    path = str(tmp_path / "history.jsonl")
+    assert benchmark.read_history(path).empty
+    first = benchmark.append_history(
+        timings("", [1.0, 0.1, 2.0]).drop(columns="run"), path
+    )
+    benchmark.append_history(timings("", [1.0, 0.1, 2.0]).drop(columns="run"), path)
+    history = benchmark.read_history(path)
+    assert len(history) == 6
+    assert history["run"].iloc[0] == first["run"].iloc[0]
+    assert set(history.columns) >= set(benchmark.KEY_COLUMNS)
+
+
+def test_time_variant_leaves_settings(monkeypatch):
+    monkeypatch.setattr(usequity, "TRANSFER", "copy")
+    usequity.CACHED_QUERIES.put("SELECT 1", pd.DataFrame({"one": [1]}))
+    runs = []
+
+    @metrics.instrumented
+    def variant(tickers, date, db):
+        runs.append((usequity.TRANSFER, len(usequity.CACHED_QUERIES)))
+        usequity.CACHED_QUERIES.put("SELECT 2", pd.DataFrame({"two": [2]}))
+        return pd.DataFrame()
+
+    timings = benchmark.time_variant(
+        benchmark._copied(variant), ["SPY"], datetime.date(2024, 2, 29), None, 2
+    )
+    assert timings["total"] > 0
+    # Each run starts from an empty cache of its own
+    assert runs == [("copy", 0)] * 3
+    assert usequity.TRANSFER == "copy"
+    assert "SELECT 1" in usequity.CACHED_QUERIES
+    assert "SELECT 2" not in usequity.CACHED_QUERIES
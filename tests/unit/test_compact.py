@@ -0,0 +1,135 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import taqy.usequity as usequity
+import taqy.utils as utils
+from taqy.cache import frame_bytes
+from taqy.utils import compact_bars, make_timestamps
+from taqy.usequity import (
+    bar_query_columns,
+    projected_sql,
+    taq_nbbo_bars_on_date,
+    taq_trade_bars_on_date,
+)
+
+TICKERS = ["SPY", "JPM", "LLY"]
+DATE = datetime.date(2024, 2, 29)
+
+
+def test_compact_bars():
+    bars = taq_trade_bars_on_date(TICKERS, DATE, 6, include_first_and_last=True)
+    compact = taq_trade_bars_on_date(
+        TICKERS, DATE, 6, include_first_and_last=True, compact=True
+    )
+    assert frame_bytes(compact) * 2 < frame_bytes(bars)
+    assert compact["ticker"].dtype == "category"
+    assert compact["first_trade_ex"].dtype == "category"
+    assert compact["num_trades"].dtype == np.int32
+    assert compact["vwap"].dtype == np.float64
+    assert compact["median_notional"].dtype == np.float32
+    assert compact["median_size"].dtype == np.float32
+    assert compact["last_trade_time"].dtype == bars["last_trade_time"].dtype
+
+    pd.testing.assert_frame_equal(
+        compact.astype(bars.dtypes.to_dict()), bars, check_exact=False, rtol=1e-6
+    )
+
+    # Missing values are kept, as such
+    gappy = compact_bars(
+        pd.DataFrame({"total_qty": pd.array([1, None], dtype="Int64")})
+    )
+    assert gappy["total_qty"].dtype == "Int32"
+    assert gappy["total_qty"].isna().tolist() == [False, True]
+    big = compact_bars(pd.DataFrame({"total_qty": [2**40]}))
+    assert big["total_qty"].dtype == np.int64
+
+    # Prices of the dearest shares keep their cents
+    dear = compact_bars(pd.DataFrame({"vwap": pd.array([712345.67], dtype="Float64")}))
+    assert dear["vwap"].iloc[0] == 712345.67
+    # Statistics of quantities need fewer digits, bar those of prices
+    quantiles = compact_bars(
+        pd.DataFrame(
+            {
+                column: pd.array([2.5, None], dtype="Float64")
+                for column in ("size_q10", "notional_q10", "price_q10")
+            }
+        )
+    )
+    assert quantiles.dtypes.tolist() == [np.float32, np.float32, np.float64]
+    assert quantiles["size_q10"].isna().tolist() == [False, True]
+
+
+def test_bar_query_columns():
+    assert bar_query_columns(None) is None
+    assert bar_query_columns(
+        ["vwap", "first_trade_time"], include_first_and_last=True
+    ) == [
+        "ticker",
+        "date",
+        "window_time",
+        "vwap",
+        "first_trade_time",
+        "first_trade_time_ns",
+    ]
+    assert bar_query_columns(["best_bid"], nbbo=True, group_by_exchange=True) == [
+        "ticker",
+        "date",
+        "window_time",
+        "ex",
+        "best_bid",
+    ]
+    with pytest.raises(ValueError):
+        bar_query_columns(["first_trade_price"])
+    with pytest.raises(ValueError):
+        bar_query_columns(["first_trade_ex"], True, False, True, True)
+    assert projected_sql("SELECT 1", None) == "SELECT 1"
+
+
+def test_columns(monkeypatch):
+    mocked_sql = usequity.query_sql
+
+    def query_sql(db, sql):
+        """Project the mocked results of the query within, as the server would"""
+        if not sql.startswith("SELECT ticker, date, window_time"):
+            return mocked_sql(db, sql)
+        select, inner = sql.split("\n", 1)
+        columns = select.removeprefix("SELECT ").split(", ")
+        inner = inner.removeprefix("        FROM (").removesuffix("\n        ) AS bars")
+        return mocked_sql(db, inner)[columns]
+
+    monkeypatch.setattr(usequity, "query_sql", query_sql)
+
+    keys = ["ticker", "date", "window_time"]
+    columns = ["vwap", "last_trade_time", "num_trades"]
+    bars = taq_trade_bars_on_date(TICKERS, DATE, 6, include_first_and_last=True)
+    some = taq_trade_bars_on_date(
+        TICKERS, DATE, 6, include_first_and_last=True, columns=columns
+    )
+    pd.testing.assert_frame_equal(some, bars[keys + columns])
+
+    columns = ["time_of_last_quote", "best_ask"]
+    bars = taq_nbbo_bars_on_date(TICKERS, DATE, 6)
+    some = taq_nbbo_bars_on_date(TICKERS, DATE, 6, columns=columns, compact=True)
+    pd.testing.assert_frame_equal(some, compact_bars(bars[keys + columns]))
+
+
+def test_make_timestamps(monkeypatch):
+    bars = pd.DataFrame(
+        {
+            "date": pd.to_datetime([DATE] * 3),
+            "last_trade_time": [datetime.time(9, 30, 0, 5), pd.NaT, datetime.time(16)],
+            "last_trade_time_ns": pd.array([7, None, 0], dtype="Int64"),
+        }
+    )
+    timestamps = make_timestamps(bars, "last_trade_time")
+    assert timestamps.iloc[0] == pd.Timestamp(
+        "2024-02-29 09:30:00.000005007", tz="America/New_York"
+    )
+    assert timestamps.isna().tolist() == [False, True, False]
+
+    # Without pyarrow, times are converted by way of strings, to the same end
+    monkeypatch.setattr(utils, "pa", None)
+    pd.testing.assert_series_equal(make_timestamps(bars, "last_trade_time"), timestamps)
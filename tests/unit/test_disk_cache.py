@@ -0,0 +1,124 @@
+import os
+import time
+import datetime
+
+import pandas as pd
+import pytest
+
+import taqy.usequity as usequity
+from taqy.cache import MemoryCache, ParquetCache
+from taqy.transfer import pandas_to_table
+from taqy.usequity import cached_sql
+
+
+def _frame(n: int = 10) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "ticker": ["SPY"] * n,
+            "date": pd.to_datetime([datetime.date(2024, 2, 29)] * n),
+            "num_trades": range(n),
+            "time_of_last_quote": [datetime.time(9, 30, 0, i) for i in range(n)],
+        }
+    )
+
+
+def test_round_trip_and_stats(tmp_path):
+    cache = ParquetCache(directory=str(tmp_path))
+    assert cache.get("SELECT 1") is None
+    cache.put("SELECT 1", _frame())
+    pd.testing.assert_frame_equal(cache.get("SELECT 1"), _frame())
+    assert "SELECT 1" in cache
+    assert len(cache) == 1
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.writes) == (1, 1, 1)
+    assert cache.stats.hit_rate == 0.5
+
+
+def test_arrow_tables_stay_arrow(tmp_path):
+    pytest.importorskip("pyarrow")
+    table = pandas_to_table(_frame())
+    cache = ParquetCache(directory=str(tmp_path))
+    cache.put("SELECT 1", table)
+    cache.put("SELECT 2", _frame())
+    assert cache.get("SELECT 1").equals(table)
+    pd.testing.assert_frame_equal(cache.get("SELECT 2"), _frame())
+
+    memory = MemoryCache()
+    memory.put("SELECT 1", table)
+    assert memory.get("SELECT 1") is table
+    assert memory.size_bytes == table.nbytes
+
+
+def test_version_invalidates(tmp_path):
+    ParquetCache(directory=str(tmp_path), version="old").put("SELECT 1", _frame())
+    cache = ParquetCache(directory=str(tmp_path), version="new")
+    assert cache.get("SELECT 1") is None
+
+    # Stale entries go before any current one does
+    cache.put("SELECT 2", _frame())
+    cache.evict(cache.size_bytes() - 1)
+    assert cache.stats.invalidations == 1
+    assert cache.stats.evictions == 0
+    assert cache.get("SELECT 2") is not None
+
+
+def test_lru_eviction(tmp_path):
+    cache = ParquetCache(directory=str(tmp_path), max_bytes=None)
+    for i in range(3):
+        cache.put(f"SELECT {i}", _frame())
+        past = time.time() - 100 + i
+        os.utime(cache.path_for(f"SELECT {i}"), (past, past))
+    cache.get("SELECT 0")  # Now the most recently used
+
+    cache.evict(cache.size_bytes() - 1)
+    assert cache.stats.evictions == 1
+    assert "SELECT 1" not in cache
+    assert "SELECT 0" in cache and "SELECT 2" in cache
+
+
+def test_writes_walk_only_over_budget(tmp_path, monkeypatch):
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(os, "walk", lambda *args: walks.append(args) or walk(*args))
+    cache = ParquetCache(directory=str(tmp_path), max_bytes=None)
+    for i in range(5):
+        cache.put(f"SELECT {i}", _frame())
+    cache.put("SELECT 0", _frame(20))
+    assert len(walks) == 1
+    assert len(cache) == 5
+    files = [
+        os.path.join(cache._version_dir, f) for f in os.listdir(cache._version_dir)
+    ]
+    assert cache.size_bytes() == sum(os.path.getsize(f) for f in files)
+
+    # Only a write taking the cache over budget walks it again, to evict
+    cache.max_bytes = cache.size_bytes() + 1
+    cache.put("SELECT 1", _frame())
+    assert len(walks) == 1
+    cache.put("SELECT 5", _frame())
+    assert len(walks) == 2
+    assert cache.stats.evictions == 1
+    assert len(cache) == 5 and cache.size_bytes() <= cache.max_bytes
+
+
+def test_cached_sql_uses_disk(tmp_path, monkeypatch, unmocked):
+    class FakeConnection:
+        calls = 0
+
+        def raw_sql(self, sql, coerce_float, date_cols):
+            FakeConnection.calls += 1
+            df = _frame()
+            df["time_of_last_quote"] = df["time_of_last_quote"].map(
+                lambda t: t.strftime("%H:%M:%S.%f")
+            )
+            return df
+
+    monkeypatch.setattr(usequity, "CACHED_QUERIES", MemoryCache())
+    monkeypatch.setattr(usequity, "DISK_CACHE", ParquetCache(directory=str(tmp_path)))
+    first = cached_sql(FakeConnection(), "SELECT 1")
+
+    # As if from a fresh Python process
+    monkeypatch.setattr(usequity, "CACHED_QUERIES", MemoryCache())
+    second = cached_sql(None, "SELECT 1")
+
+    assert FakeConnection.calls == 1
+    pd.testing.assert_frame_equal(first, second)
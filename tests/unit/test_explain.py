@@ -0,0 +1,105 @@
+import json
+from unittest.mock import Mock
+
+import pytest
+
+from taqy.explain import cte_summary, explain_sql, plan_nodes
+
+
+def node(node_type, time, reads, children=(), cost=10.0, rows=100, **fields):
+    return {
+        "Node Type": node_type,
+        "Total Cost": cost,
+        "Plan Rows": rows,
+        "Actual Rows": rows,
+        "Actual Loops": 1,
+        "Actual Total Time": time,
+        "Shared Hit Blocks": 0,
+        "Shared Read Blocks": reads,
+        "Plans": list(children),
+        **fields,
+    }
+
+
+# Shaped like the plan for first and last trades: a CTE materialized as an InitPlan, run
+# as its scan reads it, alongside an aggregate over the table
+PLAN = {
+    "Plan": node(
+        "Hash Join",
+        100.0,
+        50,
+        [
+            node(
+                "WindowAgg",
+                60.0,
+                30,
+                [
+                    node("Sort", 50.0, 30, [node("Seq Scan", 20.0, 30)]),
+                ],
+                cost=40.0,
+                **{"Parent Relationship": "InitPlan", "Subplan Name": "CTE trades"},
+            ),
+            node(
+                "Subquery Scan",
+                70.0,
+                30,
+                [node("CTE Scan", 65.0, 30, cost=5.0, **{"CTE Name": "trades"})],
+                cost=6.0,
+                Alias="first_trades",
+            ),
+            node("Aggregate", 25.0, 20, [node("Seq Scan", 15.0, 20)], cost=20.0),
+        ],
+        cost=80.0,
+    ),
+    "Planning Time": 1.5,
+    "Execution Time": 101.0,
+}
+
+
+def test_plan_nodes():
+    nodes = plan_nodes(PLAN)
+    assert nodes["node_type"].tolist() == [
+        "Hash Join",
+        "WindowAgg",
+        "Sort",
+        "Seq Scan",
+        "Subquery Scan",
+        "CTE Scan",
+        "Aggregate",
+        "Seq Scan",
+    ]
+    ctes = ["main"] + ["trades"] * 3 + ["first_trades"] * 2 + ["main"] * 2
+    assert nodes["cte"].tolist() == ctes
+    assert nodes["parent"].tolist()[1:] == [0, 1, 2, 0, 4, 0, 6]
+
+    # Work is counted once, the CTE's by the CTE rather than the scan reading it
+    assert nodes["self_time_ms"].tolist() == [5, 10, 30, 20, 5, 5, 10, 15]
+    assert nodes["self_time_ms"].sum() == 100
+    assert nodes["self_shared_read_blocks"].tolist() == [0, 0, 0, 30, 0, 0, 0, 20]
+    assert nodes["self_cost"].tolist() == [14, 30, 0, 10, 1, 5, 10, 10]
+    assert nodes.attrs == {"planning_time_ms": 1.5, "execution_time_ms": 101.0}
+
+
+def test_cte_summary():
+    summary = cte_summary(plan_nodes(PLAN))
+    assert summary.index.tolist() == ["main", "trades", "first_trades"]
+    assert summary["nodes"].tolist() == [3, 3, 2]
+    assert summary["time_ms"].tolist() == [30, 60, 10]
+    assert summary["sort_time_ms"].tolist() == [0, 30, 0]
+    assert summary["window_time_ms"].tolist() == [0, 10, 0]
+    assert summary["shared_read_blocks"].tolist() == [20, 30, 0]
+
+
+@pytest.mark.parametrize(
+    "analyze, options",
+    [(False, "FORMAT JSON"), (True, "ANALYZE, BUFFERS, FORMAT JSON")],
+)
+def test_explain_sql(analyze, options, unmocked):
+    db = Mock()
+    db.connection.closed = False
+    db.connection.exec_driver_sql.return_value.scalar.return_value = json.dumps([PLAN])
+    nodes = explain_sql("SELECT 1", db, analyze=analyze)
+    db.connection.exec_driver_sql.assert_called_once_with(
+        f"EXPLAIN ({options}) SELECT 1"
+    )
+    assert len(nodes) == 8
@@ -0,0 +1,278 @@
+import os
+import datetime
+
+import pandas as pd
+import pytest
+
+import taqy.usequity as usequity
+from taqy.cache import SchemaCache
+from taqy.local import TAQFiles
+from taqy.session import Session
+from taqy.synthetic import LocalConnection, load_synthetic_day, synthetic_day
+from taqy.usequity import (
+    get_wrds_connection,
+    iter_trade_bars,
+    taq_bars_on_date,
+    taq_nbbo_bars_on_date,
+    taq_trade_bars_on_date,
+    taq_trading_dates,
+)
+
+TICKERS = ["SPY", "JPM", "LLY"]
+DATE = datetime.date(2024, 2, 29)
+
+
+def write_parquet_day(directory, date, **kwargs) -> tuple[pd.DataFrame, pd.DataFrame]:
+    ctm, nbbo = synthetic_day(date, 4, **kwargs)
+    ctm.to_parquet(os.path.join(directory, f"ctm_{date:%Y%m%d}.parquet"))
+    nbbo.to_parquet(os.path.join(directory, f"complete_nbbo_{date:%Y%m%d}.parquet"))
+    return ctm, nbbo
+
+
+def test_local_bars_as_from_wrds(tmp_path, monkeypatch):
+    """Bars from files have the columns and types of those from WRDS"""
+    wrds = {
+        "trade": taq_trade_bars_on_date(TICKERS, DATE, 6, include_first_and_last=True),
+        "nbbo": taq_nbbo_bars_on_date(TICKERS, DATE, 6),
+    }
+    monkeypatch.setattr(usequity, "get_wrds_connection", get_wrds_connection)
+    write_parquet_day(tmp_path, DATE, trades_per_second=0.2, quotes_per_second=2.0)
+    files = TAQFiles(str(tmp_path))
+    local = {
+        "trade": taq_trade_bars_on_date(
+            TICKERS, DATE, 6, include_first_and_last=True, wrds_db=files
+        ),
+        "nbbo": taq_nbbo_bars_on_date(TICKERS, DATE, 6, wrds_db=files),
+    }
+    for kind, bars in local.items():
+        pd.testing.assert_series_equal(bars.dtypes, wrds[kind].dtypes, obj=kind)
+        assert set(bars["ticker"]) == set(wrds[kind]["ticker"])
+        assert bars["window_time"].dt.tz == wrds[kind]["window_time"].dt.tz
+
+    combined = taq_bars_on_date(
+        TICKERS, DATE, 6, include_first_and_last=True, wrds_db=files
+    )
+    pd.testing.assert_frame_equal(combined[local["trade"].columns], local["trade"])
+    pd.testing.assert_frame_equal(combined[local["nbbo"].columns], local["nbbo"])
+
+
+def test_local_trade_bars(tmp_path, unmocked):
+    ctm, nbbo = write_parquet_day(
+        tmp_path, DATE, trades_per_second=0.5, same_time_share=0.0
+    )
+    # A trade stamped exactly at the open, which bars of any width leave out
+    at_open = (
+        ctm[ctm["sym_root"] == "SPY"].iloc[[0]].assign(time_m=pd.Timedelta("09:30:00"))
+    )
+    ctm = pd.concat([ctm, at_open], ignore_index=True)
+    ctm.to_parquet(os.path.join(tmp_path, f"ctm_{DATE:%Y%m%d}.parquet"))
+    files = TAQFiles(str(tmp_path))
+    bars = taq_trade_bars_on_date(
+        TICKERS, DATE, 30, include_first_and_last=True, wrds_db=files
+    )
+
+    regular = ctm["time_m"].between(
+        pd.Timedelta("09:30:00"), pd.Timedelta("16:00:00"), inclusive="neither"
+    )
+    trades = ctm[regular & ctm["sym_root"].isin(TICKERS)].assign(
+        notional=lambda df: df["price"] * df["size"]
+    )
+    window_time = (
+        trades["date"] + trades["time_m"].dt.floor("30min") + pd.Timedelta("30min")
+    ).dt.tz_localize("America/New_York")
+    grouped = trades.groupby(["sym_root", window_time])
+    expected = pd.DataFrame(
+        {
+            "num_trades": grouped.size(),
+            "vwap": grouped["notional"].sum() / grouped["size"].sum(),
+            "median_notional": grouped["notional"].median(),
+            "max_size": grouped["size"].max(),
+            "first_trade_price": grouped["price"].first(),
+            "last_trade_price": grouped["price"].last(),
+        }
+    ).reset_index(drop=True)
+    pd.testing.assert_frame_equal(
+        bars[expected.columns], expected, check_dtype=False, check_exact=False
+    )
+
+    spy = taq_trade_bars_on_date("SPY", DATE, 30, wrds_db=files)
+    pd.testing.assert_frame_equal(
+        spy, usequity._sort_bars(bars[bars["ticker"] == "SPY"])[spy.columns]
+    )
+    by_exchange = taq_trade_bars_on_date(
+        TICKERS,
+        DATE,
+        30,
+        group_by_exchange=True,
+        restrict_to_exchanges=("N", "Q"),
+        wrds_db=files,
+    )
+    assert set(by_exchange["ex"]) == {"N", "Q"}
+    assert by_exchange["num_trades"].sum() == trades["ex"].isin(["N", "Q"]).sum()
+
+    seconds = taq_trade_bars_on_date(
+        TICKERS, DATE, bar_seconds=1800, include_first_and_last=True, wrds_db=files
+    )
+    pd.testing.assert_frame_equal(seconds, bars)
+    assert taq_trading_dates(DATE, DATE, wrds_db=files) == [DATE]
+
+    chunks = list(iter_trade_bars(TICKERS, DATE, 30, fetch_size=10, wrds_db=files))
+    assert max(len(chunk) for chunk in chunks) == 10
+    pd.testing.assert_frame_equal(
+        pd.concat(chunks, ignore_index=True),
+        taq_trade_bars_on_date(TICKERS, DATE, 30, wrds_db=files),
+    )
+
+
+def test_raw_files(tmp_path, unmocked):
+    (tmp_path / "EQY_US_ALL_TRADE_20240229").write_text(
+        "Time|Exchange|Symbol|Sale Condition|Trade Volume|Trade Price\n"
+        "093000000000000|N|SPY| |100|500.00\n"
+        "093100123456789|Q|SPY|@|200|501.00\n"
+        "093200000000000|N|SPY PR| |300|25.00\n"
+        "093500000000000|N|SPY| |300|502.00\n"
+        "094000000000000|P|SPY| |100|503.00\n"
+        "093300000000000|N|JPM| |100|180.00\n"
+        "END|20240229|6\n"
+    )
+    (tmp_path / "EQY_US_ALL_NBBO_20240229").write_text(
+        "Time|Exchange|Symbol|Best_Bid_Price|Best_Bid_Size|Best_Offer_Price|Best_Offer_Size\n"
+        "093100000000000|N|SPY|500.00|3|501.00|4\n"
+        "093200000000000|N|SPY|0.00|0|501.00|4\n"
+        "093400000000001|N|SPY|501.00|2|502.00|1\n"
+        "END|20240229|3\n"
+    )
+    files = TAQFiles(str(tmp_path))
+    assert files.list_tables("taqm_2024") == [
+        "complete_nbbo_20240229",
+        "ctm_20240229",
+    ]
+
+    bars = taq_bars_on_date(
+        "SPY", DATE, 5, include_first_and_last=True, how="left", wrds_db=files
+    )
+    assert bars["window_time"].dt.strftime("%H:%M").tolist() == [
+        "09:35",
+        "09:40",
+        "09:45",
+    ]
+    assert bars["num_trades"].tolist() == [1, 1, 1]
+    assert bars["first_trade_time"][0] == pd.Timestamp(
+        "2024-02-29 09:31:00.123456789", tz="America/New_York"
+    )
+    # The last quote of the bar, its size in shares rather than round lots
+    assert (bars["best_bid"][0], bars["best_bidsizeshares"][0]) == (501.0, 200)
+    assert pd.isna(bars["best_bid"][1])
+
+    # Only two-sided quotes count towards midquotes, weighted by the time each stood
+    quotes = taq_nbbo_bars_on_date("SPY", DATE, 5, quote_statistics=True, wrds_db=files)
+    assert quotes.iloc[0][
+        [
+            "num_quotes",
+            "time_weighted_spread",
+            "time_weighted_midquote",
+            "min_midquote",
+            "max_midquote",
+            "first_midquote",
+        ]
+    ].tolist() == [3, 1.0, 501.0, 500.5, 501.5, 500.5]
+
+    # Trades exactly on the hour fall in the previous bar of the session
+    assert taq_trade_bars_on_date("SPY", DATE, 60, wrds_db=files)[
+        "num_trades"
+    ].tolist() == [3]
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TAQY_BENCHMARK_DB_URL"),
+    reason="Needs a PostgreSQL database to fill, at $TAQY_BENCHMARK_DB_URL",
+)
+def test_local_bars_as_from_sql(tmp_path, unmocked):
+    """The very bars of the SQL, from the same synthetic day in files and in a database"""
+    ctm, nbbo = write_parquet_day(
+        tmp_path, DATE, trades_per_second=0.5, same_time_share=0.0
+    )
+    db = LocalConnection(os.environ["TAQY_BENCHMARK_DB_URL"])
+    load_synthetic_day(db, ctm, nbbo)
+    files = TAQFiles(str(tmp_path))
+    try:
+        for kwargs in (
+            {"include_first_and_last": True, "group_by_exchange": True},
+            {"include_first_and_last": True, "bar_seconds": 90},
+            {"quantiles": (0.1234567, 0.5, 1e-7)},
+            {"quote_statistics": True},
+            {"quote_statistics": True, "bar_seconds": 90, "how": "left"},
+        ):
+            pd.testing.assert_frame_equal(
+                taq_bars_on_date(TICKERS, DATE, 5, wrds_db=files, **kwargs),
+                taq_bars_on_date(TICKERS, DATE, 5, wrds_db=db, **kwargs),
+            )
+    finally:
+        db.close()
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TAQY_BENCHMARK_DB_URL"),
+    reason="Needs a PostgreSQL database to fill, at $TAQY_BENCHMARK_DB_URL",
+)
+def test_quote_statistics_of_tied_quotes(tmp_path, unmocked, monkeypatch):
+    """Quotes of the same time take turns by sequence number, however the server stores them"""
+    # Without nanoseconds, unlike the same table as other tests load it
+    monkeypatch.setattr(usequity, "SCHEMA_CACHE", SchemaCache())
+    ctm, nbbo = write_parquet_day(
+        tmp_path, DATE, same_time_share=0.5, nanoseconds=False
+    )
+    db = LocalConnection(os.environ["TAQY_BENCHMARK_DB_URL"])
+    load_synthetic_day(db, ctm, nbbo.iloc[::-1])
+    files = TAQFiles(str(tmp_path))
+    try:
+        for kwargs in ({}, {"bar_seconds": 90}):
+            pd.testing.assert_frame_equal(
+                taq_nbbo_bars_on_date(
+                    TICKERS, DATE, 5, wrds_db=files, quote_statistics=True, **kwargs
+                ),
+                taq_nbbo_bars_on_date(
+                    TICKERS, DATE, 5, wrds_db=db, quote_statistics=True, **kwargs
+                ),
+            )
+    finally:
+        db.close()
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TAQY_BENCHMARK_DB_URL"),
+    reason="Needs a PostgreSQL database to fill, at $TAQY_BENCHMARK_DB_URL",
+)
+def test_query_inside_iter_bars_on_a_session(tmp_path, unmocked, monkeypatch):
+    """A Session serves other queries from the thread reading a stream, or says it can't"""
+    # Have the bar functions look up the table layouts afresh, on the session
+    monkeypatch.setattr(usequity, "SCHEMA_CACHE", SchemaCache())
+    ctm, nbbo = write_parquet_day(tmp_path, DATE)
+    url = os.environ["TAQY_BENCHMARK_DB_URL"]
+    db = LocalConnection(url)
+    load_synthetic_day(db, ctm, nbbo)
+    db.close()
+
+    session = Session(pool_size=2, connect=lambda: LocalConnection(url))
+    try:
+        chunks = []
+        for chunk in iter_trade_bars(TICKERS, DATE, 5, fetch_size=50, wrds_db=session):
+            nbbo_bars = taq_nbbo_bars_on_date(TICKERS, DATE, 5, wrds_db=session)
+            chunks.append(chunk)
+        assert len(chunks) > 1 and len(nbbo_bars)
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks, ignore_index=True),
+            taq_trade_bars_on_date(TICKERS, DATE, 5, wrds_db=session),
+        )
+    finally:
+        session.close()
+
+    monkeypatch.setattr(usequity, "SCHEMA_CACHE", SchemaCache())
+    session = Session(connect=lambda: LocalConnection(url))
+    try:
+        with pytest.raises(ValueError, match="pool_size"):
+            for chunk in iter_trade_bars(TICKERS, DATE, 5, wrds_db=session):
+                taq_nbbo_bars_on_date(TICKERS, DATE, 5, wrds_db=session)
+        assert not session._in_use
+    finally:
+        session.close()
@@ -0,0 +1,115 @@
+import datetime
+import contextlib
+
+import numpy as np
+import pytest
+import pandas as pd
+
+from taqy.cache import MemoryCache, frame_bytes
+from taqy.usequity import taq_nbbo_bars_on_date
+
+
+def _frame(n: int = 100) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "ticker": pd.array(["SPY"] * n, dtype="string"),
+            "num_trades": pd.array(range(n), dtype="Int64"),
+            "vwap": [500.0] * n,
+        }
+    )
+
+
+def test_hits_share_buffers_but_are_read_only():
+    cache = MemoryCache()
+    df = _frame()
+    returned = cache.put("SELECT 1", df)
+    hit = cache["SELECT 1"]
+
+    # Column-level changes only affect the caller's frame
+    hit["vwap"] = 0.0
+    del hit["ticker"]
+    pd.testing.assert_frame_equal(cache["SELECT 1"], _frame())
+
+    for frame in (returned, hit):
+        with pytest.raises(ValueError):
+            frame.iloc[0, frame.columns.get_loc("num_trades")] = -1
+    assert cache.stats.hits == 2
+    assert cache.stats.writes == 1
+
+
+def test_hits_of_every_bar_type_are_read_only():
+    """Read-only, whatever pandas stores the columns of bars in"""
+    n = 4
+    df = pd.DataFrame(
+        {
+            "ticker": pd.array(["SPY"] * n, dtype="string"),
+            "ex": pd.Categorical(["N"] * n),
+            "date": pd.to_datetime(["2024-02-29"] * n),
+            "window_time": pd.date_range(
+                "2024-02-29 09:35", periods=n, tz="US/Eastern"
+            ),
+            "num_trades": pd.array(range(n), dtype="Int64"),
+            "total_qty": np.arange(n, dtype=np.int32),
+            "vwap": pd.array([500.0] * n, dtype="Float64"),
+            "median_size": np.full(n, 100.0, dtype=np.float32),
+            "min_price": np.full(n, 499.0),
+        }
+    )
+    cache = MemoryCache()
+    cache.put("SELECT 1", df.copy())
+    hit = cache["SELECT 1"]
+    for column in df.columns:
+        # Raising, or else writing to a copy of the column for hit alone
+        with contextlib.suppress(Exception):
+            hit.iloc[0, hit.columns.get_loc(column)] = hit[column].iloc[1]
+    pd.testing.assert_frame_equal(cache["SELECT 1"], df)
+
+
+def test_bars_are_writeable_however_many_tickers():
+    date = datetime.date(2024, 2, 29)
+    tickers = ["SPY", "JPM", "LLY"]
+    three = taq_nbbo_bars_on_date(tickers, date, bar_minutes=6)
+    # Served from the cache
+    for some in (tickers, "SPY", "SPY"):
+        bars = taq_nbbo_bars_on_date(some, date, bar_minutes=6)
+        bars.loc[0, "best_bid"] = 1.0
+        bars.loc[0, "num_quotes"] = 0
+    pd.testing.assert_frame_equal(
+        taq_nbbo_bars_on_date(tickers, date, bar_minutes=6), three
+    )
+
+
+def test_hits_can_be_sliced_and_merged():
+    cache = MemoryCache()
+    cache.put("SELECT 1", _frame())
+    hit = cache["SELECT 1"]
+    assert len(hit[hit.num_trades > 49]) == 50
+    assert len(hit.iloc[:10].merge(hit, on="ticker")) == 1000
+
+
+def test_lru_byte_budget():
+    nbytes = frame_bytes(_frame())
+    cache = MemoryCache(max_bytes=2 * nbytes)
+    cache.put("SELECT 1", _frame())
+    cache.put("SELECT 2", _frame())
+    assert cache.get("SELECT 1") is not None  # Now SELECT 2 is least recently used
+    cache.put("SELECT 3", _frame())
+
+    assert "SELECT 2" not in cache
+    assert "SELECT 1" in cache and "SELECT 3" in cache
+    assert cache.size_bytes == 2 * nbytes
+    assert cache.stats.evictions == 1
+    assert cache.get("SELECT 2") is None
+    assert cache.hit_rate == 0.5
+
+
+def test_oversized_results_are_not_cached():
+    cache = MemoryCache(max_bytes=1)
+    df = _frame()
+    assert cache.put("SELECT 1", df) is df
+    assert len(cache) == 0
+
+    cache = MemoryCache()
+    cache["SELECT 1"] = _frame()
+    del cache["SELECT 1"]
+    assert cache.size_bytes == 0
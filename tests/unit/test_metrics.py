@@ -0,0 +1,76 @@
+import datetime
+
+import pytest
+
+from taqy import metrics
+from taqy.usequity import cached_sql
+
+
+@pytest.fixture
+def events(monkeypatch) -> list[metrics.Event]:
+    events = []
+    monkeypatch.setattr(metrics, "HOOKS", [events.append])
+    return events
+
+
+def test_query_phases(fake_connection, unmocked, events):
+    db = fake_connection()
+    sql = "SELECT 'SPY' AS ticker, '09:30:01.250000' AS time_m"
+    cached_sql(db, sql)
+    cached_sql(db, sql)
+    assert [event.name for event in events] == [
+        "cache_miss",
+        "query",
+        "parse_times",
+        "cache_hit",
+    ]
+    query = events[1]
+    assert query.rows == 1 and query.bytes > 0 and query.seconds >= 0
+    assert events[3].labels == {"cache": "memory"}
+
+
+def test_instrumented(events):
+    @metrics.instrumented
+    def bars_on_date(tickers, date, bar_minutes=30, bar_seconds=None):
+        with metrics.measure("query") as event:
+            event.rows = 3
+        metrics.count("cache_hit", 2, cache="disk")
+        return [None] * 5
+
+    bars_on_date(["SPY", "JPM", "SPY"], datetime.date(2024, 2, 29), bar_seconds=90)
+    labels = {
+        "function": "bars_on_date",
+        "tickers": 2,
+        "date": "2024-02-29",
+        "bar_seconds": 90,
+    }
+    query, hits, call = events
+    assert query.labels == labels and query.rows == 3
+    assert hits.labels == {**labels, "cache": "disk"} and hits.count == 2
+    assert call.name == "call" and call.labels == labels and call.rows == 5
+
+    # Labels last only as long as the call
+    with pytest.raises(ValueError):
+        with metrics.measure("query"):
+            raise ValueError()
+    assert events[-1].labels == {"error": "ValueError"}
+
+
+def test_aggregator(events):
+    aggregator = metrics.MetricsAggregator(by=("function",))
+    events.clear()
+    metrics.HOOKS.append(aggregator)
+    for seconds in (1.0, 3.0):
+        metrics.emit(metrics.Event("query", {"function": "f"}, seconds, rows=10))
+    metrics.count("cache_hit", 4)
+
+    summary = aggregator.summary()
+    assert summary.loc[("query", "f"), "events"] == 2
+    assert summary.loc[("query", "f"), "seconds"] == 4.0
+    assert summary.loc[("query", "f"), "mean_seconds"] == 2.0
+    assert summary.loc[("query", "f"), "max_seconds"] == 3.0
+    assert summary.loc[("query", "f"), "rows"] == 20
+    assert summary["count"].sum() == 6
+
+    aggregator.clear()
+    assert aggregator.summary().empty
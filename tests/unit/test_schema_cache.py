@@ -0,0 +1,47 @@
+import datetime
+from unittest.mock import Mock
+
+import pandas as pd
+
+import taqy.usequity as usequity
+from taqy.cache import SchemaCache
+from taqy.usequity import prewarm_schema_cache, taq_nbbo_bars_sql, table_columns
+
+
+def test_persistence(tmp_path):
+    cache = SchemaCache(directory=str(tmp_path))
+    assert cache.get("taqm_2024", "ctm_20240229") is None
+    cache.put("taqm_2024", "ctm_20240229", ["sym_root", "time_m_nano"])
+
+    reloaded = SchemaCache(directory=str(tmp_path))
+    assert reloaded.get("taqm_2024", "ctm_20240229") == {"sym_root", "time_m_nano"}
+    assert reloaded.get("taqm_2023", "ctm_20240229") is None
+
+
+def test_one_lookup_per_table(unmocked, monkeypatch):
+    monkeypatch.setattr(usequity, "SCHEMA_CACHE", SchemaCache())
+    db = Mock()
+    db.connection.closed = False
+    db.describe_table.return_value = pd.DataFrame({"name": ["sym_root"]})
+
+    for _ in range(3):
+        sql = taq_nbbo_bars_sql("SPY", datetime.date(2009, 2, 27), wrds_db=db)
+        assert "0::smallint as time_m_nano" in sql
+    assert db.describe_table.call_count == 1
+
+
+def test_prewarm(unmocked, monkeypatch):
+    monkeypatch.setattr(usequity, "SCHEMA_CACHE", SchemaCache())
+    db = Mock()
+    db.connection.closed = False
+    db.raw_sql.return_value = pd.DataFrame(
+        {
+            "table_name": ["ctm_20240229"] * 2 + ["complete_nbbo_20240229"] * 2,
+            "column_name": ["sym_root", "time_m_nano"] * 2,
+        }
+    )
+
+    assert prewarm_schema_cache(2024, wrds_db=db) == 2
+    assert "time_m_nano" in table_columns(db, "taqm_2024", "complete_nbbo_20240229")
+    assert db.raw_sql.call_count == 1
+    db.describe_table.assert_not_called()
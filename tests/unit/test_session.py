@@ -0,0 +1,84 @@
+import io
+import threading
+import contextlib
+
+import pytest
+import sqlalchemy as sa
+
+import taqy.usequity as usequity
+from taqy.session import Session
+from taqy.usequity import cached_sql
+
+
+def test_reconnects_closed_connections(fake_connection):
+    made = []
+    session = Session(connect=lambda: made.append(fake_connection()) or made[-1])
+    made[0].close()
+    session.raw_sql("SELECT 1 AS one")
+    assert len(made) == 2
+    assert session.pool.discarded == 1
+
+
+def test_retries_dropped_connections(fake_connection):
+    made = []
+
+    def connect():
+        made.append(fake_connection())
+        if len(made) == 1:
+
+            def drop(sql, **kwargs):
+                made[0].close()
+                raise sa.exc.OperationalError(
+                    sql, {}, Exception("gone"), connection_invalidated=True
+                )
+
+            made[0].raw_sql = drop
+        return made[-1]
+
+    session = Session(connect=connect)
+    assert session.raw_sql("SELECT 1 AS one").one.iloc[0] == 1
+    assert len(made) == 2
+
+    # Other errors are not the connection's fault, so are not retried
+    with pytest.raises(sa.exc.OperationalError):
+        session.raw_sql("SELECT * FROM no_such_table")
+    assert len(made) == 2
+
+
+def test_concurrent_queries_get_their_own_connections(fake_connection):
+    made = []
+    session = Session(
+        pool_size=3, connect=lambda: made.append(fake_connection()) or made[-1]
+    )
+    all_in = threading.Barrier(3, timeout=5)
+    in_use = set()
+
+    def query():
+        with session.pool.connection() as db:
+            in_use.add(id(db))
+            all_in.wait()
+
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(in_use) == 3 and len(made) == 3
+
+
+def test_describe_table_is_quiet(fake_connection):
+    session = Session(connect=fake_connection)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        columns = session.describe_table(library="main", table="ctm_20240229")
+    assert list(columns.name) == ["sym_root", "time_m_nano"]
+    assert out.getvalue() == ""
+
+
+def test_session_cache_is_private(fake_connection, unmocked):
+    session = Session(connect=fake_connection)
+    sql = "SELECT 'SPY' AS ticker"
+    cached_sql(session, sql)
+    cached_sql(session, sql)
+    assert session.cache.stats.hits == 1
+    assert sql not in usequity.CACHED_QUERIES
@@ -0,0 +1,162 @@
+import datetime
+
+import pandas as pd
+import pytest
+import sqlalchemy as sa
+
+import taqy.usequity as usequity
+from taqy.splitting import QuerySplitter, too_big
+from taqy.usequity import bar_edges, bar_grid, cached_sql_by_date_and_ticker, span_grid
+
+
+class PostgresError(Exception):
+    def __init__(self, pgcode: str, message: str):
+        super().__init__(message)
+        self.pgcode = pgcode
+
+
+def _error(pgcode: str, message: str) -> sa.exc.OperationalError:
+    return sa.exc.OperationalError("SELECT", {}, PostgresError(pgcode, message))
+
+
+def test_too_big():
+    assert too_big(MemoryError())
+    assert too_big(_error("53200", "out of memory"))
+    assert too_big(_error("57014", "canceling statement due to statement timeout"))
+    # Cancelled by the user, as when an asyncio task is
+    assert not too_big(_error("57014", "canceling statement due to user request"))
+    assert not too_big(_error("42P01", 'relation "ctm_20240230" does not exist'))
+    assert not too_big(ValueError())
+
+
+def test_bar_edges():
+    edges = bar_edges(30, None)
+    assert edges[:2] == [datetime.time(9, 30), datetime.time(10)]
+    assert len(edges) == 14 and edges[-1] == datetime.time(16)
+    assert bar_edges(60, None) == [datetime.time(9, 30), datetime.time(16)]
+    session = (datetime.time(9, 30), datetime.time(10, 45))
+    assert bar_edges(60, bar_grid(60, None, session)) == [
+        datetime.time(9, 30),
+        datetime.time(10, 30),
+        datetime.time(10, 45),
+    ]
+    # Pieces from the open would leave it out, where the whole of a longer session does not
+    early = (datetime.time(9), datetime.time(10))
+    assert bar_edges(30, bar_grid(30, None, early)) == [
+        datetime.time(9),
+        datetime.time(10),
+    ]
+    assert span_grid(5, None, None, None) == (None, None)
+    assert span_grid(5, None, None, session) == (300, session)
+
+
+def _bars(tickers: list[str], span) -> pd.DataFrame:
+    start, end = span or (0, 8)
+    return pd.DataFrame(
+        [(ticker, bar) for ticker in tickers for bar in range(start, end)],
+        columns=["ticker", "bar"],
+    )
+
+
+def test_query_splitter():
+    tickers = ["SPY", "JPM", "LLY"]
+    edges = list(range(9))
+    queries = []
+
+    def ticker_sql(tickers, span=None):
+        return tickers, span
+
+    def query(db, sql):
+        tickers, span = sql
+        queries.append(sql)
+        start, end = span or (0, 8)
+        if len(tickers) > 1 or end - start > 3:
+            raise _error("57014", "canceling statement due to statement timeout")
+        return _bars(tickers, span)
+
+    splitter = QuerySplitter(statement_timeout=None, backoff=0)
+    bars = splitter.query(None, tickers, ticker_sql, edges, "bars", query)
+    pd.testing.assert_frame_equal(bars, _bars(tickers, None))
+    assert queries[:3] == [(tickers, None), (["SPY"], None), (["SPY"], (0, 4))]
+    assert splitter.granularity == {"bars": (1, 2)}
+
+    # Queries of the same shape start out as finely split, others do not
+    queries.clear()
+    bars = splitter.query(None, tickers[:2], ticker_sql, edges, "bars", query)
+    pd.testing.assert_frame_equal(bars, _bars(tickers[:2], None))
+    assert len(queries) == 8
+    queries.clear()
+    splitter.query(
+        None,
+        ["SPY"],
+        ticker_sql,
+        [0, 1],
+        "others",
+        lambda db, sql: queries.append(sql) or _bars(["SPY"], None),
+    )
+    assert queries == [(["SPY"], None)]
+
+    # Errors other than running out of time or memory are not for splitting to fix
+    def broken(db, sql):
+        raise _error("42P01", "relation does not exist")
+
+    with pytest.raises(sa.exc.OperationalError):
+        splitter.query(None, tickers, ticker_sql, edges, "broken", broken)
+
+
+def test_query_splitter_retries():
+    attempts = []
+
+    def flaky(db, sql):
+        attempts.append(sql)
+        if len(attempts) < 3:
+            raise MemoryError()
+        return _bars(["SPY"], None)
+
+    splitter = QuerySplitter(statement_timeout=None, retries=2, backoff=0)
+    bars = splitter.query(None, ["SPY"], lambda t: t, None, "flaky", flaky)
+    assert len(attempts) == 3 and len(bars) == 8
+
+    attempts.clear()
+    splitter.retries = 1
+    with pytest.raises(MemoryError):
+        splitter.query(None, ["SPY"], lambda t: t, None, "flaky", flaky)
+    assert len(attempts) == 2
+
+
+def test_batches_split_by_day(monkeypatch, unmocked):
+    """A batch of days too big for WRDS is split by days, then by tickers"""
+    dates = [datetime.date(2024, 2, day) for day in (27, 28, 29)]
+    queries = []
+
+    def day_sql(tickers, date, span=None):
+        return f"{date}|{','.join(usequity._unique_tickers(tickers))}"
+
+    def query(db, sql):
+        queries.append(sql)
+        if "UNION ALL" in sql or "," in sql:
+            raise _error("57014", "canceling statement due to statement timeout")
+        date, tickers = sql.split("|")
+        return pd.DataFrame(
+            {
+                "ticker": [tickers],
+                "date": pd.to_datetime([date]),
+                "window_time": pd.to_datetime([f"{date} 10:00"]),
+            }
+        )
+
+    monkeypatch.setattr(usequity, "query_sql", query)
+    usequity.set_adaptive_splitting(statement_timeout=None, backoff=0)
+    try:
+        days = cached_sql_by_date_and_ticker(None, ["SPY", "JPM"], dates, day_sql)
+    finally:
+        usequity.disable_adaptive_splitting()
+    assert [day["ticker"].tolist() for day in days] == [["JPM", "SPY"]] * 3
+    assert [day["date"].dt.day.tolist() for day in days] == [
+        [27] * 2,
+        [28] * 2,
+        [29] * 2,
+    ]
+    # The whole batch, then the first day alone and the other two together
+    assert queries[0].count("UNION ALL") == 2
+    assert queries[1] == "2024-02-27|SPY,JPM"
@@ -0,0 +1,183 @@
+import re
+import datetime
+
+import pandas as pd
+import pytest
+
+from taqy.local import TAQFiles
+from taqy.synthetic import synthetic_day
+from taqy.usequity import (
+    MEDIAN_COLUMNS,
+    TRADE_BAR_COLUMNS,
+    bar_query_columns,
+    quantile_columns,
+    taq_nbbo_bars_sql,
+    taq_trade_bars_on_date,
+    taq_trade_bars_sql,
+    trade_statistics,
+)
+
+TICKERS = ["SPY", "JPM", "LLY"]
+DATE = datetime.date(2024, 2, 29)
+
+
+def test_trade_statistics():
+    assert trade_statistics(None) == TRADE_BAR_COLUMNS
+    assert trade_statistics("all") == TRADE_BAR_COLUMNS
+    assert trade_statistics("medians") == MEDIAN_COLUMNS
+    assert not set(trade_statistics("cheap")) & set(MEDIAN_COLUMNS)
+    # In the order of the query, whatever the order asked for
+    assert trade_statistics(["vwap", "num_trades"]) == ("num_trades", "vwap")
+    with pytest.raises(ValueError):
+        trade_statistics(["vwap", "mode_price"])
+    with pytest.raises(ValueError):
+        trade_statistics("some")
+    with pytest.raises(ValueError):
+        bar_query_columns(["median_price"], statistics="cheap")
+
+
+@pytest.mark.parametrize("include_first_and_last", [False, True])
+def test_cheap_sql(include_first_and_last):
+    sql = taq_trade_bars_sql(
+        TICKERS, DATE, 5, include_first_and_last=include_first_and_last
+    )
+    assert "PERCENTILE_CONT" in sql
+    cheap = taq_trade_bars_sql(
+        TICKERS,
+        DATE,
+        5,
+        include_first_and_last=include_first_and_last,
+        statistics="cheap",
+    )
+    assert "PERCENTILE_CONT" not in cheap
+    assert "median_price" not in cheap
+    assert "vwap" in cheap
+    some = taq_trade_bars_sql(
+        TICKERS,
+        DATE,
+        5,
+        include_first_and_last=include_first_and_last,
+        statistics=["median_price"],
+    )
+    assert some.count("PERCENTILE_CONT") == 1
+    assert "vwap" not in some
+
+
+def test_local_statistics(tmp_path, unmocked):
+    ctm, nbbo = synthetic_day(DATE, 4, trades_per_second=0.5, same_time_share=0.0)
+    ctm.to_parquet(tmp_path / f"ctm_{DATE:%Y%m%d}.parquet")
+    nbbo.to_parquet(tmp_path / f"complete_nbbo_{DATE:%Y%m%d}.parquet")
+    files = TAQFiles(str(tmp_path))
+
+    bars = taq_trade_bars_on_date(
+        TICKERS, DATE, 30, include_first_and_last=True, wrds_db=files
+    )
+    for statistics in ("cheap", "medians", ["max_price", "median_size"]):
+        some = taq_trade_bars_on_date(
+            TICKERS,
+            DATE,
+            30,
+            include_first_and_last=True,
+            statistics=statistics,
+            wrds_db=files,
+        )
+        assert set(some.columns) & set(TRADE_BAR_COLUMNS) == set(
+            trade_statistics(statistics)
+        )
+        pd.testing.assert_frame_equal(some, bars[some.columns])
+
+
+def test_quantile_sql():
+    assert quantile_columns(None) == ()
+    assert quantile_columns((0.025, 0.5)) == (
+        "size_q2_5",
+        "size_q50",
+        "price_q2_5",
+        "price_q50",
+        "notional_q2_5",
+        "notional_q50",
+    )
+    with pytest.raises(ValueError):
+        quantile_columns((0.5, 50))
+    with pytest.raises(ValueError, match="more than once"):
+        quantile_columns((0.1, 0.5, 0.1))
+    # Named without rounding, so close quantiles keep columns of their own
+    assert quantile_columns((0.1234567, 0.1234568, 1e-7, 0, 1))[:5] == (
+        "size_q12_34567",
+        "size_q12_34568",
+        "size_q0_00001",
+        "size_q0",
+        "size_q100",
+    )
+    sql = taq_trade_bars_sql(TICKERS, DATE, 5, quantiles=(0.1234567, 0.5))
+    assert "PERCENTILE_CONT(ARRAY[0.1234567, 0.5])" in sql
+
+    quantiles = (0.1, 0.25, 0.5, 0.75, 0.9)
+    for include_first_and_last in (False, True):
+        sql = taq_trade_bars_sql(
+            TICKERS,
+            DATE,
+            5,
+            include_first_and_last=include_first_and_last,
+            statistics="cheap",
+            quantiles=quantiles,
+        )
+        # A single aggregate for each of size, price and notional, however many quantiles
+        aggregates = set(re.findall(r"PERCENTILE_CONT\(.*?\)\)", sql))
+        assert len(aggregates) == 3
+        for column in quantile_columns(quantiles):
+            assert f" AS {column}" in sql
+    assert bar_query_columns(["price_q50"], quantiles=(0.5,))[-1] == "price_q50"
+    with pytest.raises(ValueError):
+        bar_query_columns(["price_q50"], quantiles=(0.25,))
+
+
+def test_local_quantiles(tmp_path, unmocked):
+    ctm, nbbo = synthetic_day(DATE, 4, trades_per_second=0.5, same_time_share=0.0)
+    ctm.to_parquet(tmp_path / f"ctm_{DATE:%Y%m%d}.parquet")
+    nbbo.to_parquet(tmp_path / f"complete_nbbo_{DATE:%Y%m%d}.parquet")
+    files = TAQFiles(str(tmp_path))
+
+    quantiles = (0.1, 0.5, 0.9)
+    bars = taq_trade_bars_on_date(
+        TICKERS,
+        DATE,
+        30,
+        include_first_and_last=True,
+        quantiles=quantiles,
+        wrds_db=files,
+    )
+    pd.testing.assert_series_equal(
+        bars["price_q50"], bars["median_price"], check_names=False
+    )
+    spy = bars[bars["ticker"] == "SPY"].iloc[3]
+    in_bar = ctm["time_m"].between(
+        pd.Timedelta("11:00:00"), pd.Timedelta("11:30:00"), inclusive="neither"
+    )
+    trades = ctm[in_bar & (ctm["sym_root"] == "SPY")]
+    assert spy["window_time"].strftime("%H:%M") == "11:30"
+    for q in quantiles:
+        assert spy[f"size_q{100 * q:g}"] == pytest.approx(trades["size"].quantile(q))
+        assert spy[f"price_q{100 * q:g}"] == pytest.approx(trades["price"].quantile(q))
+    plain = taq_trade_bars_on_date(
+        TICKERS, DATE, 30, include_first_and_last=True, wrds_db=files
+    )
+    pd.testing.assert_frame_equal(bars[plain.columns], plain)
+
+
+def test_quote_statistics_sql():
+    sql = taq_nbbo_bars_sql(TICKERS, DATE, 5)
+    assert "LAG(" not in sql
+    for bar_seconds in (None, 90):
+        sql = taq_nbbo_bars_sql(
+            TICKERS, DATE, 5, bar_seconds=bar_seconds, quote_statistics=True
+        )
+        # Still one scan of the quotes, and one window over them
+        assert sql.count("FROM taqm_2024.complete_nbbo_20240229") == 1
+        assert sql.count("ORDER BY time_m DESC") == 2
+        assert " AS time_weighted_spread" in sql
+    assert bar_query_columns(
+        ["first_midquote"], trades=False, nbbo=True, quote_statistics=True
+    ) == ["ticker", "date", "window_time", "first_midquote"]
+    with pytest.raises(ValueError):
+        bar_query_columns(["first_midquote"], trades=False, nbbo=True)
@@ -0,0 +1,56 @@
+import datetime
+
+import pytest
+
+from taqy.session import Session
+from taqy.usequity import stream_sql
+
+SQL = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 10)
+    SELECT 'T' || (i / 4) AS ticker, '09:30:01.250000' AS time_m, i FROM n
+"""
+
+
+def test_stream_sql(fake_connection):
+    db = fake_connection()
+    chunks = list(stream_sql(db, SQL, fetch_size=4, order_by="i DESC"))
+    assert [chunk.i.tolist() for chunk in chunks] == [
+        [10, 9, 8, 7],
+        [6, 5, 4, 3],
+        [2, 1],
+    ]
+    assert chunks[0].time_m[0] == datetime.time(9, 30, 1, 250000)
+
+    # Stopping early leaves the connection as it was, with nothing cached
+    chunks = stream_sql(db, SQL, fetch_size=4)
+    next(chunks)
+    chunks.close()
+    assert db.connection.get_execution_options()["isolation_level"] == "AUTOCOMMIT"
+    assert not db.connection.in_transaction()
+    assert db.queries == 0
+
+
+def test_stream_sql_holds_a_session_connection(fake_connection):
+    session = Session(pool_size=2, connect=fake_connection)
+    chunks = stream_sql(session, SQL, fetch_size=4)
+    next(chunks)
+    assert len(session._in_use) == 1
+    assert sum(len(chunk) for chunk in chunks) == 6
+    assert not session._in_use
+
+
+def test_query_while_streaming_from_a_session(fake_connection):
+    session = Session(pool_size=2, connect=fake_connection)
+    for chunk in stream_sql(session, SQL, fetch_size=4):
+        assert session.raw_sql("SELECT 1 AS one").one.iloc[0] == 1
+        assert len(session._in_use) == 1
+    assert not session._in_use
+
+    # With the only connection tied up by the stream, a query could never start
+    session = Session(connect=fake_connection)
+    chunks = stream_sql(session, SQL, fetch_size=4)
+    next(chunks)
+    with pytest.raises(ValueError, match="pool_size"):
+        session.raw_sql("SELECT 1 AS one")
+    assert sum(len(chunk) for chunk in chunks) == 6
+    assert not session._in_use
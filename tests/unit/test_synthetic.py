@@ -0,0 +1,58 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from taqy.synthetic import LocalConnection, synthetic_day, synthetic_tickers
+
+
+def test_synthetic_day():
+    date = datetime.date(2024, 2, 29)
+    ctm, nbbo = synthetic_day(date, 4, trades_per_second=0.2, quotes_per_second=2.0)
+    assert synthetic_tickers(4) == ["SPY", "JPM", "LLY", "AAAA"]
+    assert set(ctm["sym_root"]) == set(nbbo["sym_root"]) == set(synthetic_tickers(4))
+    assert (ctm["date"] == pd.Timestamp(date)).all()
+    for table in (ctm, nbbo):
+        assert table["time_m"].is_monotonic_increasing
+        assert table["time_m_nano"].between(0, 999).all()
+        assert table["sym_suffix"].isna().all()
+
+    # Rates are per ticker over regular hours, a few events falling outside them
+    regular = ctm["time_m"].between(pd.Timedelta("09:30:00"), pd.Timedelta("16:00:00"))
+    assert 0.9 < regular.sum() / (4 * 0.2 * 6.5 * 3600) < 1.1
+    assert 0.01 < (~regular).mean() < 0.1
+    assert ctm["sym_root"].value_counts().index[0] == "SPY"
+    assert ctm["time_m"].duplicated().any()
+
+    # Quotes are never crossed, and trades happen within them
+    assert (nbbo["best_ask"] > nbbo["best_bid"]).all()
+    assert ctm["tr_seqnum"].tolist() == list(range(1, len(ctm) + 1))
+    assert set(ctm["ex"]) <= {"D", "Q", "N", "P", "Z", "K", "V", "J", "Y"}
+    spy_quotes = nbbo[nbbo["sym_root"] == "SPY"]
+    spy_trades = ctm[ctm["sym_root"] == "SPY"]
+    assert (
+        spy_trades["price"]
+        .between(spy_quotes["best_bid"].min(), spy_quotes["best_ask"].max())
+        .all()
+    )
+
+    again, _ = synthetic_day(date, 4, trades_per_second=0.2, quotes_per_second=2.0)
+    pd.testing.assert_frame_equal(ctm, again)
+    older, _ = synthetic_day(date, ["IBM"], 0.01, 0.1, nanoseconds=False, seed=1)
+    assert "time_m_nano" not in older and set(older["sym_root"]) == {"IBM"}
+
+
+def test_local_connection():
+    db = LocalConnection("sqlite://")
+    db.connection.exec_driver_sql("CREATE TABLE ctm_20240229 (sym_root TEXT, size INT)")
+    db.connection.exec_driver_sql("INSERT INTO ctm_20240229 VALUES ('SPY', 100)")
+    assert db.list_tables("main") == ["ctm_20240229"]
+    assert db.describe_table("main", "ctm_20240229")["name"].tolist() == [
+        "sym_root",
+        "size",
+    ]
+    df = db.raw_sql("SELECT sym_root, size FROM ctm_20240229")
+    assert df["size"].dtype == pd.Int64Dtype() and df["size"].to_numpy()[0] == np.int64(
+        100
+    )
+    db.close()
@@ -0,0 +1,264 @@
+import os
+import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import pytest
+import sqlalchemy as sa
+
+import taqy.transfer as transfer
+import taqy.usequity as usequity
+from taqy.cache import ParquetCache, SchemaCache
+from taqy.synthetic import LocalConnection, load_synthetic_day, synthetic_day
+from taqy.transfer import arrow_to_pandas, as_output, csv_to_arrow, pandas_to_arrow
+from taqy.usequity import DATE_COLUMNS, TIME_COLUMNS
+
+
+class OutOfMemory(Exception):
+    pgcode = "53200"
+
+
+# As PostgreSQL copies it out, with NULLs unquoted and empty strings quoted
+COPIED = b"""ticker,date,window_time,num_trades,median_size,last_trade_time,last_trade_time_ns,last_trade_ex,size_q2_5
+SPY,2024-02-29,2024-02-29 09:35:00,12,100,09:34:59.123456,789,N,50
+JPM,2024-02-29,2024-02-29 09:35:00,,,,,"",
+"""
+
+
+def test_copied_types():
+    table = csv_to_arrow(COPIED, TIME_COLUMNS, DATE_COLUMNS)
+    bars = arrow_to_pandas(table)
+    assert bars.dtypes.astype(str).to_dict() == {
+        "ticker": "string",
+        "date": "datetime64[ns]",
+        "window_time": "datetime64[ns]",
+        # Whatever the values, as for the same columns from raw_sql()
+        "num_trades": "Int64",
+        "median_size": "Float64",
+        "last_trade_time": "object",
+        "last_trade_time_ns": "Int64",
+        "last_trade_ex": "string",
+        "size_q2_5": "Float64",
+    }
+    assert bars["last_trade_time"].iloc[0] == datetime.time(9, 34, 59, 123456)
+    assert bars["last_trade_time"].iloc[1] is pd.NaT
+    assert bars["last_trade_ex"].tolist() == ["N", ""]
+    assert bars.iloc[1].isna().sum() == 5
+
+    with pytest.raises(ValueError):
+        usequity.set_transfer_method("odbc")
+
+
+def test_arrow_output(tmp_path):
+    tickers = ["SPY", "JPM", "LLY"]
+    date = datetime.date(2024, 2, 29)
+    bars = usequity.taq_trade_bars_on_date(
+        tickers, date, 6, group_by_exchange=True, include_first_and_last=True
+    )
+    table = usequity.taq_trade_bars_on_date(
+        tickers,
+        date,
+        6,
+        group_by_exchange=True,
+        include_first_and_last=True,
+        output="arrow",
+    )
+    assert table.column_names == list(bars.columns)
+    new_york = pa.timestamp("ns", tz="America/New_York")
+    for name in ("window_time", "first_trade_time", "last_trade_time"):
+        assert table.schema.field(name).type == new_york
+    for name in ("ticker", "ex"):
+        assert pa.types.is_dictionary(table.schema.field(name).type)
+    assert table.schema.metadata is None
+    assert table["window_time"].to_pylist() == bars["window_time"].tolist()
+    assert table["vwap"].to_pylist() == bars["vwap"].tolist()
+
+    # Written out and read back as is
+    pq.write_table(table, tmp_path / "bars.parquet")
+    assert pq.read_table(tmp_path / "bars.parquet").equals(table)
+    feather.write_feather(table, tmp_path / "bars.arrow")
+    assert feather.read_table(tmp_path / "bars.arrow").equals(table)
+
+    compact = usequity.taq_nbbo_bars_on_date(
+        tickers, date, 6, compact=True, output="arrow"
+    )
+    assert pa.types.is_dictionary(compact.schema.field("ticker").type)
+    assert compact.schema.field("best_bidsizeshares").type == pa.int32()
+
+    with pytest.raises(ValueError):
+        as_output(bars, "numpy")
+
+
+def test_polars_output():
+    pl = pytest.importorskip("polars")
+    bars = usequity.taq_trade_bars_on_date(
+        ["SPY", "JPM", "LLY"], datetime.date(2024, 2, 29), 6, output="polars"
+    )
+    assert isinstance(bars, pl.DataFrame)
+    assert bars.schema["ticker"] == pl.Categorical
+    assert bars.schema["window_time"] == pl.Datetime("ns", "America/New_York")
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TAQY_BENCHMARK_DB_URL"),
+    reason="Needs a PostgreSQL database to fill, at $TAQY_BENCHMARK_DB_URL",
+)
+def test_copy_as_raw_sql(unmocked):
+    """Results copied in bulk are those fetched row by row"""
+    tickers = ["SPY", "JPM", "LLY"]
+    date = datetime.date(2024, 2, 29)
+    ctm, nbbo = synthetic_day(date, 4, trades_per_second=0.5, same_time_share=0.0)
+    db = LocalConnection(os.environ["TAQY_BENCHMARK_DB_URL"])
+    load_synthetic_day(db, ctm, nbbo)
+    try:
+        for sql in (
+            usequity.taq_trade_bars_sql(
+                tickers,
+                date,
+                5,
+                group_by_exchange=True,
+                include_first_and_last=True,
+                wrds_db=db,
+                quantiles=(0.025, 0.5),
+            ),
+            usequity.taq_bars_sql(
+                tickers,
+                date,
+                5,
+                include_first_and_last=True,
+                how="outer",
+                wrds_db=db,
+                bar_seconds=20,
+                quote_statistics=True,
+            ),
+        ):
+            fetched = usequity.query_sql(db, sql)
+            usequity.set_transfer_method("copy")
+            try:
+                copied = usequity.query_sql(db, sql)
+            finally:
+                usequity.set_transfer_method("raw_sql")
+            pd.testing.assert_frame_equal(copied, fetched)
+
+        usequity.set_transfer_method("copy")
+        with pytest.raises(sa.exc.ProgrammingError):
+            usequity.query_sql(db, "SELECT * FROM taqm_2024.ctm_20240230")
+    finally:
+        usequity.set_transfer_method("raw_sql")
+        db.close()
+
+
+@pytest.mark.skipif(
+    not os.environ.get("TAQY_BENCHMARK_DB_URL"),
+    reason="Needs a PostgreSQL database to fill, at $TAQY_BENCHMARK_DB_URL",
+)
+def test_copied_arrow_output(tmp_path, unmocked, monkeypatch):
+    """Bars copied out for Arrow output never become pandas, yet are those of pandas"""
+    # Without nanoseconds, unlike the same table as other tests load it
+    monkeypatch.setattr(usequity, "SCHEMA_CACHE", SchemaCache())
+    tickers = ["SPY", "JPM", "LLY"]
+    dates = [datetime.date(2024, 2, 29), datetime.date(2024, 3, 1)]
+    db = LocalConnection(os.environ["TAQY_BENCHMARK_DB_URL"])
+    for seed, date in enumerate(dates):
+        ctm, nbbo = synthetic_day(
+            date, 4, trades_per_second=0.5, same_time_share=0.0, seed=seed
+        )
+        load_synthetic_day(db, ctm, nbbo)
+
+    def decoded(table: pa.Table) -> pa.Table:
+        # Categories as pandas has them are sorted, whereas Arrow's come as they appear
+        return pa.table(
+            {
+                name: (
+                    column.cast(column.type.value_type)
+                    if pa.types.is_dictionary(column.type)
+                    else column
+                )
+                for name, column in zip(table.column_names, table.columns)
+            }
+        )
+
+    def no_pandas(table):
+        raise AssertionError("Converted to pandas")
+
+    def bars(output: str) -> list:
+        return [
+            usequity.taq_trade_bars_on_date(
+                tickers,
+                dates[0],
+                5,
+                group_by_exchange=True,
+                include_first_and_last=True,
+                wrds_db=db,
+                output=output,
+            ),
+            usequity.taq_nbbo_bars_on_date(
+                tickers, dates[0], 5, wrds_db=db, quote_statistics=True, output=output
+            ),
+            usequity.taq_bars_on_date(
+                tickers,
+                dates[0],
+                5,
+                include_first_and_last=True,
+                wrds_db=db,
+                columns=["vwap", "last_trade_time", "time_of_last_quote"],
+                compact=True,
+                output=output,
+            ),
+            usequity.taq_trade_bars_between(
+                tickers,
+                *dates,
+                5,
+                include_first_and_last=True,
+                wrds_db=db,
+                batch_days=2,
+                output=output,
+            ),
+        ]
+
+    usequity.set_transfer_method("copy")
+    try:
+        # Fetched as Arrow, then served to pandas from the cache
+        with monkeypatch.context() as m:
+            m.setattr(usequity, "arrow_to_pandas", no_pandas)
+            m.setattr(transfer, "arrow_to_pandas", no_pandas)
+            tables = bars("arrow")
+        for table, df in zip(tables, bars("pandas")):
+            assert decoded(table).equals(decoded(pandas_to_arrow(df)))
+            assert table.schema == pandas_to_arrow(df).schema
+
+        # And the other way round
+        usequity.CACHED_QUERIES.clear()
+        frames = bars("pandas")
+        for table, df in zip(bars("arrow"), frames):
+            assert decoded(table).equals(decoded(pandas_to_arrow(df)))
+
+        # Tables on disk are read back as such
+        usequity.CACHED_QUERIES.clear()
+        monkeypatch.setattr(usequity, "DISK_CACHE", ParquetCache(str(tmp_path)))
+        tables = bars("arrow")
+        usequity.CACHED_QUERIES.clear()
+        for table, df in zip(tables, bars("pandas")):
+            assert decoded(table).equals(decoded(pandas_to_arrow(df)))
+        assert usequity.DISK_CACHE.stats.hits
+
+        # Tables of queries split by ticker are put back together
+        monkeypatch.setattr(usequity, "DISK_CACHE", None)
+        usequity.CACHED_QUERIES.clear()
+        copy_table = usequity._copy_table
+
+        def one_ticker_at_a_time(db, sql):
+            if "sym_root IN" in sql:
+                raise sa.exc.OperationalError(sql, {}, OutOfMemory("out of memory"))
+            return copy_table(db, sql)
+
+        monkeypatch.setattr(usequity, "_copy_table", one_ticker_at_a_time)
+        splitter = usequity.set_adaptive_splitting(statement_timeout=60)
+        assert bars("arrow")[0].equals(tables[0])
+        assert list(splitter.granularity.values())[0][0] == 1
+    finally:
+        usequity.disable_adaptive_splitting()
+        usequity.set_transfer_method("raw_sql")
+        db.close()